@@ -3,23 +3,36 @@ from contextlib import AsyncExitStack, asynccontextmanager
 from secrets import compare_digest
 from typing import AsyncIterator, Callable
 
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.loader as sloader
+import tool.metrics as smetrics
 from fastapi import Depends, FastAPI, HTTPException, Request, Security
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security.api_key import APIKeyHeader
 from loguru import logger
 from starlette.status import HTTP_403_FORBIDDEN
 
-from .routers import ner, public, punctuation
+from .routers import analyze, dictionary, jobs, mt, ner, normalize, public, punctuation
 
 # API key configuration
 API_KEY_NAME = "X-API-Key"
 API_KEY = os.getenv("FASTAPI_KEY")
 if not API_KEY:
     raise RuntimeError("FASTAPI_KEY environment variable must be set")
+# Keys of bulk API callers, comma-separated; their requests queue behind the
+# interactive ones made with FASTAPI_KEY (the website)
+BULK_API_KEYS = [key for key in os.getenv("FASTAPI_BULK_KEYS", "").split(",") if key]
+# Key that may also register model versions and switch the default one; unset
+# disables those routes
+ADMIN_API_KEY = os.getenv("FASTAPI_ADMIN_KEY")
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
 
 # Define public paths
-PUBLIC_PATHS = frozenset({"/public", "/docs", "/redoc", "/openapi.json", "/health"})
+PUBLIC_PATHS = frozenset(
+    {"/public", "/docs", "/redoc", "/openapi.json", "/health", "/metrics"}
+)
 
 
 async def verify_api_key(request: Request, api_key_header: str = Security(api_key_header)) -> str:
@@ -27,9 +40,19 @@ async def verify_api_key(request: Request, api_key_header: str = Security(api_ke
     if any(request.url.path.startswith(path) for path in PUBLIC_PATHS):
         return None
 
-    # For all other paths, verify API key
-    if api_key_header and compare_digest(api_key_header, API_KEY):
-        return api_key_header
+    # For all other paths, verify API key and record the caller's lane
+    if api_key_header:
+        admin = bool(ADMIN_API_KEY) and compare_digest(api_key_header, ADMIN_API_KEY)
+        if admin or compare_digest(api_key_header, API_KEY):
+            priority = sbatcher.PRIORITY_INTERACTIVE
+        elif any(compare_digest(api_key_header, key) for key in BULK_API_KEYS):
+            priority = sbatcher.PRIORITY_BULK
+        else:
+            priority = None
+        if priority is not None:
+            key_id = sadmission.key_id(api_key_header)
+            request.state.client = sadmission.Client(key_id=key_id, priority=priority, admin=admin)
+            return api_key_header
     raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Could not validate API key")
 
 
@@ -58,7 +81,16 @@ app = FastAPI(
     description="API with simple authentication",
     version="1.0.0",
     lifespan=app_lifespan(
-        lifespans=[lifespan_main, public.lifespan_public, punctuation.lifespan_punc, ner.lifespan_ner]
+        lifespans=[
+            lifespan_main,
+            public.lifespan_public,
+            punctuation.lifespan_punc,
+            ner.lifespan_ner,
+            mt.lifespan_mt,
+            dictionary.lifespan_dict,
+            normalize.lifespan_normalize,
+            jobs.lifespan_jobs,
+        ]
     ),
     dependencies=[Depends(verify_api_key)],
 )
@@ -67,9 +99,33 @@ app = FastAPI(
 app.include_router(public.router)
 app.include_router(punctuation.router)
 app.include_router(ner.router)
+app.include_router(mt.router)
+app.include_router(analyze.router)
+app.include_router(dictionary.router)
+app.include_router(normalize.router)
+app.include_router(jobs.router)
 
 
 # Root endpoint (protected)
 @app.get("/")
 async def root():
     return {"message": "Hanja API is running!"}
+
+
+# Prometheus scrape endpoint (public)
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(smetrics.render(), media_type=smetrics.CONTENT_TYPE)
+
+
+# Readiness probe (public): 503 until every non-deferred model has loaded
+@app.get("/health", include_in_schema=False)
+async def health() -> JSONResponse:
+    status = sloader.health(
+        {
+            "punc": punctuation.REGISTRY.loader if punctuation.REGISTRY else None,
+            "ner": ner.REGISTRY.loader if ner.REGISTRY else None,
+            "dict": dictionary.LOADER,
+        }
+    )
+    return JSONResponse(status, status_code=200 if status["status"] == "ok" else 503)
@@ -0,0 +1,206 @@
+from functools import partial
+from typing import AsyncIterator, Dict, List, Tuple
+
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.infer as sinfer
+import tool.metrics as smetrics
+import tool.normalize as snormalize
+import tool.punc as spunc
+import tool.registry as sregistry
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from . import ner, punctuation
+from .ner import NEROutput
+from .punctuation import PunctuationStyle
+
+
+class AnalyzeRequest(BaseModel):
+    texts: List[str]
+    # Strip existing punctuation and spaces first, as /punc/remove-punctuation does
+    remove_punctuation: bool = True
+    style: PunctuationStyle = PunctuationStyle.COMPREHENSIVE
+    # NER fields per text, computed on the punctuated text
+    outputs: List[NEROutput] = [NEROutput.XML, NEROutput.IOB]
+    return_tokens: bool = False
+    # Model versions (see GET /punc/models and /ner/models); the defaults if unset
+    punc_model_version: str | None = None
+    ner_model_version: str | None = None
+
+
+class AnalyzeResult(BaseModel):
+    original: str
+    # Input with punctuation removed, with remove_punctuation
+    cleaned: str | None = None
+    punctuated: str
+    xml: str | None = None
+    iob: str | None = None
+    spans: List[Tuple[int, int, int]] | None = None
+    # Model tokens of the punctuated text, with return_tokens
+    tokens: List[str] | None = None
+    token_ids: List[int] | None = None
+    offsets: List[Tuple[int, int]] | None = None
+
+
+class AnalyzeResponse(BaseModel):
+    results: List[AnalyzeResult]
+    # Entity label table, with spans
+    labels: List[str] | None = None
+
+
+router = APIRouter(prefix="/analyze", tags=["Analysis"])
+
+
+async def _analyze(
+    texts: List[str],
+    request: AnalyzeRequest,
+    priority: int,
+    punc_model: sregistry.ModelVersion,
+    ner_model: sregistry.ModelVersion,
+) -> List[Dict]:
+    """Run one micro-batch through the chain, each stage through its model's cache and batcher."""
+    cleaned = texts
+    if request.remove_punctuation:
+        cleaned = snormalize.remove_punc_batch(texts)
+
+    predictions = await punc_model.cache.get_or_compute(
+        cleaned, partial(punc_model.batcher.submit, priority=priority, bounded=True)
+    )
+    with smetrics.STAGE_SECONDS.time("punc", "align"):
+        rendered = spunc.render_styles(
+            texts=cleaned,
+            predictions=predictions,
+            model_info=punc_model.model_info,
+            styles=[request.style.settings],
+        )
+    punctuated = [text for (text,) in rendered]
+
+    # Both models share one tokenizer, so texts the punctuation model left
+    # unchanged reuse their encodings, and punctuated ones are derived from them
+    encoder = ner_model.model_info["encoder"]
+    if encoder is punc_model.model_info["encoder"]:
+        with smetrics.STAGE_SECONDS.time("ner", "tokenize"):
+            encoder.derive(punctuated, cleaned)
+
+    predictions = await ner_model.cache.get_or_compute(
+        punctuated, partial(ner_model.batcher.submit, priority=priority, bounded=True)
+    )
+    outputs = [output for output in request.outputs if output != NEROutput.ORIGINAL]
+    entities = ner.build_results(
+        punctuated, predictions, ner_model.model_info, outputs, request.return_tokens
+    )
+
+    results = []
+    for original, text, punctuated_text, fields in zip(texts, cleaned, punctuated, entities):
+        result = {"original": original}
+        if request.remove_punctuation:
+            result["cleaned"] = text
+        result["punctuated"] = punctuated_text
+        results.append({**result, **fields})
+    return results
+
+
+async def _start(request: AnalyzeRequest, raw_request: Request) -> Tuple[str, str, int]:
+    """Check the request; return the model versions to use and its priority.
+
+    Admitted before the models are held, so a rejected request never loads one.
+    """
+    priority = sadmission.admit(raw_request, request.texts)
+    punc_version = await punctuation.require_model(request.punc_model_version)
+    ner_version = await ner.require_model(request.ner_model_version)
+    return punc_version, ner_version, priority
+
+
+async def _batches(
+    request: AnalyzeRequest,
+    priority: int,
+    punc_model: sregistry.ModelVersion,
+    ner_model: sregistry.ModelVersion,
+) -> AsyncIterator[List[Dict]]:
+    """Return the results of the request's micro-batches, in order.
+
+    Up to three micro-batches are in flight, so NER runs on one batch while
+    punctuation restoration runs on the next.
+    """
+    async for _, results in sinfer.map_chunks(
+        request.texts,
+        chunk_size=sconfig.BATCH_MAX_SIZE,
+        fn=partial(
+            _analyze,
+            request=request,
+            priority=priority,
+            punc_model=punc_model,
+            ner_model=ner_model,
+        ),
+        prefetch=3,
+    ):
+        yield results
+
+
+def _version_header(punc_version: str, ner_version: str) -> Dict[str, str]:
+    punc_name = sregistry.version_name("punc", punc_version)
+    ner_name = sregistry.version_name("ner", ner_version)
+    return {sregistry.MODEL_VERSION_HEADER: f"{punc_name}, {ner_name}"}
+
+
+@router.post("")
+async def analyze(request: AnalyzeRequest, raw_request: Request) -> AnalyzeResponse:
+    """Remove punctuation, restore it and tag named entities in one call.
+
+    Equivalent to /punc/remove-punctuation, /punc/predict and /ner/predict
+    in a row, run in-process. Responds with JSON, or MessagePack if the
+    Accept header prefers it. The X-Model-Version header names both model
+    versions used, e.g. "punc@base, ner@base".
+    """
+    punc_version, ner_version, priority = await _start(request, raw_request)
+    async with (
+        punctuation.use_model(punc_version) as punc_model,
+        ner.use_model(ner_version) as ner_model,
+    ):
+        try:
+            batches = _batches(request, priority, punc_model, ner_model)
+            results = [result async for batch in batches for result in batch]
+        except sbatcher.QueueFull as e:
+            raise sadmission.queue_full(e) from e
+        except Exception as e:
+            logger.error(f"Error analyzing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error analyzing text") from e
+
+        response = {"results": results}
+        if NEROutput.SPANS in request.outputs:
+            response["labels"] = ner_model.model_info["entity_labels"]
+    headers = _version_header(punc_version, ner_version)
+    return sencoding.respond(raw_request, response, headers=headers)
+
+
+@router.post("/stream")
+async def analyze_stream(request: AnalyzeRequest, raw_request: Request) -> StreamingResponse:
+    """Analyze texts as /analyze does, streaming one NDJSON result per line."""
+    punc_version, ner_version, priority = await _start(request, raw_request)
+
+    async def _lines() -> AsyncIterator[bytes]:
+        try:
+            async with (
+                punctuation.use_model(punc_version) as punc_model,
+                ner.use_model(ner_version) as ner_model,
+            ):
+                async for batch in _batches(request, priority, punc_model, ner_model):
+                    for result in batch:
+                        yield sencoding.encode_line(result)
+        except sbatcher.QueueFull as e:
+            smetrics.ADMISSION_REJECTED.inc(e.lane, "queue")
+            yield sencoding.encode_line({"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error analyzing text: {str(e)}")
+            yield sencoding.encode_line({"error": "Error analyzing text"})
+
+    return StreamingResponse(
+        _lines(),
+        media_type="application/x-ndjson",
+        headers=_version_header(punc_version, ner_version),
+    )
@@ -0,0 +1,111 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Dict, List, Tuple
+
+import tool.admission as sadmission
+import tool.cedict as scedict
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.loader as sloader
+import tool.metrics as smetrics
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from loguru import logger
+from pydantic import BaseModel
+
+# Global variables to store the dictionary index
+DICTIONARY: scedict.Dictionary | None = None
+LOADER: sloader.ModelLoader | None = None
+
+
+# Models for request/response
+class LookupRequest(BaseModel):
+    texts: List[str]
+    # Also segment each text into its longest dictionary words
+    words: bool = True
+
+
+class DictEntry(BaseModel):
+    traditional: str
+    simplified: str
+    pinyin: str
+    definitions: List[str]
+
+
+class LookupResult(BaseModel):
+    # Entries of every word in `words` and every character found, by headword
+    entries: Dict[str, List[DictEntry]]
+    # (start, end) of the longest-match words, end exclusive, with words
+    words: List[Tuple[int, int]] | None = None
+
+
+class LookupResponse(BaseModel):
+    results: List[LookupResult]
+
+
+def _on_dict_ready(dictionary: scedict.Dictionary) -> None:
+    global DICTIONARY
+    DICTIONARY = dictionary
+
+
+@asynccontextmanager
+async def lifespan_dict(app: FastAPI) -> AsyncIterator[None]:
+    logger.debug("Starting dictionary loader...")
+    global DICTIONARY, LOADER
+    try:
+        # Download dictionary if not exists
+        if 0:
+            scedict.download_dict(scedict.DICT_PATH)
+        # The index is built on the first start and memory-mapped afterwards
+        LOADER = sloader.ModelLoader(
+            name="dict",
+            load=partial(scedict.load_dict, scedict.DICT_PATH),
+            on_ready=_on_dict_ready,
+            lazy="dict" in sconfig.LAZY_MODELS,
+        )
+        LOADER.start()
+        yield
+    finally:
+        # Cleanup
+        if LOADER:
+            await LOADER.stop()
+        LOADER = None
+        DICTIONARY = None
+        logger.debug("Dictionary unloaded")
+
+
+async def require_dict() -> None:
+    """Wait for the dictionary (loading it now if deferred); 503 if it cannot load."""
+    if not LOADER:
+        raise HTTPException(status_code=503, detail="Dictionary not loaded")
+    try:
+        await LOADER.get()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail="Dictionary not loaded") from e
+
+
+def _lookup(texts: List[str], words: bool) -> List[Dict]:
+    with smetrics.STAGE_SECONDS.time("dict", "lookup"):
+        return [DICTIONARY.lookup(text, words=words) for text in texts]
+
+
+router = APIRouter(prefix="/dict", tags=["Dictionary"])
+
+
+@router.post("/lookup")
+async def lookup(request: LookupRequest, raw_request: Request) -> LookupResponse:
+    """Look up the words and characters of texts in the local dictionary.
+
+    Responds with JSON, or MessagePack if the Accept header prefers it.
+    """
+    await require_dict()
+    sadmission.admit(raw_request, request.texts)
+
+    try:
+        # Off the event loop, as a long batch takes a few milliseconds
+        results = await asyncio.to_thread(_lookup, request.texts, request.words)
+        with smetrics.STAGE_SECONDS.time("dict", "serialize"):
+            return sencoding.respond(raw_request, {"results": results})
+    except Exception as e:
+        logger.error(f"Error looking up text: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error looking up text") from e
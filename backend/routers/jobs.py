@@ -0,0 +1,143 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Literal
+
+import tool.config as sconfig
+import tool.jobs as sjobs
+from fastapi import APIRouter, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from . import ner, punctuation
+
+STORE: sjobs.JobStore | None = None
+RUNNER: sjobs.JobRunner | None = None
+
+
+class JobStatus(BaseModel):
+    id: str
+    task: Literal["punc", "ner"]
+    options: Dict
+    status: Literal["queued", "running", "done", "failed"]
+    total: int
+    done: int
+    created_at: float
+    finished_at: float | None
+    throughput: float | None  # texts per second
+    eta: float | None  # seconds
+    error: str | None
+
+
+@asynccontextmanager
+async def lifespan_jobs(app: FastAPI) -> AsyncIterator[None]:
+    logger.debug("Starting job runner...")
+    global STORE, RUNNER
+    try:
+        STORE = sjobs.JobStore(sconfig.JOBS_DIR)
+        RUNNER = sjobs.JobRunner(
+            store=STORE,
+            processors={"punc": punctuation.process_bulk, "ner": ner.process_bulk},
+            chunk_size=sconfig.JOB_CHUNK_SIZE,
+        )
+        RUNNER.start()
+        logger.debug("Job runner started")
+        yield
+    finally:
+        # Cleanup; unfinished jobs resume from their checkpoint on next start
+        if RUNNER:
+            await RUNNER.stop()
+        RUNNER = None
+        STORE = None
+        logger.debug("Job runner stopped")
+
+
+router = APIRouter(prefix="/jobs", tags=["Bulk Jobs"])
+
+
+def _store() -> sjobs.JobStore:
+    if not STORE:
+        raise HTTPException(status_code=503, detail="Job runner not started")
+    return STORE
+
+
+def _read_texts(file: UploadFile) -> Iterator[str]:
+    # Stream the upload line by line: JSONL lines are either a string or an
+    # object with a "text" field, any other file is read as plain text lines
+    is_jsonl = (file.filename or "").endswith((".jsonl", ".ndjson"))
+    file.file.seek(0)
+    for raw in file.file:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not is_jsonl:
+            yield line
+        elif line.strip():
+            item = json.loads(line)
+            yield item if isinstance(item, str) else item["text"]
+
+
+@router.post("")
+async def create_job(
+    file: UploadFile = File(...),
+    task: Literal["punc", "ner"] = Form(...),
+    style: punctuation.PunctuationStyle = Form(punctuation.PunctuationStyle.COMPREHENSIVE),
+    outputs: List[ner.NEROutput] = Form(ner.DEFAULT_OUTPUTS),
+    model_version: str | None = Form(None),
+) -> JobStatus:
+    """Submit a JSONL or TXT file for bulk punctuation restoration or NER.
+
+    `style` applies to punctuation jobs and `outputs` to NER jobs, as in
+    /punc/predict and /ner/predict.
+
+    A job runs on the default model version of each chunk unless pinned to
+    `model_version`, which must be registered when the job is submitted.
+    """
+    registry = (punctuation if task == "punc" else ner).REGISTRY
+    if not STORE or not RUNNER or not registry:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if task == "punc":
+        options = {"style": style.value}
+    else:
+        options = {"outputs": [output.value for output in outputs]}
+    if model_version:
+        if model_version not in registry.versions:
+            raise HTTPException(status_code=404, detail=f"Unknown model version: {model_version}")
+        options["model_version"] = model_version
+    try:
+        meta = await asyncio.to_thread(STORE.create, task, options, _read_texts(file))
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input file: {str(e)}") from e
+
+    RUNNER.enqueue(meta["id"])
+    return JobStatus(**meta)
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str) -> JobStatus:
+    """Get progress of a bulk job."""
+    meta = _store().get(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**meta)
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str) -> FileResponse:
+    """Download the JSONL results of a bulk job (partial while it is running)."""
+    meta = _store().get(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FileResponse(
+        STORE.output_path(job_id),
+        media_type="application/x-ndjson",
+        filename=f"{job_id}.jsonl",
+    )
+
+
+@router.delete("/{job_id}")
+async def delete_job(job_id: str) -> Dict[str, str]:
+    """Cancel a bulk job and delete its files."""
+    if not _store().get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    STORE.delete(job_id)
+    return {"id": job_id, "status": "deleted"}
@@ -0,0 +1,134 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict
+
+import tool.admission as sadmission
+import tool.registry as sregistry
+from fastapi import APIRouter, Depends, HTTPException
+from loguru import logger
+from pydantic import BaseModel
+
+
+class CacheStatsResponse(BaseModel):
+    hits: int
+    disk_hits: int
+    misses: int
+    coalesced: int
+    entries: int
+    max_entries: int
+
+
+class ModelVersionStatus(BaseModel):
+    path: str
+    state: str
+    in_flight: int
+    size_mb: float
+    error: str | None = None
+
+
+class ModelsResponse(BaseModel):
+    default: str
+    versions: Dict[str, ModelVersionStatus]
+
+
+class RegisterModelRequest(BaseModel):
+    # Model directory, under the server's model directory
+    path: str
+
+
+class SetDefaultModelRequest(BaseModel):
+    version: str
+
+
+@asynccontextmanager
+async def use_model(
+    registry: sregistry.ModelRegistry | None, version: str | None = None
+) -> AsyncIterator[sregistry.ModelVersion]:
+    """Hold a model version (the default if None) for a request, loading it if needed.
+
+    404 for an unknown version, 503 if it cannot load.
+    """
+    if not registry:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    try:
+        model = await registry.acquire(version)
+    except sregistry.UnknownVersion as e:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}") from e
+    except Exception as e:
+        raise HTTPException(status_code=503, detail="Model not loaded") from e
+    try:
+        yield model
+    finally:
+        registry.release(model)
+
+
+async def require_model(registry: sregistry.ModelRegistry | None, version: str | None = None) -> str:
+    """Wait for a model version (loading it now if deferred) and return its name.
+
+    404 or 503 as `use_model`. Streaming endpoints check the version here,
+    then hold it with `use_model` while the stream runs.
+    """
+    async with use_model(registry, version) as model:
+        return model.version
+
+
+def create_router(get_registry: Callable[[], sregistry.ModelRegistry | None]) -> APIRouter:
+    """Routes to list and manage a task's model versions and show its cache.
+
+    Registering a version and switching the default need the admin key.
+    """
+    router = APIRouter()
+
+    def _registry() -> sregistry.ModelRegistry:
+        registry = get_registry()
+        if not registry:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        return registry
+
+    @router.get("/cache")
+    async def get_cache_stats() -> CacheStatsResponse:
+        """Get hit and miss counters of the result cache of the default model version."""
+        registry = get_registry()
+        cache = registry.current.cache if registry else None
+        if not cache:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        return CacheStatsResponse(**cache.stats())
+
+    @router.get("/models")
+    async def get_models() -> ModelsResponse:
+        """List the model versions, their state and the default one."""
+        return _registry().status()
+
+    @router.put("/models/{version}", dependencies=[Depends(sadmission.require_admin)])
+    async def register_model(version: str, request: RegisterModelRequest) -> ModelsResponse:
+        """Register a model version, loaded on its first request."""
+        registry = _registry()
+        try:
+            path = sregistry.model_path(request.path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        try:
+            registry.register(version, path)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e)) from e
+        return registry.status()
+
+    @router.post("/models/default", dependencies=[Depends(sadmission.require_admin)])
+    async def set_default_model(request: SetDefaultModelRequest) -> ModelsResponse:
+        """Switch the default model version without downtime.
+
+        The new version is loaded first; requests already running finish on
+        the old one, which is then unloaded.
+        """
+        registry = _registry()
+        try:
+            await registry.set_default(request.version)
+        except sregistry.UnknownVersion as e:
+            raise HTTPException(
+                status_code=404, detail=f"Unknown model version: {request.version}"
+            ) from e
+        except Exception as e:
+            logger.error(f"Error loading model version {request.version}: {str(e)}")
+            raise HTTPException(status_code=503, detail="Model not loaded") from e
+        return registry.status()
+
+    return router
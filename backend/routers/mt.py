@@ -0,0 +1,252 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, List
+
+import httpx
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.cache as scache
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.metrics as smetrics
+import tool.mt as smt
+import tool.punc as spunc
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from . import punctuation
+
+# Global variables to store the translation client and its cache
+CLIENT: smt.MTClient | None = None
+CACHE: scache.ResultCache | None = None
+
+
+class MTRequest(BaseModel):
+    text: str
+    source_lang: str = "Hanja"
+    target_lang: str = "Korean"
+
+
+class MTSegment(BaseModel):
+    source: str
+    translation: str
+
+
+class MTResponse(BaseModel):
+    translation: str
+    segments: List[MTSegment]
+
+
+@asynccontextmanager
+async def lifespan_mt(app: FastAPI) -> AsyncIterator[None]:
+    logger.debug("Starting translation client...")
+    global CLIENT, CACHE
+    try:
+        CLIENT = smt.MTClient()
+        CACHE = scache.ResultCache(
+            namespace=f"{sconfig.MT_MODEL}|mt",
+            max_entries=sconfig.CACHE_MAX_ENTRIES,
+            db_path=sconfig.CACHE_DB,
+        )
+        smetrics.register_cache("mt", CACHE)
+        yield
+    finally:
+        # Cleanup
+        smetrics.register_cache("mt", None)
+        if CACHE:
+            await asyncio.to_thread(CACHE.close)
+        CACHE = None
+        if CLIENT:
+            await CLIENT.close()
+        CLIENT = None
+        logger.debug("Translation client closed")
+
+
+router = APIRouter(prefix="/mt", tags=["Machine Translation"])
+
+
+async def _model_sentence_ends(texts: List[str], priority: int) -> List[List[int]] | None:
+    """Sentence ends predicted by the punctuation model, or None if it is unavailable."""
+    if not punctuation.REGISTRY:
+        return None
+    try:
+        model = await punctuation.REGISTRY.acquire()
+    except Exception:
+        return None
+    try:
+        compute = partial(model.batcher.submit, priority=priority, bounded=True)
+        predictions = await model.cache.get_or_compute(texts, compute)
+        return spunc.sentence_ends(texts, predictions, model.model_info)
+    finally:
+        punctuation.REGISTRY.release(model)
+
+
+async def _segment(text: str, priority: int) -> List[str]:
+    """Split a passage into sentences to translate separately.
+
+    Punctuated text is split at its sentence-final marks and line breaks.
+    Lines without any punctuation are split where the punctuation model
+    would end a sentence. Whatever is still too long is cut by length.
+    """
+    segments = smt.split_sentences(text)
+    todo = [i for i, s in enumerate(segments) if s.strip() and not smt.has_punctuation(s)]
+    if todo:
+        bodies = [segments[i].rstrip() for i in todo]
+        ends = await _model_sentence_ends(bodies, priority)
+        if ends is not None:
+            split = {
+                i: smt.split_at(segments[i], [end for end in e if end < len(body)])
+                for i, body, e in zip(todo, bodies, ends)
+            }
+            segments = [part for i, s in enumerate(segments) for part in split.get(i, [s])]
+    return [
+        part
+        for segment in segments
+        for part in smt.split_long(segment, sconfig.MT_MAX_SEGMENT_LENGTH)
+    ]
+
+
+async def _translate_keys(keys: List[str]) -> List[str]:
+    # Cache keys are "source_lang\0target_lang\0text"
+    async def _one(key: str) -> str:
+        source_lang, target_lang, text = key.split("\0", 2)
+        with smetrics.STAGE_SECONDS.time("mt", "translate"):
+            return await CLIENT.translate(text, source_lang, target_lang)
+
+    return list(await asyncio.gather(*(_one(key) for key in keys)))
+
+
+async def _translate(segment: str, request: MTRequest) -> str:
+    text = segment.strip()
+    if not text:
+        return ""
+    key = f"{request.source_lang}\0{request.target_lang}\0{text}"
+    (translation,) = await CACHE.get_or_compute([key], _translate_keys)
+    return translation
+
+
+async def _translate_into(segment: str, request: MTRequest, sink: asyncio.Queue) -> None:
+    """Translate a sentence, putting its text on `sink` as it is generated, then None.
+
+    A cached translation, or one that another request is already computing,
+    is put on `sink` whole.
+    """
+    streamed = False
+
+    async def _stream_keys(keys: List[str]) -> List[str]:
+        nonlocal streamed
+        streamed = True
+        (key,) = keys
+        source_lang, target_lang, text = key.split("\0", 2)
+        pieces = []
+        with smetrics.STAGE_SECONDS.time("mt", "translate"):
+            async for piece in CLIENT.translate_stream(text, source_lang, target_lang):
+                pieces.append(piece)
+                sink.put_nowait(piece)
+        return ["".join(pieces)]
+
+    try:
+        text = segment.strip()
+        if text:
+            key = f"{request.source_lang}\0{request.target_lang}\0{text}"
+            (translation,) = await CACHE.get_or_compute([key], _stream_keys)
+            if not streamed and translation:
+                sink.put_nowait(translation)
+    finally:
+        sink.put_nowait(None)
+
+
+async def _start(request: MTRequest, raw_request: Request) -> List[str]:
+    """Check the request and split the passage into the sentences to translate."""
+    if not CLIENT:
+        raise HTTPException(status_code=503, detail="Translation client not started")
+    priority = sadmission.admit(raw_request, [request.text])
+    try:
+        with smetrics.STAGE_SECONDS.time("mt", "segment"):
+            segments = await _segment(request.text, priority)
+    except sbatcher.QueueFull as e:
+        raise sadmission.queue_full(e) from e
+    except Exception as e:
+        logger.error(f"Error segmenting text: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error segmenting text") from e
+    return segments
+
+
+@router.post("/translate")
+async def translate(request: MTRequest, raw_request: Request) -> MTResponse:
+    """Translate a passage sentence by sentence.
+
+    Responds with JSON, or MessagePack if the Accept header prefers it.
+    """
+    segments = await _start(request, raw_request)
+    # Fanned out together so vLLM batches them
+    tasks = [asyncio.ensure_future(_translate(segment, request)) for segment in segments]
+    try:
+        translations = await asyncio.gather(*tasks)
+    except httpx.HTTPError as e:
+        logger.error(f"Error translating text: {str(e)}")
+        raise HTTPException(status_code=502, detail="Translation service error") from e
+    except Exception as e:
+        logger.error(f"Error translating text: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error translating text") from e
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    pieces = []
+    for segment, translation in zip(segments, translations):
+        if translation:
+            pieces += [translation, smt.separator(segment)]
+    result = {
+        "translation": "".join(pieces[:-1]),
+        "segments": [
+            {"source": segment, "translation": translation}
+            for segment, translation in zip(segments, translations)
+        ],
+    }
+    return sencoding.respond(raw_request, result)
+
+
+@router.post("/translate/stream")
+async def translate_stream(request: MTRequest, raw_request: Request) -> StreamingResponse:
+    """Translate a passage, streaming the translation as plain text.
+
+    All sentences are translated concurrently. The text arrives in order:
+    the sentence being sent streams token by token as the model generates
+    it, and the ones after it follow with whatever they have generated so
+    far. If translation fails, the response is aborted rather than ended,
+    so a cut-short translation never looks complete.
+    """
+    segments = await _start(request, raw_request)
+    sinks = [asyncio.Queue() for _ in segments]
+    # Fanned out together so vLLM batches them
+    tasks = [
+        asyncio.ensure_future(_translate_into(segment, request, sink))
+        for segment, sink in zip(segments, sinks)
+    ]
+
+    async def _chunks() -> AsyncIterator[bytes]:
+        try:
+            previous = None
+            for segment, sink, task in zip(segments, sinks, tasks):
+                started = False
+                while (piece := await sink.get()) is not None:
+                    if not started and previous is not None:
+                        yield smt.separator(previous).encode("utf-8")
+                    started = True
+                    yield piece.encode("utf-8")
+                # Raises if the sentence failed
+                await task
+                if started:
+                    previous = segment
+        except Exception as e:
+            logger.error(f"Error translating text: {str(e)}")
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(_chunks(), media_type="text/plain; charset=utf-8")
@@ -1,29 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import AsyncIterator, List
-
+from enum import Enum
+from functools import partial
+from typing import AsyncContextManager, AsyncIterator, Dict, List, Tuple
+
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.incremental as sincremental
+import tool.infer as sinfer
+import tool.loader as sloader
+import tool.metrics as smetrics
 import tool.ner as sner
-from fastapi import APIRouter, FastAPI, HTTPException
+import tool.normalize as snormalize
+import tool.registry as sregistry
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from loguru import logger
 from pydantic import BaseModel
 from transformers import BertTokenizerFast
 
-# Global variables to store model and tokenizer
-MODEL_INFO = None
+from . import models
+
+# Global variables to store the model versions
+EXECUTOR: ThreadPoolExecutor | None = None
+REGISTRY: sregistry.ModelRegistry | None = None
+DOCUMENTS: sincremental.DocumentStore | None = None
+
+
+class NEROutput(str, Enum):
+    ORIGINAL = "original"
+    XML = "xml"
+    IOB = "iob"
+    SPANS = "spans"
+
+
+DEFAULT_OUTPUTS = [NEROutput.ORIGINAL, NEROutput.XML, NEROutput.IOB]
 
 
 # Models for request/response
 class NERRequest(BaseModel):
     texts: List[str]
+    # Fields to return per text; ["spans"] is the compact form for long texts
+    outputs: List[NEROutput] = DEFAULT_OUTPUTS
+    return_tokens: bool = False
+    # Normalize the texts first, as POST /normalize does
+    normalize: bool = False
+    # Model version (see GET /ner/models); the default one if unset
+    model_version: str | None = None
 
 
 class NERResult(BaseModel):
-    original: str
-    xml: str
-    iob: str
+    original: str | None = None
+    xml: str | None = None
+    iob: str | None = None
+    # (start, end, entity label id), end exclusive; ids index the label table
+    # (NERResponse.labels, same order as GET /ner/labels)
+    spans: List[Tuple[int, int, int]] | None = None
+    # Model tokens of the original text, with return_tokens
+    tokens: List[str] | None = None
+    token_ids: List[int] | None = None
+    offsets: List[Tuple[int, int]] | None = None
 
 
 class NERResponse(BaseModel):
     results: List[NERResult]
+    # Entity label table, with spans
+    labels: List[str] | None = None
 
 
 class NERLabelsResponse(BaseModel):
@@ -40,111 +84,362 @@ class TokenizeResponse(BaseModel):
     text: str
     tokens: List[str]
     token_ids: List[int]
+    offsets: List[Tuple[int, int]]
+
+
+class TokenizeBatchRequest(BaseModel):
+    texts: List[str]
+    add_special_tokens: bool = True
+
+
+class TokenizeBatchResponse(BaseModel):
+    results: List[TokenizeResponse]
+
+
+class NERIncrementalRequest(BaseModel):
+    # Chosen by the client; requests with the same id re-infer only what changed
+    document_id: str
+    text: str
+    outputs: List[NEROutput] = DEFAULT_OUTPUTS
+    return_tokens: bool = False
+    segment: sincremental.SegmentMode = sincremental.SegmentMode.LINE
+    # Return the changed segments since `revision` instead of the merged result
+    delta: bool = False
+    revision: int | None = None
+    model_version: str | None = None
+
+
+class NERSegmentChange(BaseModel):
+    # Segments [start, start + delete) of the base revision are replaced by `insert`
+    start: int
+    delete: int
+    insert: List[NERResult]
+
+
+class NERIncrementalResponse(BaseModel):
+    document_id: str
+    revision: int
+    # Revision the changes apply to; None if they apply to no segments
+    base_revision: int | None = None
+    segments: int
+    reinferred: int
+    # Result of the whole text, without delta
+    result: NERResult | None = None
+    changes: List[NERSegmentChange] | None = None
+    # Entity label table, with spans
+    labels: List[str] | None = None
 
 
 @asynccontextmanager
 async def lifespan_ner(app: FastAPI) -> AsyncIterator[None]:
-    logger.debug("Loading NER model...")
-    global MODEL_INFO
+    logger.debug("Starting NER model loader...")
+    global EXECUTOR, REGISTRY, DOCUMENTS
     try:
         # Download model if not exists
         if 0:
             sner.download_model(model_tag=sner.MODEL_TAG, model_path=sner.MODEL_PATH)
-        # Load model
-        MODEL_INFO = sner.load_model(model_path=sner.MODEL_PATH, device="cpu")
-        logger.debug("NER model loaded successfully")
+        EXECUTOR = sinfer.create_executor("ner", max_workers=sconfig.NER_WORKERS)
+        # The default version loads in the background (or on first request if
+        # lazy), so the models load concurrently and startup does not wait for
+        # them; other versions load on their first request
+        REGISTRY = sregistry.ModelRegistry(
+            task="ner",
+            versions=sregistry.configured_versions(sner.MODEL_PATH, sconfig.NER_MODEL_VERSIONS),
+            default=sconfig.NER_MODEL_DEFAULT,
+            load=partial(
+                sner.load_model,
+                device="cpu",
+                backend=sconfig.INFER_BACKEND,
+                quantize=sconfig.ONNX_QUANTIZE,
+            ),
+            predict=sner.predict_raw,
+            executor=EXECUTOR,
+            workers=sconfig.NER_WORKERS,
+            lazy="ner" in sconfig.LAZY_MODELS,
+            warmup=sloader.warmup_fn(sner.predict_raw) if sconfig.MODEL_WARMUP else None,
+        )
+        REGISTRY.start()
+        DOCUMENTS = sincremental.DocumentStore(sconfig.INCREMENTAL_MAX_DOCUMENTS)
         yield
     finally:
         # Cleanup
-        MODEL_INFO = None
+        DOCUMENTS = None
+        if REGISTRY:
+            await REGISTRY.stop()
+        REGISTRY = None
+        if EXECUTOR:
+            EXECUTOR.shutdown(wait=True, cancel_futures=True)
+        EXECUTOR = None
         logger.debug("NER model unloaded")
 
 
-router = APIRouter(prefix="/ner", tags=["Named Entity Recognition"])
+def use_model(version: str | None = None) -> AsyncContextManager[sregistry.ModelVersion]:
+    """Hold a NER model version for a request, as `models.use_model`."""
+    return models.use_model(REGISTRY, version)
 
 
-@router.post("/predict")
-async def predict_entities(request: NERRequest) -> NERResponse:
-    """Analyze text for named entities."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+async def require_model(version: str | None = None) -> str:
+    """Wait for a NER model version and return its name, as `models.require_model`."""
+    return await models.require_model(REGISTRY, version)
 
-    if not request.texts or not any(text.strip() for text in request.texts):
-        return NERResponse(results=[])
 
-    try:
-        # Get IOB predictions
-        iob_results = sner.predict_batch_iob(texts=request.texts, model_info=MODEL_INFO)
+router = APIRouter(prefix="/ner", tags=["Named Entity Recognition"])
 
-        # Convert to XML
-        xml_results = sner.convert_iob_to_xml(iob_results)
 
-        # Combine results
-        results = []
-        for (original, iob_tags), xml_result in zip(iob_results, xml_results):
-            results.append(
-                NERResult(original=original, xml=xml_result, iob=",".join(iob_tags))
+def _preprocess(request: NERRequest) -> None:
+    """Run the optional preprocessing stage on the request's texts, in place."""
+    if request.normalize:
+        with smetrics.STAGE_SECONDS.time("ner", "normalize"):
+            request.texts = snormalize.normalize_batch(request.texts)
+
+
+def build_results(
+    texts: List[str],
+    predictions: List[List[sinfer.Prediction]],
+    model_info: Dict,
+    outputs: List[NEROutput] = DEFAULT_OUTPUTS,
+    return_tokens: bool = False,
+) -> List[Dict]:
+    """Build result dicts shaped like NERResult from model predictions."""
+    # Group token predictions into entity spans, no per-character lists
+    with smetrics.STAGE_SECONDS.time("ner", "align"):
+        spans = sner.convert_raw_to_spans(predictions=predictions, model_info=model_info)
+
+    # Each output format only when requested
+    fields: Dict[str, List] = {}
+    if NEROutput.ORIGINAL in outputs:
+        fields["original"] = texts
+    if NEROutput.SPANS in outputs:
+        fields["spans"] = spans
+    if NEROutput.IOB in outputs:
+        with smetrics.STAGE_SECONDS.time("ner", "align"):
+            iob_results = sner.convert_raw_to_iob(
+                texts=texts, predictions=predictions, model_info=model_info
             )
+        fields["iob"] = [",".join(iob_tags) for _, iob_tags in iob_results]
+    if NEROutput.XML in outputs:
+        with smetrics.STAGE_SECONDS.time("ner", "xml"):
+            labels = model_info["entity_labels"]
+            fields["xml"] = [sner.spans_to_xml(t, s, labels) for t, s in zip(texts, spans)]
+
+    # Tokens for clients that display them, in one batch call
+    if return_tokens:
+        with smetrics.STAGE_SECONDS.time("ner", "tokenize"):
+            encoded = sinfer.encode_tokens(texts, model_info["tokenizer"])
+        for key in ("tokens", "token_ids", "offsets"):
+            fields[key] = [e[key] for e in encoded]
+
+    # Combine results as plain dicts shaped like NERResult
+    with smetrics.STAGE_SECONDS.time("ner", "build"):
+        if not fields:
+            return [{} for _ in texts]
+        return [dict(zip(fields, values)) for values in zip(*fields.values())]
+
+
+async def process_bulk(texts: List[str], options: Dict) -> List[Dict]:
+    """Process one chunk of a bulk job at bulk priority, bypassing the result cache."""
+    if not REGISTRY:
+        raise RuntimeError("Model not loaded")
+    request = NERRequest(texts=[], **options)
+    async with REGISTRY.use(request.model_version) as model:
+        predictions = await model.batcher.submit(texts, priority=sbatcher.PRIORITY_BULK)
+        return build_results(texts, predictions, model.model_info, request.outputs)
 
-        # ner_response = {
-        #     "labels": ["ajd_location", "ajd_other", "ajd_person", "klc_other", "wyweb_bookname", "wyweb_other"],
-        #     "total": 6,
-        # }
-        return NERResponse(results=results)
 
-    except Exception as e:
-        logger.error(f"Error processing text: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error processing text") from e
+@router.post("/predict")
+async def predict_entities(request: NERRequest, raw_request: Request) -> NERResponse:
+    """Analyze text for named entities.
+
+    Responds with JSON, or MessagePack if the Accept header prefers it. The
+    X-Model-Version header names the model version used.
+    """
+    # Admitted before the model is held, so a rejected request never loads one
+    priority = sadmission.admit(raw_request, request.texts)
+    async with use_model(request.model_version) as model:
+        _preprocess(request)
+        headers = {sregistry.MODEL_VERSION_HEADER: model.version}
+
+        if not request.texts or not any(text.strip() for text in request.texts):
+            return sencoding.respond(raw_request, {"results": []}, headers=headers)
+
+        try:
+            # Serve cached texts and queue the rest for the shared model batch
+            compute = partial(model.batcher.submit, priority=priority, bounded=True)
+            predictions = await model.cache.get_or_compute(request.texts, compute)
+            results = build_results(
+                request.texts,
+                predictions,
+                model.model_info,
+                request.outputs,
+                request.return_tokens,
+            )
+
+            # ner_response = {
+            #     "labels": ["ajd_location", "ajd_other", "ajd_person", "klc_other", "wyweb_bookname", "wyweb_other"],
+            #     "total": 6,
+            # }
+            response = {"results": results}
+            if NEROutput.SPANS in request.outputs:
+                response["labels"] = model.model_info["entity_labels"]
+            with smetrics.STAGE_SECONDS.time("ner", "serialize"):
+                return sencoding.respond(raw_request, response, headers=headers)
+
+        except sbatcher.QueueFull as e:
+            raise sadmission.queue_full(e) from e
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error processing text") from e
+
+
+@router.post("/predict/stream")
+async def predict_entities_stream(
+    request: NERRequest, raw_request: Request
+) -> StreamingResponse:
+    """Analyze texts for named entities, streaming one NDJSON result per line."""
+    priority = sadmission.admit(raw_request, request.texts)
+    version = await require_model(request.model_version)
+    _preprocess(request)
+
+    async def _lines() -> AsyncIterator[bytes]:
+        if not request.texts or not any(text.strip() for text in request.texts):
+            return
+        try:
+            async with use_model(version) as model:
+                compute = partial(model.batcher.submit, priority=priority, bounded=True)
+                async for texts, predictions in sinfer.map_chunks(
+                    request.texts,
+                    chunk_size=sconfig.BATCH_MAX_SIZE,
+                    fn=partial(model.cache.get_or_compute, compute=compute),
+                ):
+                    for result in build_results(
+                        texts,
+                        predictions,
+                        model.model_info,
+                        request.outputs,
+                        request.return_tokens,
+                    ):
+                        yield sencoding.encode_line(result)
+        except sbatcher.QueueFull as e:
+            smetrics.ADMISSION_REJECTED.inc(e.lane, "queue")
+            yield sencoding.encode_line({"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            yield sencoding.encode_line({"error": "Error processing text"})
+
+    return StreamingResponse(
+        _lines(), media_type="application/x-ndjson", headers={sregistry.MODEL_VERSION_HEADER: version}
+    )
+
+
+@router.post("/predict/incremental")
+async def predict_entities_incremental(
+    request: NERIncrementalRequest, raw_request: Request
+) -> NERIncrementalResponse:
+    """Analyze a document being edited for named entities, re-inferring only what changed.
+
+    Works as /punc/predict/incremental: unchanged segments reuse the results
+    of the document's previous revision. Returns the result of the whole
+    text, or with `delta` the changes since `revision`.
+    """
+    segments = sincremental.segment(request.text, request.segment, "ner")
+    target = REGISTRY.peek(request.model_version) if REGISTRY else None
+    texts = sincremental.pending(DOCUMENTS, request.document_id, request.text, segments, target)
+    priority = sadmission.admit(raw_request, texts)
+    async with use_model(request.model_version) as model:
+        try:
+            update = await sincremental.reanalyze(
+                DOCUMENTS,
+                request.document_id,
+                request.text,
+                segments,
+                request.revision,
+                model,
+                priority,
+            )
+            response = sincremental.build_response(
+                request.document_id,
+                request.text,
+                update,
+                request.delta,
+                build=partial(
+                    build_results,
+                    model_info=model.model_info,
+                    outputs=request.outputs,
+                    return_tokens=request.return_tokens,
+                ),
+            )
+            if NEROutput.SPANS in request.outputs:
+                response["labels"] = model.model_info["entity_labels"]
+            with smetrics.STAGE_SECONDS.time("ner", "serialize"):
+                return sencoding.respond(
+                    raw_request, response, headers={sregistry.MODEL_VERSION_HEADER: model.version}
+                )
+
+        except sbatcher.QueueFull as e:
+            raise sadmission.queue_full(e) from e
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error processing text") from e
 
 
 @router.post("/tokenize")
-async def tokenize_text(request: TokenizeRequest) -> TokenizeResponse:
+async def tokenize_text(request: TokenizeRequest, raw_request: Request) -> TokenizeResponse:
     """Tokenize the given text using the model's tokenizer."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-
     if not request.text.strip():
         raise HTTPException(status_code=400, detail="Empty text provided")
 
-    try:
-        tokenizer: BertTokenizerFast = MODEL_INFO["tokenizer"]
-
-        # Tokenize the text with configurable add_special_tokens
-        encoded = tokenizer.encode_plus(
-            request.text,
-            add_special_tokens=request.add_special_tokens,
-            return_attention_mask=False,
-            return_token_type_ids=False,
-        )
-
-        # Get the tokens and their IDs
-        tokens = tokenizer.convert_ids_to_tokens(encoded["input_ids"])
-        token_ids = encoded["input_ids"]
+    async with use_model() as model:
+        try:
+            tokenizer: BertTokenizerFast = model.model_info["tokenizer"]
 
-        return TokenizeResponse(text=request.text, tokens=tokens, token_ids=token_ids)
-    except Exception as e:
-        logger.error(f"Error tokenizing text: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error tokenizing text") from e
+            # Tokenize the text with configurable add_special_tokens
+            (encoded,) = sinfer.encode_tokens(
+                [request.text], tokenizer, add_special_tokens=request.add_special_tokens
+            )
+            return sencoding.respond(raw_request, {"text": request.text, **encoded})
+        except Exception as e:
+            logger.error(f"Error tokenizing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error tokenizing text") from e
+
+
+@router.post("/tokenize/batch")
+async def tokenize_texts(
+    request: TokenizeBatchRequest, raw_request: Request
+) -> TokenizeBatchResponse:
+    """Tokenize several texts in one batch call of the model's tokenizer."""
+    async with use_model() as model:
+        try:
+            tokenizer: BertTokenizerFast = model.model_info["tokenizer"]
+            encoded = sinfer.encode_tokens(
+                request.texts, tokenizer, add_special_tokens=request.add_special_tokens
+            )
+            results = [{"text": text, **e} for text, e in zip(request.texts, encoded)]
+            return sencoding.respond(raw_request, {"results": results})
+        except Exception as e:
+            logger.error(f"Error tokenizing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error tokenizing text") from e
 
 
 @router.get("/labels")
 async def get_ner_labels() -> NERLabelsResponse:
     """Get all possible NER labels that the model can predict."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    async with use_model() as model:
+        try:
+            # Get the id2label mapping from the model's config
+            id2label: dict = model.model_info["config"].id2label
+            # Convert to list of unique labels, removing the B- and I- prefixes
+            unique_labels = sorted(
+                set(label[2:] for label in id2label.values() if label != "O")
+            )
 
-    try:
-        # Get the id2label mapping from the model's config
-        id2label: dict = MODEL_INFO["model"].config.id2label
-        # Convert to list of unique labels, removing the B- and I- prefixes
-        unique_labels = sorted(
-            set(label[2:] for label in id2label.values() if label != "O")
-        )
+            return NERLabelsResponse(labels=unique_labels, total=len(unique_labels))
+
+        except Exception as e:
+            logger.error(f"Error getting NER labels: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail="Error retrieving NER labels"
+            ) from e
 
-        return NERLabelsResponse(labels=unique_labels, total=len(unique_labels))
 
-    except Exception as e:
-        logger.error(f"Error getting NER labels: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail="Error retrieving NER labels"
-        ) from e
+# GET /cache and /models, and the admin routes to manage the model versions
+router.include_router(models.create_router(lambda: REGISTRY))
@@ -0,0 +1,54 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+import tool.encoding as sencoding
+import tool.metrics as smetrics
+import tool.normalize as snormalize
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from loguru import logger
+from pydantic import BaseModel
+
+
+# Models for request/response
+class NormalizeRequest(BaseModel):
+    texts: List[str]
+    # Then drop punctuation and separators, as POST /punc/remove-punctuation does
+    remove_punctuation: bool = False
+
+
+class NormalizeResponse(BaseModel):
+    results: List[str]
+
+
+@asynccontextmanager
+async def lifespan_normalize(app: FastAPI) -> AsyncIterator[None]:
+    # Build the lookup tables before the first request needs them
+    await asyncio.to_thread(snormalize.tables)
+    yield
+
+
+def _normalize(texts: List[str], remove_punctuation: bool) -> List[str]:
+    with smetrics.STAGE_SECONDS.time("normalize", "normalize"):
+        texts = snormalize.normalize_batch(texts)
+        if remove_punctuation:
+            texts = snormalize.remove_punc_batch(texts)
+        return texts
+
+
+router = APIRouter(prefix="/normalize", tags=["Normalization"])
+
+
+@router.post("")
+async def normalize_texts(request: NormalizeRequest, raw_request: Request) -> NormalizeResponse:
+    """Normalize texts as the frontend does: NFKC, whitespace and punctuation folding, trim.
+
+    Responds with JSON, or MessagePack if the Accept header prefers it.
+    """
+    try:
+        # Off the event loop, as multi-megabyte batches take milliseconds
+        results = await asyncio.to_thread(_normalize, request.texts, request.remove_punctuation)
+        return sencoding.respond(raw_request, {"results": results})
+    except Exception as e:
+        logger.error(f"Error normalizing text: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error normalizing text") from e
@@ -1,15 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from enum import Enum
-from typing import AsyncIterator, Dict, List, Tuple
-
+from functools import partial
+from typing import AsyncContextManager, AsyncIterator, Dict, List, Tuple
+
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.incremental as sincremental
+import tool.infer as sinfer
+import tool.loader as sloader
+import tool.metrics as smetrics
+import tool.normalize as snormalize
 import tool.punc as spunc
-from fastapi import APIRouter, FastAPI, HTTPException
+import tool.registry as sregistry
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from loguru import logger
 from pydantic import BaseModel
 from transformers import BertTokenizerFast
 
-# Global variables to store model and tokenizer
-MODEL_INFO = None
+from . import models
+
+# Global variables to store the model versions
+EXECUTOR: ThreadPoolExecutor | None = None
+REGISTRY: sregistry.ModelRegistry | None = None
+DOCUMENTS: sincremental.DocumentStore | None = None
 
 
 class PunctuationStyle(str, Enum):
@@ -36,11 +53,22 @@ class PuncLabelInfo(BaseModel):
 class PuncRequest(BaseModel):
     texts: List[str]
     style: PunctuationStyle = PunctuationStyle.COMPREHENSIVE
+    styles: List[PunctuationStyle] | None = None
+    return_tokens: bool = False
+    # Normalize the texts first, as POST /normalize does
+    normalize: bool = False
+    # Model version (see GET /punc/models); the default one if unset
+    model_version: str | None = None
 
 
 class PuncResult(BaseModel):
     original: str
     punctuated: str
+    renderings: Dict[PunctuationStyle, str] | None = None
+    # Model tokens of the original text, with return_tokens
+    tokens: List[str] | None = None
+    token_ids: List[int] | None = None
+    offsets: List[Tuple[int, int]] | None = None
 
 
 class PuncResponse(BaseModel):
@@ -56,93 +84,315 @@ class TokenizeResponse(BaseModel):
     text: str
     tokens: List[str]
     token_ids: List[int]
+    offsets: List[Tuple[int, int]]
+
+
+class TokenizeBatchRequest(BaseModel):
+    texts: List[str]
+    add_special_tokens: bool = True
+
+
+class TokenizeBatchResponse(BaseModel):
+    results: List[TokenizeResponse]
+
+
+class PuncIncrementalRequest(BaseModel):
+    # Chosen by the client; requests with the same id re-infer only what changed
+    document_id: str
+    text: str
+    style: PunctuationStyle = PunctuationStyle.COMPREHENSIVE
+    return_tokens: bool = False
+    segment: sincremental.SegmentMode = sincremental.SegmentMode.LINE
+    # Return the changed segments since `revision` instead of the merged result
+    delta: bool = False
+    revision: int | None = None
+    model_version: str | None = None
+
+
+class PuncSegmentChange(BaseModel):
+    # Segments [start, start + delete) of the base revision are replaced by `insert`
+    start: int
+    delete: int
+    insert: List[PuncResult]
+
+
+class PuncIncrementalResponse(BaseModel):
+    document_id: str
+    revision: int
+    # Revision the changes apply to; None if they apply to no segments
+    base_revision: int | None = None
+    segments: int
+    reinferred: int
+    # Result of the whole text, without delta
+    result: PuncResult | None = None
+    changes: List[PuncSegmentChange] | None = None
 
 
 @asynccontextmanager
 async def lifespan_punc(app: FastAPI) -> AsyncIterator[None]:
-    logger.debug("Loading punctuation model...")
-    global MODEL_INFO
+    logger.debug("Starting punctuation model loader...")
+    global EXECUTOR, REGISTRY, DOCUMENTS
     try:
-        MODEL_INFO = spunc.load_model(model_path=spunc.MODEL_PATH, device="cpu")
-        logger.debug("Punctuation model loaded successfully")
+        EXECUTOR = sinfer.create_executor("punc", max_workers=sconfig.PUNC_WORKERS)
+        # The default version loads in the background (or on first request if
+        # lazy), so the models load concurrently and startup does not wait for
+        # them; other versions load on their first request
+        REGISTRY = sregistry.ModelRegistry(
+            task="punc",
+            versions=sregistry.configured_versions(spunc.MODEL_PATH, sconfig.PUNC_MODEL_VERSIONS),
+            default=sconfig.PUNC_MODEL_DEFAULT,
+            load=partial(
+                spunc.load_model,
+                device="cpu",
+                backend=sconfig.INFER_BACKEND,
+                quantize=sconfig.ONNX_QUANTIZE,
+            ),
+            predict=spunc.predict_raw,
+            executor=EXECUTOR,
+            workers=sconfig.PUNC_WORKERS,
+            lazy="punc" in sconfig.LAZY_MODELS,
+            warmup=sloader.warmup_fn(spunc.predict_raw) if sconfig.MODEL_WARMUP else None,
+        )
+        REGISTRY.start()
+        DOCUMENTS = sincremental.DocumentStore(sconfig.INCREMENTAL_MAX_DOCUMENTS)
         yield
     finally:
         # Cleanup
-        MODEL_INFO = None
+        DOCUMENTS = None
+        if REGISTRY:
+            await REGISTRY.stop()
+        REGISTRY = None
+        if EXECUTOR:
+            EXECUTOR.shutdown(wait=True, cancel_futures=True)
+        EXECUTOR = None
         logger.debug("Punctuation model unloaded")
 
 
-router = APIRouter(prefix="/punc", tags=["Punctuation Restoration"])
+def use_model(version: str | None = None) -> AsyncContextManager[sregistry.ModelVersion]:
+    """Hold a punctuation model version for a request, as `models.use_model`."""
+    return models.use_model(REGISTRY, version)
 
 
-@router.post("/predict")
-async def restore_punctuation(request: PuncRequest) -> PuncResponse:
-    """Restore punctuation in the given texts."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+async def require_model(version: str | None = None) -> str:
+    """Wait for a punctuation model version and return its name, as `models.require_model`."""
+    return await models.require_model(REGISTRY, version)
 
-    if not request.texts or not any(text.strip() for text in request.texts):
-        return PuncResponse(results=[])
 
-    # Get style settings directly from the enum
-    add_space, reduce = request.style.settings
+router = APIRouter(prefix="/punc", tags=["Punctuation Restoration"])
 
-    try:
-        # Process texts in batch
-        punctuated_texts = spunc.predict_batch(
-            texts=request.texts,
-            model_info=MODEL_INFO,
-            add_space=add_space,
-            reduce=reduce,
+
+def _preprocess(request: PuncRequest) -> None:
+    """Run the optional preprocessing stage on the request's texts, in place."""
+    if request.normalize:
+        with smetrics.STAGE_SECONDS.time("punc", "normalize"):
+            request.texts = snormalize.normalize_batch(request.texts)
+
+
+def _build_results(
+    request: PuncRequest,
+    texts: List[str],
+    predictions: List[List[sinfer.Prediction]],
+    model_info: Dict,
+    strip: bool = True,
+) -> List[Dict]:
+    # Render the requested style first, then any extra styles to compare,
+    # all from the same predictions
+    styles = [request.style] + (request.styles or [])
+    with smetrics.STAGE_SECONDS.time("punc", "align"):
+        rendered = spunc.render_styles(
+            texts=texts,
+            predictions=predictions,
+            model_info=model_info,
+            styles=[style.settings for style in styles],
+            strip=strip,
         )
 
-        # Combine results
-        results = [
-            PuncResult(original=original, punctuated=punctuated)
-            for original, punctuated in zip(request.texts, punctuated_texts)
-        ]
+    # Tokens for clients that display them, in one batch call
+    encoded = [{}] * len(texts)
+    if request.return_tokens:
+        with smetrics.STAGE_SECONDS.time("punc", "tokenize"):
+            encoded = sinfer.encode_tokens(texts, model_info["tokenizer"])
+
+    # Combine results as plain dicts shaped like PuncResult, unset fields left out
+    with smetrics.STAGE_SECONDS.time("punc", "build"):
+        extra_styles = [style.value for style in request.styles or []]
+        results = []
+        for original, renderings, tokens in zip(texts, rendered, encoded):
+            result = {"original": original, "punctuated": renderings[0], **tokens}
+            if extra_styles:
+                result["renderings"] = dict(zip(extra_styles, renderings[1:]))
+            results.append(result)
+        return results
+
+
+async def process_bulk(texts: List[str], options: Dict) -> List[Dict]:
+    """Process one chunk of a bulk job at bulk priority, bypassing the result cache."""
+    if not REGISTRY:
+        raise RuntimeError("Model not loaded")
+    request = PuncRequest(texts=[], **options)
+    async with REGISTRY.use(request.model_version) as model:
+        predictions = await model.batcher.submit(texts, priority=sbatcher.PRIORITY_BULK)
+        return _build_results(request, texts, predictions, model.model_info)
 
-        return PuncResponse(results=results)
 
-    except Exception as e:
-        logger.error(f"Error processing text: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error processing text") from e
+@router.post("/predict")
+async def restore_punctuation(request: PuncRequest, raw_request: Request) -> PuncResponse:
+    """Restore punctuation in the given texts.
+
+    Responds with JSON, or MessagePack if the Accept header prefers it. The
+    X-Model-Version header names the model version used.
+    """
+    # Admitted before the model is held, so a rejected request never loads one
+    priority = sadmission.admit(raw_request, request.texts)
+    async with use_model(request.model_version) as model:
+        _preprocess(request)
+        headers = {sregistry.MODEL_VERSION_HEADER: model.version}
+
+        if not request.texts or not any(text.strip() for text in request.texts):
+            return sencoding.respond(raw_request, {"results": []}, headers=headers)
+
+        try:
+            # Serve cached texts and queue the rest for the shared model batch
+            compute = partial(model.batcher.submit, priority=priority, bounded=True)
+            predictions = await model.cache.get_or_compute(request.texts, compute)
+            results = _build_results(request, request.texts, predictions, model.model_info)
+
+            with smetrics.STAGE_SECONDS.time("punc", "serialize"):
+                return sencoding.respond(raw_request, {"results": results}, headers=headers)
+
+        except sbatcher.QueueFull as e:
+            raise sadmission.queue_full(e) from e
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error processing text") from e
+
+
+@router.post("/predict/stream")
+async def restore_punctuation_stream(
+    request: PuncRequest, raw_request: Request
+) -> StreamingResponse:
+    """Restore punctuation, streaming one NDJSON result per line."""
+    priority = sadmission.admit(raw_request, request.texts)
+    version = await require_model(request.model_version)
+    _preprocess(request)
+
+    async def _lines() -> AsyncIterator[bytes]:
+        if not request.texts or not any(text.strip() for text in request.texts):
+            return
+        try:
+            async with use_model(version) as model:
+                compute = partial(model.batcher.submit, priority=priority, bounded=True)
+                async for texts, predictions in sinfer.map_chunks(
+                    request.texts,
+                    chunk_size=sconfig.BATCH_MAX_SIZE,
+                    fn=partial(model.cache.get_or_compute, compute=compute),
+                ):
+                    for result in _build_results(request, texts, predictions, model.model_info):
+                        yield sencoding.encode_line(result)
+        except sbatcher.QueueFull as e:
+            smetrics.ADMISSION_REJECTED.inc(e.lane, "queue")
+            yield sencoding.encode_line({"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            yield sencoding.encode_line({"error": "Error processing text"})
+
+    return StreamingResponse(
+        _lines(), media_type="application/x-ndjson", headers={sregistry.MODEL_VERSION_HEADER: version}
+    )
+
+
+@router.post("/predict/incremental")
+async def restore_punctuation_incremental(
+    request: PuncIncrementalRequest, raw_request: Request
+) -> PuncIncrementalResponse:
+    """Restore punctuation in a document being edited, re-inferring only what changed.
+
+    The document is cut into line (or sentence) segments, each inferred with
+    some text around it, and the results of its latest revision are kept.
+    Segments whose text and context are unchanged are reused, so the work
+    grows with the edit rather than the document. Returns the result of the
+    whole text, or with `delta` the changes since `revision`.
+    """
+    segments = sincremental.segment(request.text, request.segment, "punc")
+    target = REGISTRY.peek(request.model_version) if REGISTRY else None
+    texts = sincremental.pending(DOCUMENTS, request.document_id, request.text, segments, target)
+    priority = sadmission.admit(raw_request, texts)
+    async with use_model(request.model_version) as model:
+        options = PuncRequest(texts=[], style=request.style, return_tokens=request.return_tokens)
+        try:
+            update = await sincremental.reanalyze(
+                DOCUMENTS,
+                request.document_id,
+                request.text,
+                segments,
+                request.revision,
+                model,
+                priority,
+            )
+            response = sincremental.build_response(
+                request.document_id,
+                request.text,
+                update,
+                request.delta,
+                # Segments keep their line breaks so that they join up into the document
+                build=partial(
+                    _build_results, options, model_info=model.model_info, strip=not request.delta
+                ),
+            )
+            with smetrics.STAGE_SECONDS.time("punc", "serialize"):
+                return sencoding.respond(
+                    raw_request, response, headers={sregistry.MODEL_VERSION_HEADER: model.version}
+                )
+
+        except sbatcher.QueueFull as e:
+            raise sadmission.queue_full(e) from e
+        except Exception as e:
+            logger.error(f"Error processing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error processing text") from e
 
 
 @router.post("/tokenize")
-async def tokenize_text(request: TokenizeRequest) -> TokenizeResponse:
+async def tokenize_text(request: TokenizeRequest, raw_request: Request) -> TokenizeResponse:
     """Tokenize the given text using the model's tokenizer."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-
     if not request.text.strip():
         raise HTTPException(status_code=400, detail="Empty text provided")
 
-    try:
-        tokenizer: BertTokenizerFast = MODEL_INFO["tokenizer"]
-
-        # Tokenize the text with configurable add_special_tokens
-        encoded = tokenizer.encode_plus(
-            request.text,
-            add_special_tokens=request.add_special_tokens,
-            return_attention_mask=False,
-            return_token_type_ids=False,
-        )
-
-        # Get the tokens and their IDs
-        tokens = tokenizer.convert_ids_to_tokens(encoded["input_ids"])
-        token_ids = encoded["input_ids"]
-
-        return TokenizeResponse(text=request.text, tokens=tokens, token_ids=token_ids)
-    except Exception as e:
-        logger.error(f"Error tokenizing text: {str(e)}")
-        raise HTTPException(status_code=500, detail="Error tokenizing text") from e
+    async with use_model() as model:
+        try:
+            tokenizer: BertTokenizerFast = model.model_info["tokenizer"]
+
+            # Tokenize the text with configurable add_special_tokens
+            (encoded,) = sinfer.encode_tokens(
+                [request.text], tokenizer, add_special_tokens=request.add_special_tokens
+            )
+            return sencoding.respond(raw_request, {"text": request.text, **encoded})
+        except Exception as e:
+            logger.error(f"Error tokenizing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error tokenizing text") from e
+
+
+@router.post("/tokenize/batch")
+async def tokenize_texts(
+    request: TokenizeBatchRequest, raw_request: Request
+) -> TokenizeBatchResponse:
+    """Tokenize several texts in one batch call of the model's tokenizer."""
+    async with use_model() as model:
+        try:
+            tokenizer: BertTokenizerFast = model.model_info["tokenizer"]
+            encoded = sinfer.encode_tokens(
+                request.texts, tokenizer, add_special_tokens=request.add_special_tokens
+            )
+            results = [{"text": text, **e} for text, e in zip(request.texts, encoded)]
+            return sencoding.respond(raw_request, {"results": results})
+        except Exception as e:
+            logger.error(f"Error tokenizing text: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error tokenizing text") from e
 
 
 @router.post("/remove-punctuation")
 async def remove_punctuation(texts: List[str]) -> List[str]:
     """Remove punctuation from the given texts."""
-    return [spunc.remove_punc(text) for text in texts]
+    return snormalize.remove_punc_batch(texts)
 
 
 @router.get("/styles")
@@ -154,22 +404,24 @@ async def get_available_styles() -> List[PunctuationStyle]:
 @router.get("/labels")
 async def get_punctuation_labels() -> List[PuncLabelInfo]:
     """Get available punctuation labels that the model can restore."""
-    if not MODEL_INFO:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-
-    try:
-        label2id: Dict[str, int] = MODEL_INFO["label2id"]
-        # Convert the label2id dictionary to a list of PuncLabelInfo objects
-        # The labels in label2id are the actual punctuation marks
-        labels = [
-            PuncLabelInfo(label=f"B-{label_id}", punctuation=label)
-            for label, label_id in label2id.items()
-        ]
-        # Add the "O" label which represents no punctuation
-        labels.append(PuncLabelInfo(label="O", punctuation=""))
-        return labels
-    except Exception as e:
-        logger.error(f"Error getting punctuation labels: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail="Error retrieving punctuation labels"
-        ) from e
+    async with use_model() as model:
+        try:
+            label2id: Dict[str, int] = model.model_info["label2id"]
+            # Convert the label2id dictionary to a list of PuncLabelInfo objects
+            # The labels in label2id are the actual punctuation marks
+            labels = [
+                PuncLabelInfo(label=f"B-{label_id}", punctuation=label)
+                for label, label_id in label2id.items()
+            ]
+            # Add the "O" label which represents no punctuation
+            labels.append(PuncLabelInfo(label="O", punctuation=""))
+            return labels
+        except Exception as e:
+            logger.error(f"Error getting punctuation labels: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail="Error retrieving punctuation labels"
+            ) from e
+
+
+# GET /cache and /models, and the admin routes to manage the model versions
+router.include_router(models.create_router(lambda: REGISTRY))
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+import tool.cache as scache
+import tool.mt as smt
+from fastapi import FastAPI
+
+from . import mt
+
+PASSAGE = "學而時習之，不亦說乎？有朋自遠方來。\n不亦樂乎"
+
+
+def _source(request: httpx.Request) -> str:
+    # Text to translate, from the prompt built by `smt.build_messages`
+    prompt = json.loads(request.content)["messages"][1]["content"]
+    return prompt.split("\n")[1].split(": ", 1)[1]
+
+
+def _vllm(request: httpx.Request) -> httpx.Response:
+    # Stand-in for vLLM: "<source>", one character per streamed chunk; fails on "樂"
+    source = _source(request)
+    if "樂" in source:
+        return httpx.Response(500, json={"error": "model crashed"})
+    translation = f" <{source}> "
+    if not json.loads(request.content).get("stream"):
+        message = {"role": "assistant", "content": translation}
+        return httpx.Response(200, json={"choices": [{"message": message}]})
+    events = [{"choices": [{"delta": {"content": c}}]} for c in translation]
+    lines = [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+    return httpx.Response(200, content="".join(lines).encode("utf-8"))
+
+
+async def _post(path: str, text: str) -> httpx.Response:
+    app = FastAPI()
+    app.include_router(mt.router)
+    mt.CLIENT = smt.MTClient(base_url="http://vllm/v1", transport=httpx.MockTransport(_vllm))
+    mt.CACHE = scache.ResultCache(namespace="test|mt", max_entries=100)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"text": text}
+            first = await client.post(path, json=body)
+            # Served from the cache the second time
+            second = await client.post(path, json=body)
+            assert second.text == first.text
+            return first
+    finally:
+        await mt.CLIENT.close()
+        mt.CLIENT = mt.CACHE = None
+
+
+def test_stream_matches_translate():
+    passage = PASSAGE.replace("樂", "悅")
+    translated = asyncio.run(_post("/mt/translate", passage)).json()
+    streamed = asyncio.run(_post("/mt/translate/stream", passage))
+    assert streamed.status_code == 200
+    assert streamed.text == translated["translation"]
+    assert streamed.text == "<學而時習之，不亦說乎？> <有朋自遠方來。>\n<不亦悅乎>"
+
+
+def test_stream_aborts_on_error():
+    # A failed sentence must not end the stream as if the translation were complete
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_post("/mt/translate/stream", PASSAGE))
@@ -0,0 +1,126 @@
+import hashlib
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import tool.batcher as sbatcher
+import tool.config as sconfig
+import tool.infer as sinfer
+import tool.metrics as smetrics
+from fastapi import HTTPException, Request
+
+
+@dataclass(frozen=True)
+class Client:
+    """Caller of an API request, set on `request.state.client` by the auth check."""
+
+    key_id: str
+    priority: int = sbatcher.PRIORITY_INTERACTIVE
+    # Called with the admin key, which may also manage the model versions
+    admin: bool = False
+
+    @property
+    def lane(self) -> str:
+        return sbatcher.LANES[self.priority]
+
+
+def key_id(api_key: str) -> str:
+    """Short stable id of an API key, safe to keep in memory and logs."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """Take `cost` tokens and return 0, or return the seconds to wait.
+
+        A cost above `burst` is charged as `burst`, so it passes on a full bucket.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.burst)
+        if cost > self.tokens:
+            return (cost - self.tokens) / self.rate
+        self.tokens -= cost
+        return 0.0
+
+
+class RateLimiter:
+    """One `TokenBucket` per API key; a rate of 0 disables limiting."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, rate)
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def take(self, key: str, cost: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.take(cost)
+
+
+RATE_LIMITER = RateLimiter(sconfig.RATE_LIMIT_TOKENS_PER_S, sconfig.RATE_LIMIT_BURST_TOKENS)
+
+QUEUE_LIMITS = {
+    sbatcher.PRIORITY_INTERACTIVE: sconfig.QUEUE_MAX_TOKENS,
+    sbatcher.PRIORITY_BULK: sconfig.QUEUE_MAX_BULK_TOKENS,
+}
+
+
+def _reject(
+    lane: str, reason: str, status_code: int, detail: str, retry_after: int | None = None
+) -> HTTPException:
+    smetrics.ADMISSION_REJECTED.inc(lane, reason)
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+
+def require_admin(request: Request) -> None:
+    """Route dependency that lets only callers with the admin key through (403 otherwise)."""
+    client: Client | None = getattr(request.state, "client", None)
+    if not client or not client.admin:
+        raise HTTPException(status_code=403, detail="Admin API key required")
+
+
+def admit(request: Request, texts: List[str]) -> int:
+    """Check an inference request against the limits and return its batcher priority.
+
+    Raises 413 if the request is too large and 429 if its key is over its rate.
+    """
+    client: Client = getattr(request.state, "client", None) or Client(key_id="anonymous")
+    if len(texts) > sconfig.MAX_REQUEST_TEXTS:
+        raise _reject(
+            client.lane,
+            "texts",
+            413,
+            f"Too many texts: {len(texts)} > {sconfig.MAX_REQUEST_TEXTS}; use /jobs instead",
+        )
+    tokens = sum(sinfer.estimate_tokens(text) for text in texts)
+    if tokens > sconfig.MAX_REQUEST_TOKENS:
+        raise _reject(
+            client.lane,
+            "tokens",
+            413,
+            f"Too many tokens: {tokens} > {sconfig.MAX_REQUEST_TOKENS}; use /jobs instead",
+        )
+    wait = RATE_LIMITER.take(client.key_id, tokens)
+    if wait:
+        raise _reject(client.lane, "rate", 429, "Rate limit exceeded", math.ceil(wait))
+    return client.priority
+
+
+def queue_full(e: sbatcher.QueueFull) -> HTTPException:
+    """429 for a request turned away by a bounded batcher queue."""
+    return _reject(e.lane, "queue", 429, "Server busy, try again later", e.retry_after)
@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+import tool.infer as sinfer
+import tool.metrics as smetrics
+from loguru import logger
+
+
+# Lanes of the batcher queue; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+LANES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+
+class QueueFull(Exception):
+    """Raised by a bounded `submit` when the lane's queue budget is used up."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"Inference queue full for {lane} requests")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Item:
+    priority: int
+    seq: int
+    text: str = field(compare=False)
+    cost: int = field(compare=False)
+    future: asyncio.Future = field(compare=False, repr=False)
+    queued_at: float = field(compare=False, default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """Coalesce texts from concurrent requests into shared model batches.
+
+    A batch is closed when it reaches `max_batch_size` texts, when adding the
+    next text would exceed `max_tokens`, or `max_wait_ms` after its first text
+    arrived. At most `max_concurrency` batches are in flight (one per executor
+    worker), so under load texts queue up and the next batch grows instead of
+    the pool backing up. Queued texts are taken in priority order, so bulk
+    work only fills batches when no interactive text is waiting.
+
+    `queue_limits` caps the estimated tokens waiting per lane: a bounded
+    `submit` raises `QueueFull` instead of queueing past the cap of its own
+    lane or past the largest cap overall, so bulk callers cannot fill the
+    room kept for interactive ones.
+
+    With `gauges=False` the queue gauges are left to the owner, e.g. a model
+    registry summing them over the batchers of several model versions.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[List[str]], List[Any]],
+        executor: ThreadPoolExecutor,
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_tokens: int,
+        max_concurrency: int = 1,
+        cost: Callable[[str], int] = sinfer.estimate_tokens,
+        queue_limits: Dict[int, int] | None = None,
+        gauges: bool = True,
+    ):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_tokens = max(1, max_tokens)
+        self.cost = cost
+        self.queue_limits = queue_limits or {}
+        self.gauges = gauges
+        self.max_concurrency = max(1, max_concurrency)
+        self._queued: Dict[int, int] = dict.fromkeys(LANES, 0)
+        # Moving average of tokens per second per worker, for Retry-After
+        self._tokens_per_s: float | None = None
+        self._queue: asyncio.PriorityQueue[_Item] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._task: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self.gauges:
+            smetrics.QUEUE_DEPTH.set_function(self.name, fn=self.queue_depth)
+            for priority, lane in LANES.items():
+                smetrics.QUEUED_TOKENS.set_function(
+                    self.name, lane, fn=partial(self.queued_tokens, priority)
+                )
+        self._task = asyncio.create_task(self._loop(), name=f"batcher-{self.name}")
+
+    async def stop(self) -> None:
+        if self.gauges:
+            smetrics.QUEUE_DEPTH.set_function(self.name, fn=None)
+            for lane in LANES.values():
+                smetrics.QUEUED_TOKENS.set_function(self.name, lane, fn=None)
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._running, return_exceptions=True)
+        # Fail whatever is still queued so callers do not hang
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._queued = dict.fromkeys(LANES, 0)
+        for item in pending:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Batcher stopped"))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def queued_tokens(self, priority: int) -> int:
+        return self._queued[priority]
+
+    def retry_after(self, tokens: int) -> int:
+        """Seconds until about `tokens` queued tokens will have been processed."""
+        if not self._tokens_per_s:
+            return 1
+        return max(1, math.ceil(tokens / (self._tokens_per_s * self.max_concurrency)))
+
+    def _check_room(self, priority: int, cost: int) -> None:
+        queued = sum(self._queued.values())
+        if not queued:
+            # An idle model always takes the request, however large
+            return
+        lane_limit = self.queue_limits.get(priority)
+        total_limit = max(self.queue_limits.values(), default=None)
+        if (lane_limit is not None and self._queued[priority] + cost > lane_limit) or (
+            total_limit is not None and queued + cost > total_limit
+        ):
+            raise QueueFull(LANES[priority], retry_after=self.retry_after(queued))
+
+    async def submit(
+        self, texts: List[str], priority: int = PRIORITY_INTERACTIVE, bounded: bool = False
+    ) -> List[Any]:
+        """Queue texts for inference and wait for their results, in order.
+
+        With `bounded`, raise `QueueFull` rather than exceed `queue_limits`;
+        nothing is queued in that case.
+        """
+        costs = [self.cost(text) for text in texts]
+        if bounded:
+            self._check_room(priority, sum(costs))
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text, cost in zip(texts, costs):
+            future = loop.create_future()
+            item = _Item(
+                priority=priority,
+                seq=next(self._seq),
+                text=text,
+                cost=cost,
+                future=future,
+            )
+            self._queue.put_nowait(item)
+            self._queued[priority] += cost
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> List[_Item]:
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        batch, tokens = [first], first.cost
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if tokens + item.cost > self.max_tokens:
+                # Keeps its place in the queue for the next batch
+                self._queue.put_nowait(item)
+                break
+            batch.append(item)
+            tokens += item.cost
+
+        for item in batch:
+            self._queued[item.priority] -= item.cost
+        return batch
+
+    async def _loop(self) -> None:
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[_Item]) -> None:
+        try:
+            # Skip texts whose caller has already gone away
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                return
+            texts = [item.text for item in batch]
+            started = time.perf_counter()
+            for item in batch:
+                smetrics.STAGE_SECONDS.observe(
+                    self.name, "queue", value=started - item.queued_at
+                )
+            smetrics.BATCH_SIZE.observe(self.name, value=len(batch))
+            tokens = sum(item.cost for item in batch)
+            smetrics.BATCH_TOKENS.observe(self.name, value=tokens)
+            try:
+                results = await sinfer.run_in_executor(self.executor, self.fn, texts)
+            except Exception as e:
+                logger.error(f"Batch of {len(texts)} failed in {self.name}: {str(e)}")
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                return
+            rate = tokens / max(time.perf_counter() - started, 1e-6)
+            self._tokens_per_s = rate if self._tokens_per_s is None else (
+                0.8 * self._tokens_per_s + 0.2 * rate
+            )
+            for item, result in zip(batch, results, strict=True):
+                if not item.future.done():
+                    item.future.set_result(result)
+        finally:
+            self._slots.release()
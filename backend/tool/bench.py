@@ -0,0 +1,347 @@
+import asyncio
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from functools import partial
+from importlib import reload
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import tool.config as sconfig
+import tool.encoding as sencoding
+import tool.infer as sinfer
+import tool.ner as sner
+import tool.normalize as snormalize
+import tool.punc as spunc
+import tool.root as sroot
+import torch
+import typer
+from loguru import logger
+from pydantic import BaseModel
+from rich import pretty
+from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+BENCH_DIR = sroot.TEMP_DIR / "bench"
+NER_ENTITIES = [
+    "ajd_location",
+    "ajd_other",
+    "ajd_person",
+    "klc_other",
+    "wyweb_bookname",
+    "wyweb_other",
+]
+# Stand-in punctuation classes: the base marks of _reduce_punc and a few combinations
+PUNC_LABELS = [",", "-", "/", ":", "|", "·", "、", "?", "!", ".", ";", "。", "。\"", "?」", ":\""]
+CJK_RANGE = (0x4E00, 0x9FA5)
+
+
+class _NERResult(BaseModel):
+    # Per-item response model the NER route used to build before encoding
+    original: str
+    iob: str
+    xml: str
+    spans: List[Tuple[int, int, int]]
+
+
+def _has_weights(model_path: Path) -> bool:
+    return any(Path(model_path).rglob("*.safetensors"))
+
+
+def build_random_model(
+    model_path: str | Path, labels: List[str], hidden_size: int, layers: int, seed: int = 42
+) -> Path:
+    """Save a randomly initialised BERT token classifier with a CJK character vocabulary."""
+    hface_path = Path(model_path) / "hface"
+    if _has_weights(hface_path):
+        return hface_path
+    hface_path.mkdir(parents=True, exist_ok=True)
+    torch.manual_seed(seed)
+
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    vocab += [chr(c) for c in range(CJK_RANGE[0], CJK_RANGE[1] + 1)]
+    (hface_path / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    tokenizer = BertTokenizerFast(vocab_file=str(hface_path / "vocab.txt"), do_lower_case=False)
+    tokenizer.save_pretrained(hface_path)
+
+    id2label = dict(enumerate(labels))
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        intermediate_size=hidden_size * 4,
+        num_labels=len(labels),
+        id2label=id2label,
+        label2id={label: i for i, label in id2label.items()},
+    )
+    BertForTokenClassification(config).save_pretrained(hface_path)
+    return hface_path
+
+
+def prepare_models(hidden_size: int, layers: int) -> Dict[str, Path]:
+    """Use the real checkpoints when present, otherwise random models with the same labels."""
+    paths = {"punc": spunc.MODEL_PATH, "ner": sner.MODEL_PATH}
+    if not _has_weights(paths["punc"]):
+        paths["punc"] = BENCH_DIR / "punc"
+        labels = ["O"] + [f"B-{i}" for i in range(len(PUNC_LABELS))]
+        build_random_model(paths["punc"], labels, hidden_size=hidden_size, layers=layers)
+        label2id = {punc: i for i, punc in enumerate(PUNC_LABELS)}
+        (paths["punc"] / "label2id.json").write_text(
+            json.dumps(label2id, ensure_ascii=False), encoding="utf-8"
+        )
+    if not _has_weights(paths["ner"]):
+        paths["ner"] = BENCH_DIR / "ner"
+        labels = ["O"] + [f"{p}-{e}" for e in NER_ENTITIES for p in "BI"]
+        build_random_model(paths["ner"], labels, hidden_size=hidden_size, layers=layers)
+    return paths
+
+
+def random_texts(rng: np.random.Generator, batch_size: int, length: int) -> List[str]:
+    codes = rng.integers(CJK_RANGE[0], CJK_RANGE[1], size=(batch_size, length))
+    return ["".join(map(chr, row)) for row in codes]
+
+
+def mixed_texts(rng: np.random.Generator, batch_size: int, max_length: int) -> List[str]:
+    """Texts with long-tailed lengths, mostly short lines and a few long passages."""
+    lengths = np.clip(rng.lognormal(mean=3.5, sigma=1.0, size=batch_size), 4, max_length)
+    return [random_texts(rng, 1, int(n))[0] for n in lengths]
+
+
+def _summary(name: str, batch_size: int, length: int, timings: List[float]) -> Dict:
+    ms = np.array(timings) * 1000
+    return {
+        "name": name,
+        "batch_size": batch_size,
+        "text_length": length,
+        "repeats": len(timings),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "texts_per_s": float(batch_size * len(timings) / (ms.sum() / 1000)),
+    }
+
+
+def _time(fn: Callable[[], object], repeats: int, warmup: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_functions(
+    paths: Dict[str, Path], batch_sizes: List[int], lengths: List[int], repeats: int, warmup: int
+) -> List[Dict]:
+    punc_info = spunc.load_model(model_path=paths["punc"], device="cpu")
+    ner_info = sner.load_model(model_path=paths["ner"], device="cpu")
+    rng = np.random.default_rng(0)
+
+    results = []
+    for batch_size in batch_sizes:
+        for length in lengths:
+            texts = random_texts(rng, batch_size, length)
+            raw = sner.predict_raw(texts=texts, model_info=ner_info)
+            iob = sner.convert_raw_to_iob(texts=texts, predictions=raw, model_info=ner_info)
+            punctuated = spunc.predict_batch(texts=texts, model_info=punc_info)
+            spans = sner.convert_raw_to_spans(predictions=raw, model_info=ner_info)
+            payload = [
+                {"original": t, "iob": ",".join(tags), "xml": xml, "spans": s}
+                for t, (_, tags), xml, s in zip(texts, iob, sner.convert_iob_to_xml(iob), spans)
+            ]
+            cases = {
+                "predict_batch": lambda: spunc.predict_batch(texts=texts, model_info=punc_info),
+                "predict_batch_iob": lambda: sner.predict_batch_iob(
+                    texts=texts, model_info=ner_info
+                ),
+                "_iob2xml": lambda: [sner._iob2xml(list(t), tags) for t, tags in iob],
+                "convert_iob_to_xml": lambda: sner.convert_iob_to_xml(iob),
+                "convert_raw_to_spans": lambda: sner.convert_raw_to_spans(
+                    predictions=raw, model_info=ner_info
+                ),
+                "remove_punc": lambda: [spunc.remove_punc(t) for t in punctuated],
+                "remove_punc_batch": lambda: snormalize.remove_punc_batch(punctuated),
+                "normalize_batch": lambda: snormalize.normalize_batch(punctuated),
+                "serialize_pydantic": lambda: json.dumps(
+                    {"results": [_NERResult(**r).model_dump() for r in payload]},
+                    ensure_ascii=False,
+                ),
+                "serialize_orjson": lambda: sencoding.encode({"results": payload}),
+                "serialize_msgpack": lambda: sencoding.encode(
+                    {"results": payload}, sencoding.MSGPACK
+                ),
+            }
+            for name, fn in cases.items():
+                timings = _time(fn, repeats=repeats, warmup=warmup)
+                results.append(_summary(name, batch_size, length, timings))
+                logger.debug(f"{name} b={batch_size} n={length}: {results[-1]['p50_ms']:.2f} ms")
+    return results
+
+
+def bench_mixed(
+    paths: Dict[str, Path], batch_size: int, max_length: int, repeats: int, warmup: int
+) -> List[Dict]:
+    """Wall-clock throughput of length-bucketed against single padded batches on mixed lengths."""
+    punc_info = spunc.load_model(model_path=paths["punc"], device="cpu")
+    texts = mixed_texts(np.random.default_rng(2), batch_size, max_length)
+    mean_length = int(np.mean([len(text) for text in texts]))
+    window = min(sconfig.WINDOW_LENGTH, spunc.MAX_LENGTH - 2)
+    forward = partial(sinfer.forward_tokens, model_info=punc_info)
+    cases = {
+        "mixed bucketed": partial(
+            sinfer.predict_windowed,
+            texts,
+            fn=partial(sinfer.predict_bucketed, fn=forward),
+            window=window,
+            overlap=sconfig.WINDOW_OVERLAP,
+        ),
+        # One batch padded to the longest text, as before bucketing
+        "mixed unbucketed": partial(
+            sinfer.predict_windowed,
+            texts,
+            fn=forward,
+            window=window,
+            overlap=sconfig.WINDOW_OVERLAP,
+        ),
+    }
+    outputs = {name: fn() for name, fn in cases.items()}
+    if len({json.dumps(output) for output in outputs.values()}) != 1:
+        logger.warning("Bucketed and unbucketed predictions differ")
+
+    results = []
+    for name, fn in cases.items():
+        timings = _time(fn, repeats=repeats, warmup=warmup)
+        results.append(_summary(name, batch_size, mean_length, timings))
+        logger.info(
+            f"{name} b={batch_size} mean n={mean_length}: "
+            f"{results[-1]['p50_ms']:.1f} ms, {results[-1]['texts_per_s']:.0f} texts/s"
+        )
+    return results
+
+
+async def _bench_asgi(
+    paths: Dict[str, Path], batch_sizes: List[int], lengths: List[int], repeats: int, warmup: int
+) -> List[Dict]:
+    import httpx
+
+    # Import the app the way the server does: as a package containing main.py
+    os.environ.setdefault("FASTAPI_KEY", "bench")
+    package_dir = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(package_dir.parent))
+    main = importlib.import_module(f"{package_dir.name}.main")
+    spunc.MODEL_PATH, sner.MODEL_PATH = paths["punc"], paths["ner"]
+
+    headers = {main.API_KEY_NAME: main.API_KEY}
+    rng = np.random.default_rng(1)
+    results = []
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for route, accept in [
+                ("/punc/predict", sencoding.JSON),
+                ("/ner/predict", sencoding.JSON),
+                ("/ner/predict", sencoding.MSGPACK),
+                ("/analyze", sencoding.JSON),
+                ("/normalize", sencoding.JSON),
+            ]:
+                for batch_size in batch_sizes:
+                    for length in lengths:
+                        timings = []
+                        for i in range(warmup + repeats):
+                            # Fresh texts every time so the result cache never hits
+                            texts = random_texts(rng, batch_size, length)
+                            start = time.perf_counter()
+                            response = await client.post(
+                                route,
+                                json={"texts": texts},
+                                headers={**headers, "Accept": accept},
+                            )
+                            response.raise_for_status()
+                            if i >= warmup:
+                                timings.append(time.perf_counter() - start)
+                        name = f"asgi {route} {accept}"
+                        results.append(_summary(name, batch_size, length, timings))
+                        p50 = results[-1]["p50_ms"]
+                        logger.debug(f"{route} b={batch_size} n={length}: {p50:.2f} ms")
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        )
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(
+    output: Optional[Path] = None,
+    batch_sizes: str = "1,8,32",
+    lengths: str = "32,128,512",
+    repeats: int = 20,
+    warmup: int = 3,
+    hidden_size: int = 256,
+    layers: int = 4,
+    asgi: bool = True,
+    mixed_batch_size: int = 64,
+    only_mixed: bool = False,
+):
+    """Benchmark the backend hot paths and emit the results as JSON."""
+    torch.manual_seed(0)
+    batch_list = [int(b) for b in batch_sizes.split(",")]
+    length_list = [int(n) for n in lengths.split(",")]
+    paths = prepare_models(hidden_size=hidden_size, layers=layers)
+    random_weights = paths["punc"] != spunc.MODEL_PATH
+
+    results = bench_mixed(
+        paths, mixed_batch_size, max(length_list), repeats=repeats, warmup=warmup
+    )
+    if not only_mixed:
+        results += bench_functions(
+            paths, batch_list, length_list, repeats=repeats, warmup=warmup
+        )
+    if asgi and not only_mixed:
+        results += asyncio.run(
+            _bench_asgi(paths, batch_list, length_list, repeats=repeats, warmup=warmup)
+        )
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "models": {task: str(path) for task, path in paths.items()},
+            "random_weights": random_weights,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        output.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # python -m tool.bench --output bench.json
+            typer.run(main)
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+from loguru import logger
+
+
+class ResultCache:
+    """Content-addressed cache of per-text model results.
+
+    Keys are a hash of the namespace (model identity, task and variant) and
+    the text. Results live in a bounded in-memory LRU and, if `db_path` is
+    given, in an SQLite file that survives restarts. Concurrent requests for
+    a text that is already being computed wait for that computation instead
+    of starting another one.
+
+    The SQLite file is only touched from one thread of its own, never from
+    the event loop. Writes are queued and flushed in one transaction per
+    batch: whatever was queued while the previous flush ran.
+    """
+
+    def __init__(self, namespace: str, max_entries: int, db_path: str | Path | None = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory: OrderedDict[str, Any] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db: sqlite3.Connection | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        # Results waiting to be written, and whether a flush is queued for them
+        self._pending: Dict[str, Any] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_queued = False
+        if db_path:
+            db_path = Path(db_path)
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-db")
+
+    def close(self) -> None:
+        """Write the queued results and close the file; blocks, so call it off the event loop."""
+        if self._executor:
+            self._executor.submit(self._flush).result()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._db:
+            self._db.close()
+            self._db = None
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+        }
+
+    def _key(self, text: str) -> str:
+        payload = f"{self.namespace}\0{text}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, keys: List[str]) -> List[tuple[str, str]]:
+        # In the database thread
+        placeholders = ",".join("?" * len(keys))
+        return self._db.execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders})", keys
+        ).fetchall()
+
+    def _flush(self) -> None:
+        # In the database thread: write everything queued so far in one transaction
+        with self._pending_lock:
+            items, self._pending = self._pending, {}
+            self._flush_queued = False
+        if not items or not self._db:
+            return
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                    [(k, json.dumps(v, ensure_ascii=False)) for k, v in items.items()],
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing result cache: {str(e)}")
+
+    async def _lookup(self, keys: List[str]) -> Dict[str, Any]:
+        found = {}
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+        self.hits += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if self._executor and missing:
+            with self._pending_lock:
+                queued = {key: self._pending[key] for key in missing if key in self._pending}
+            found.update(queued)
+            missing = [key for key in missing if key not in queued]
+            try:
+                rows = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._read, missing
+                ) if missing else []
+            except sqlite3.Error as e:
+                logger.error(f"Error reading result cache: {str(e)}")
+                rows = []
+            for key, value in rows:
+                found[key] = json.loads(value)
+                self._remember(key, found[key])
+            self.disk_hits += len(queued) + len(rows)
+        return found
+
+    def _store(self, items: Dict[str, Any]) -> None:
+        for key, value in items.items():
+            self._remember(key, value)
+        if self._executor and items:
+            with self._pending_lock:
+                self._pending.update(items)
+                queue_flush, self._flush_queued = not self._flush_queued, True
+            if queue_flush:
+                self._executor.submit(self._flush)
+
+    async def get_or_compute(
+        self, texts: List[str], compute: Callable[[List[str]], Awaitable[List[Any]]]
+    ) -> List[Any]:
+        """Return results for texts, computing only the ones not cached yet."""
+        if self.max_entries <= 0 and not self._db:
+            self.misses += len(texts)
+            return await compute(texts)
+
+        keys = [self._key(text) for text in texts]
+        results: List[Any] = [None] * len(texts)
+        found = await self._lookup(list(dict.fromkeys(keys)))
+
+        todo: Dict[str, List[int]] = {}
+        waiting: List[tuple[int, asyncio.Future]] = []
+        for i, key in enumerate(keys):
+            if key in found:
+                results[i] = found[key]
+            elif key in self._inflight:
+                waiting.append((i, self._inflight[key]))
+                self.coalesced += 1
+            elif key in todo:
+                todo[key].append(i)
+                self.coalesced += 1
+            else:
+                todo[key] = [i]
+                self.misses += 1
+
+        if todo:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in todo}
+            self._inflight.update(futures)
+            try:
+                values = await compute([texts[idx[0]] for idx in todo.values()])
+                self._store(dict(zip(todo, values, strict=True)))
+                for (key, idx), value in zip(todo.items(), values):
+                    futures[key].set_result(value)
+                    for i in idx:
+                        results[i] = value
+            except asyncio.CancelledError:
+                for future in futures.values():
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures.values():
+                    future.set_exception(e)
+                    future.exception()  # waiters still see it; silences the warning
+                raise
+            finally:
+                for key in todo:
+                    self._inflight.pop(key, None)
+
+        for i, future in waiting:
+            try:
+                results[i] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller we were waiting on went away; compute it ourselves
+                (results[i],) = await self.get_or_compute([texts[i]], compute)
+
+        return results
@@ -0,0 +1,302 @@
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sys
+import time
+import urllib.request
+from functools import lru_cache
+from importlib import reload
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tool.root as sroot
+import typer
+from loguru import logger
+from rich import pretty
+
+DICT_URL = "https://www.mdbg.net/chinese/export/cedict/cedict_1_0_ts_utf-8_mdbg.txt.gz"
+DICT_PATH = sroot.MODEL_DIR / "dict" / "cedict_ts.u8"
+# Bump when the index layout changes so old indexes are rebuilt
+INDEX_VERSION = 1
+
+# Traditional Simplified [pin1 yin1] /definition 1/definition 2/
+LINE = re.compile(r"^(\S+) (\S+) \[([^\]]*)\] /(.*)/\s*$")
+ARRAYS = ["edge_key", "entry_start", "entry_ids", "string_start", "strings"]
+# Code points take 21 bits; trie edges are keyed by (parent node, code point)
+CHAR_BITS = 21
+
+Entry = Dict[str, str | List[str]]
+
+
+def download_dict(dict_path: str | Path, url: str = DICT_URL) -> None:
+    dict_path = Path(dict_path)
+    if dict_path.is_file():
+        return
+    dict_path.parent.mkdir(parents=True, exist_ok=True)
+    logger.debug(f"Downloading {url}")
+    with urllib.request.urlopen(url) as response, gzip.GzipFile(fileobj=response) as src:
+        with dict_path.with_suffix(".tmp").open("wb") as dst:
+            shutil.copyfileobj(src, dst)
+    dict_path.with_suffix(".tmp").rename(dict_path)
+
+
+def parse_dict(dict_path: str | Path) -> List[Tuple[str, str, str, str]]:
+    """Read (traditional, simplified, pinyin, definitions) entries from a CC-CEDICT file."""
+    entries = []
+    with Path(dict_path).open(encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            match = LINE.match(line)
+            if match:
+                entries.append(match.groups())
+    return entries
+
+
+def build_index(entries: List[Tuple[str, str, str, str]], index_dir: str | Path) -> None:
+    """Write the array-backed trie of the entries' headwords to `index_dir`.
+
+    Trie nodes are numbered breadth-first from the root (0), so the node
+    reached by edge `e` is `e + 1` and edges come out sorted by parent node:
+
+    - `edge_key[e]` is `parent << 21 | code point`, sorted, so a transition
+      is one binary search, and a whole text's transitions one `searchsorted`
+    - `entry_start[n]:entry_start[n + 1]` index `entry_ids` for the entries
+      whose traditional or simplified headword ends at node n
+    - entry i has its four fields at `string_start[4 * i : 4 * i + 5]` in
+      the UTF-8 blob `strings`
+    """
+    children: List[Dict[int, int]] = [{}]
+    node_entries: List[List[int]] = [[]]
+    for i, (traditional, simplified, _, _) in enumerate(entries):
+        for headword in dict.fromkeys((traditional, simplified)):
+            node = 0
+            for c in map(ord, headword):
+                child = children[node].get(c)
+                if child is None:
+                    child = children[node][c] = len(children)
+                    children.append({})
+                    node_entries.append([])
+                node = child
+            node_entries[node].append(i)
+
+    # Renumber breadth-first
+    order = [0]
+    for node in order:
+        order.extend(child for _, child in sorted(children[node].items()))
+    edge_key = np.zeros(len(order) - 1, dtype=np.uint64)
+    entry_start = np.zeros(len(order) + 1, dtype=np.int32)
+    entry_ids: List[int] = []
+    edge = 0
+    for new, node in enumerate(order):
+        for c in sorted(children[node]):
+            edge_key[edge] = new << CHAR_BITS | c
+            edge += 1
+        entry_start[new] = len(entry_ids)
+        entry_ids.extend(node_entries[node])
+    entry_start[-1] = len(entry_ids)
+
+    fields = [field.encode("utf-8") for entry in entries for field in entry]
+    string_start = np.zeros(len(fields) + 1, dtype=np.int64)
+    string_start[1:] = np.cumsum([len(field) for field in fields])
+
+    # Written next to the final directory and renamed, so readers never see half an index
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(f"{index_dir.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    arrays = {
+        "edge_key": edge_key,
+        "entry_start": entry_start,
+        "entry_ids": np.array(entry_ids, dtype=np.int32),
+        "string_start": string_start,
+        "strings": np.frombuffer(b"".join(fields), dtype=np.uint8),
+    }
+    for name, array in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", array)
+    try:
+        tmp_dir.rename(index_dir)
+    except OSError:
+        # Another process built the same index first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not index_dir.is_dir():
+            raise
+
+
+def index_path(dict_path: str | Path) -> Path:
+    """Index location for a dictionary file; a changed file gets a new index."""
+    stat = Path(dict_path).stat()
+    key = f"{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return Path(dict_path).with_name(Path(dict_path).name + ".index") / digest
+
+
+class Dictionary:
+    """Longest-match lookup over a memory-mapped dictionary index (see `build_index`).
+
+    The arrays are mapped read-only, so opening the index is instant, its pages
+    are shared between worker processes and only the parts that are used are
+    read. A lookup walks the trie from every position of the text at once,
+    one character deeper per step, so a text costs O(length) work per step
+    and as many vectorized steps as its longest headword has characters.
+    """
+
+    def __init__(self, index_dir: str | Path):
+        self.index_dir = Path(index_dir)
+        arrays = {
+            name: np.load(self.index_dir / f"{name}.npy", mmap_mode="r") for name in ARRAYS
+        }
+        self._edge_key = arrays["edge_key"]
+        self._entry_start = arrays["entry_start"]
+        self._entry_ids = arrays["entry_ids"]
+        self._string_start = arrays["string_start"]
+        self._strings = memoryview(arrays["strings"])
+        self.num_entries = (len(self._string_start) - 1) // 4
+        # Decoded entries, cached per index so a replaced dictionary is freed
+        self._entry = lru_cache(maxsize=65536)(self._decode_entry)
+
+    def _children(self, nodes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Node reached from each node by each code point; 0 where there is no edge."""
+        keys = nodes.astype(np.uint64) << np.uint64(CHAR_BITS) | codes
+        edges = np.searchsorted(self._edge_key, keys)
+        edges[edges == len(self._edge_key)] = 0
+        found = self._edge_key[edges] == keys
+        return np.where(found, edges + 1, 0)
+
+    def _has_entries(self, nodes: np.ndarray) -> np.ndarray:
+        return self._entry_start[nodes + 1] > self._entry_start[nodes]
+
+    def match(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Longest headword starting at every position of `text`.
+
+        Returns its end and trie node per position; the node is 0 where no
+        headword starts.
+        """
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        ends = np.arange(len(codes))
+        best = np.zeros(len(codes), dtype=np.int64)
+        starts = np.arange(len(codes))
+        nodes = np.zeros(len(codes), dtype=np.int64)
+        depth = 0
+        while len(starts):
+            nodes = self._children(nodes, codes[starts + depth])
+            keep = nodes > 0
+            starts, nodes = starts[keep], nodes[keep]
+            depth += 1
+            found = self._has_entries(nodes)
+            ends[starts[found]] = starts[found] + depth
+            best[starts[found]] = nodes[found]
+            # Walks that ran into the end of the text stop here
+            keep = starts + depth < len(codes)
+            starts, nodes = starts[keep], nodes[keep]
+        return ends, best
+
+    def _decode_entry(self, entry_id: int) -> Entry:
+        bounds = self._string_start[4 * entry_id : 4 * entry_id + 5].tolist()
+        traditional, simplified, pinyin, definitions = (
+            bytes(self._strings[start:end]).decode("utf-8")
+            for start, end in zip(bounds, bounds[1:])
+        )
+        return {
+            "traditional": traditional,
+            "simplified": simplified,
+            "pinyin": pinyin,
+            "definitions": definitions.split("/"),
+        }
+
+    def entries(self, nodes: List[int]) -> List[List[Entry]]:
+        """Entries of each trie node, gathered from the mapped arrays at once."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self._entry_start[nodes].astype(np.int64)
+        counts = self._entry_start[nodes + 1] - starts
+        offsets = np.cumsum(counts) - counts
+        positions = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+        entry_ids = self._entry_ids[positions].tolist()
+        return [
+            [self._entry(entry_id) for entry_id in entry_ids[offset : offset + count]]
+            for offset, count in zip(offsets.tolist(), counts.tolist())
+        ]
+
+    def lookup(self, text: str, words: bool = True) -> Dict:
+        """Dictionary entries of a passage.
+
+        `words` is the greedy longest-match segmentation of the text into
+        headwords, as (start, end) spans; `entries` maps each of those
+        headwords and every single character found to its entries.
+        """
+        nodes: Dict[str, int] = {}
+        spans: List[Tuple[int, int]] = []
+        if words and text:
+            ends, best = self.match(text)
+            ends, best = ends.tolist(), best.tolist()
+            i = 0
+            while i < len(text):
+                if best[i]:
+                    spans.append((i, ends[i]))
+                    nodes.setdefault(text[i : ends[i]], best[i])
+                    i = ends[i]
+                else:
+                    i += 1
+
+        # Single characters, each one transition from the root
+        chars = [char for char in dict.fromkeys(text) if char not in nodes]
+        if chars:
+            codes = np.array([ord(char) for char in chars], dtype=np.uint64)
+            found = self._children(np.zeros(len(chars), dtype=np.int64), codes)
+            found[~self._has_entries(found)] = 0
+            nodes.update((char, node) for char, node in zip(chars, found.tolist()) if node)
+
+        result = {"entries": dict(zip(nodes, self.entries(list(nodes.values()))))}
+        if words:
+            result["words"] = spans
+        return result
+
+
+def load_dict(dict_path: str | Path = DICT_PATH) -> Dictionary | None:
+    """Open the index of a dictionary file, building it on first use."""
+    dict_path = Path(dict_path)
+    if not dict_path.is_file():
+        logger.error(f"No dictionary file found at {dict_path}")
+        return None
+    index_dir = index_path(dict_path)
+    if not index_dir.is_dir():
+        started = time.perf_counter()
+        entries = parse_dict(dict_path)
+        build_index(entries, index_dir)
+        elapsed = time.perf_counter() - started
+        logger.debug(f"Built index of {len(entries)} entries in {elapsed:.2f}s at {index_dir}")
+    return Dictionary(index_dir)
+
+
+def main(
+    text: Optional[str] = None,
+    dict_path: Path = DICT_PATH,
+    download: bool = True,
+):
+    """Build the dictionary index (downloading CC-CEDICT if needed) and look up `text`."""
+    if download:
+        download_dict(dict_path)
+    dictionary = load_dict(dict_path)
+    if dictionary is None:
+        raise typer.Exit(1)
+    logger.info(f"{dictionary.num_entries} entries in {dictionary.index_dir}")
+
+    text = text or "太宗高宗之世屡欲立明堂诸儒议其制度不决而止"
+    result = dictionary.lookup(text)
+    for start, end in result["words"]:
+        headword = text[start:end]
+        for entry in result["entries"][headword]:
+            logger.info(f"{headword} [{entry['pinyin']}] {'; '.join(entry['definitions'])}")
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # python -m tool.cedict --text 太宗高宗之世
+            typer.run(main)
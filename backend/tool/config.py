@@ -0,0 +1,98 @@
+import os
+
+import tool.root as sroot
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_str(name: str, default: str | None = None) -> str | None:
+    return os.getenv(name) or default
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes") if value else default
+
+
+# Inference executor (one bounded thread pool per model)
+PUNC_WORKERS = _env_int("PUNC_WORKERS", min(2, os.cpu_count() or 1))
+NER_WORKERS = _env_int("NER_WORKERS", min(2, os.cpu_count() or 1))
+
+# Micro-batching (shared by the punctuation and NER batchers)
+BATCH_MAX_SIZE = _env_int("BATCH_MAX_SIZE", 32)
+BATCH_MAX_WAIT_MS = _env_int("BATCH_MAX_WAIT_MS", 5)
+BATCH_MAX_TOKENS = _env_int("BATCH_MAX_TOKENS", 8192)
+
+# Sliding-window inference for long texts (in characters)
+WINDOW_LENGTH = _env_int("WINDOW_LENGTH", 510)
+WINDOW_OVERLAP = _env_int("WINDOW_OVERLAP", 128)
+
+# Length-bucketed forward batches (padded tokens per forward pass)
+BUCKET_MAX_TOKENS = _env_int("BUCKET_MAX_TOKENS", 8192)
+BUCKET_MAX_SIZE = _env_int("BUCKET_MAX_SIZE", 64)
+
+# Result cache (entries per model; set CACHE_DB to persist to SQLite)
+CACHE_MAX_ENTRIES = _env_int("CACHE_MAX_ENTRIES", 10000)
+CACHE_DB = _env_str("CACHE_DB")
+
+# Tokenized model inputs kept for reuse, shared by models with the same tokenizer
+ENCODING_CACHE_ENTRIES = _env_int("ENCODING_CACHE_ENTRIES", 2048)
+
+# Inference backend: "torch" or "onnx" (ONNX Runtime, optionally int8-quantized)
+INFER_BACKEND = _env_str("INFER_BACKEND", "torch")
+ONNX_QUANTIZE = _env_bool("ONNX_QUANTIZE")
+
+# Bulk jobs (state and outputs on local disk)
+JOBS_DIR = _env_str("JOBS_DIR", str(sroot.TEMP_DIR / "jobs"))
+JOB_CHUNK_SIZE = _env_int("JOB_CHUNK_SIZE", 256)
+
+# Model loading: both models load concurrently at startup, except those listed
+# in LAZY_MODELS (e.g. "ner" or "dict"), which load on their first request
+LAZY_MODELS = frozenset(filter(None, _env_str("LAZY_MODELS", "").split(",")))
+MODEL_WARMUP = _env_bool("MODEL_WARMUP")
+
+# Admission control for the inference endpoints. Requests over the per-request
+# limits get 413 (use /jobs for larger inputs); keys over their token rate and
+# lanes whose queue budget is used up get 429 with Retry-After. Tokens are
+# estimated as characters + 2. A rate of 0 disables rate limiting.
+MAX_REQUEST_TEXTS = _env_int("MAX_REQUEST_TEXTS", 1024)
+MAX_REQUEST_TOKENS = _env_int("MAX_REQUEST_TOKENS", 65536)
+RATE_LIMIT_TOKENS_PER_S = _env_int("RATE_LIMIT_TOKENS_PER_S", 0)
+RATE_LIMIT_BURST_TOKENS = _env_int("RATE_LIMIT_BURST_TOKENS", MAX_REQUEST_TOKENS)
+QUEUE_MAX_TOKENS = _env_int("QUEUE_MAX_TOKENS", 262144)
+QUEUE_MAX_BULK_TOKENS = _env_int("QUEUE_MAX_BULK_TOKENS", 131072)
+
+# Machine translation through the OpenAI-compatible vLLM server (see usage.sh).
+# Sentences are translated concurrently, at most MT_MAX_CONCURRENCY at a time,
+# and cached like model results
+VLLM_BASE_URL = _env_str("VLLM_BASE_URL", "http://localhost:7806/v1")
+VLLM_API_KEY = _env_str("VLLM_API_KEY")
+MT_MODEL = _env_str("MT_MODEL", "seyoungsong/Qwen2-7B-HanjaMT-AJD-KLC-AWQ")
+MT_MAX_CONCURRENCY = _env_int("MT_MAX_CONCURRENCY", 64)
+MT_TIMEOUT_S = _env_int("MT_TIMEOUT_S", 120)
+MT_MAX_SEGMENT_LENGTH = _env_int("MT_MAX_SEGMENT_LENGTH", 256)
+
+# Model versions: checkpoints served next to the "base" one at each task's
+# MODEL_PATH, as "name=path,name=path". Requests pick one with model_version,
+# and the default can be switched at runtime (POST /punc/models/default and
+# /ner/models/default). Versions other than the defaults are unloaded, least
+# recently used first, while the loaded ones take more than
+# MODEL_MEMORY_BUDGET_MB (0: no limit)
+PUNC_MODEL_VERSIONS = _env_str("PUNC_MODEL_VERSIONS")
+NER_MODEL_VERSIONS = _env_str("NER_MODEL_VERSIONS")
+PUNC_MODEL_DEFAULT = _env_str("PUNC_MODEL_DEFAULT", "base")
+NER_MODEL_DEFAULT = _env_str("NER_MODEL_DEFAULT", "base")
+MODEL_MEMORY_BUDGET_MB = _env_int("MODEL_MEMORY_BUDGET_MB", 0)
+
+# Incremental re-analysis (POST /punc/predict/incremental and
+# /ner/predict/incremental): documents are cut into segments of at most
+# INCREMENTAL_SEGMENT_LENGTH characters, each inferred with
+# INCREMENTAL_CONTEXT characters of the text around it, by default half the
+# window overlap as for windowed inference. The segment predictions of the
+# INCREMENTAL_MAX_DOCUMENTS most recently edited documents are kept per task
+INCREMENTAL_SEGMENT_LENGTH = _env_int("INCREMENTAL_SEGMENT_LENGTH", 320)
+INCREMENTAL_CONTEXT = _env_int("INCREMENTAL_CONTEXT", WINDOW_OVERLAP // 2)
+INCREMENTAL_MAX_DOCUMENTS = _env_int("INCREMENTAL_MAX_DOCUMENTS", 1024)
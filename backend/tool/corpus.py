@@ -0,0 +1,194 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from loguru import logger
+
+# Per-process state of pool workers
+_WORKER: Dict = {}
+
+
+def _init_worker(task: str, model_path: str, threads: int, options: Dict) -> None:
+    # Pin intra-op threads before the model allocates its thread pool
+    import torch
+
+    torch.set_num_threads(threads)
+    if task == "punc":
+        import tool.punc as tool
+    else:
+        import tool.ner as tool
+    _WORKER.update(
+        task=task,
+        tool=tool,
+        options=options,
+        model_info=tool.load_model(model_path=model_path, device="cpu"),
+    )
+
+
+def _process_chunk(texts: List[str]) -> List[Dict]:
+    tool, model_info = _WORKER["tool"], _WORKER["model_info"]
+    if _WORKER["task"] == "punc":
+        punctuated = tool.predict_batch(texts=texts, model_info=model_info, **_WORKER["options"])
+        return [{"original": t, "punctuated": p} for t, p in zip(texts, punctuated)]
+
+    iob_results = tool.predict_batch_iob(texts=texts, model_info=model_info)
+    xml_results = tool.convert_iob_to_xml(iob_results)
+    return [
+        {"original": text, "xml": xml, "iob": ",".join(tags)}
+        for (text, tags), xml in zip(iob_results, xml_results)
+    ]
+
+
+def _read_texts(path: Path) -> Iterator[str]:
+    # Line-streamed, never loaded whole: JSONL lines are a string or an
+    # object with a "text" field, any other file is read as plain text lines
+    is_jsonl = path.suffix in (".jsonl", ".ndjson")
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not is_jsonl:
+                yield line
+            elif line.strip():
+                item = json.loads(line)
+                yield item if isinstance(item, str) else item["text"]
+
+
+def _chunks(texts: Iterator[str], size: int) -> Iterator[List[str]]:
+    while chunk := list(islice(texts, size)):
+        yield chunk
+
+
+class _JsonlWriter:
+    """Single JSONL file; the checkpoint records the byte offset reached."""
+
+    def __init__(self, path: Path, checkpoint: Dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        os.truncate(path, checkpoint.get("offset", 0))
+        self.f = path.open("a", encoding="utf-8")
+
+    def write(self, results: List[Dict], index: int) -> Dict:
+        self.f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results))
+        self.f.flush()
+        return {"offset": self.f.tell()}
+
+    def close(self) -> None:
+        self.f.close()
+
+
+class _ParquetWriter:
+    """Directory of Parquet parts, one per chunk, each written atomically."""
+
+    def __init__(self, path: Path, checkpoint: Dict):
+        path.mkdir(parents=True, exist_ok=True)
+        self.path = path
+
+    def write(self, results: List[Dict], index: int) -> Dict:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        part = self.path / f"part-{index:06d}.parquet"
+        tmp = part.with_suffix(".tmp")
+        pq.write_table(pa.Table.from_pylist(results), tmp)
+        os.replace(tmp, part)
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+def run_corpus(
+    task: str,
+    model_path: str | Path,
+    input_path: str | Path,
+    output_path: str | Path,
+    workers: int = 1,
+    threads: int = 0,
+    chunk_size: int = 256,
+    output_format: str = "jsonl",
+    options: Dict | None = None,
+) -> Dict:
+    """Process a corpus file with a pool of model processes, in input order.
+
+    Each worker process loads its own model with `threads` torch intra-op
+    threads (default: cores divided by workers). Progress is checkpointed to
+    `<output>.ckpt.json` after every chunk, so rerunning the same command
+    resumes where it stopped; Parquet output must resume with the same
+    `chunk_size`.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    workers = max(1, workers)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+
+    ckpt_path = output_path.with_name(output_path.name + ".ckpt.json")
+    checkpoint = json.loads(ckpt_path.read_text()) if ckpt_path.is_file() else {"done": 0}
+    done_at_start = checkpoint["done"]
+    if done_at_start:
+        logger.info(f"Resuming from checkpoint: {done_at_start} texts done")
+    # Parquet parts are numbered by chunk, so a different size would overwrite
+    # or skip parts already written
+    resumed_size = checkpoint.get("chunk_size", chunk_size)
+    if done_at_start and output_format == "parquet" and resumed_size != chunk_size:
+        raise ValueError(
+            f"Checkpoint was written with chunk size {resumed_size}, not {chunk_size}; "
+            f"resume with --chunk-size {resumed_size} or delete {ckpt_path}"
+        )
+    checkpoint["chunk_size"] = chunk_size
+
+    writer_cls = _ParquetWriter if output_format == "parquet" else _JsonlWriter
+    writer = writer_cls(output_path, checkpoint)
+
+    texts = islice(_read_texts(input_path), done_at_start, None)
+    chunks = enumerate(_chunks(texts, chunk_size), start=done_at_start // chunk_size)
+
+    ctx = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with ctx.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(task, str(model_path), threads, options or {}),
+    ) as pool:
+        # Keep a bounded window of chunks in flight, collected in order
+        pending: deque = deque()
+        for index, chunk in chunks:
+            pending.append((index, len(chunk), pool.apply_async(_process_chunk, (chunk,))))
+            if len(pending) < 2 * workers:
+                continue
+            checkpoint = _collect(pending.popleft(), writer, checkpoint, ckpt_path)
+            _report(checkpoint["done"] - done_at_start, started)
+        while pending:
+            checkpoint = _collect(pending.popleft(), writer, checkpoint, ckpt_path)
+            _report(checkpoint["done"] - done_at_start, started)
+    writer.close()
+
+    elapsed = time.perf_counter() - started
+    processed = checkpoint["done"] - done_at_start
+    report = {
+        "texts": processed,
+        "seconds": elapsed,
+        "texts_per_second": processed / elapsed if elapsed else 0.0,
+        "workers": workers,
+        "threads_per_worker": threads,
+    }
+    logger.info(f"Done: {json.dumps(report)}")
+    return report
+
+
+def _collect(item, writer, checkpoint: Dict, ckpt_path: Path) -> Dict:
+    index, size, result = item
+    checkpoint = {**checkpoint, **writer.write(result.get(), index)}
+    checkpoint["done"] += size
+    tmp = ckpt_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(checkpoint))
+    os.replace(tmp, ckpt_path)
+    return checkpoint
+
+
+def _report(processed: int, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    logger.info(f"{processed} texts, {processed / elapsed:.1f} texts/s")
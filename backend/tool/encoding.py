@@ -0,0 +1,68 @@
+from typing import Any, Dict, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack responses are then not offered
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_ALIASES = {MSGPACK, "application/x-msgpack", "application/vnd.msgpack"}
+
+
+def _parse_accept(accept: str) -> list[Tuple[str, float]]:
+    media = []
+    for part in accept.split(","):
+        name, *params = part.strip().split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media.append((name.strip().lower(), q))
+    return media
+
+
+def negotiate(accept: str | None) -> str:
+    """Pick the response media type from an Accept header; JSON unless MessagePack is preferred."""
+    if not accept or msgpack is None:
+        return JSON
+    best, best_q = JSON, 0.0
+    for name, q in _parse_accept(accept):
+        if name in _MSGPACK_ALIASES and q > best_q:
+            best, best_q = MSGPACK, q
+        elif name in (JSON, "application/*", "*/*") and q > best_q:
+            best, best_q = JSON, q
+    return best
+
+
+def encode(data: Any, media_type: str = JSON) -> bytes:
+    if media_type == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    return orjson.dumps(data)
+
+
+def encode_line(data: Any) -> bytes:
+    """One NDJSON line."""
+    return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def respond(request: Request, data: Any, headers: Dict[str, str] | None = None) -> Response:
+    """Encode plain dicts and lists in the media type the client accepts.
+
+    Routes declare their Pydantic models for the OpenAPI schema but return
+    this response directly, so no model is built or validated per item.
+    """
+    media_type = negotiate(request.headers.get("accept"))
+    return Response(
+        content=encode(data, media_type),
+        media_type=media_type,
+        headers={"Vary": "Accept", **(headers or {})},
+    )
@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import re
+import sys
+import time
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from enum import Enum
+from functools import partial
+from importlib import reload
+from itertools import islice
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import tool.config as sconfig
+import tool.infer as sinfer
+import tool.metrics as smetrics
+import tool.mt as smt
+import tool.registry as sregistry
+import tool.root as sroot
+import typer
+from loguru import logger
+from rich import pretty
+
+LINE_END = re.compile(r"\n")
+# Characters that decide whether a long segment may be cut after them
+CUT_WINDOW = 16
+
+# Runs the model on texts, returns the predictions of each whole text
+Predictor = Callable[[List[str]], Awaitable[List[List[sinfer.Prediction]]]]
+# Turns texts and their predictions into one result dict per text
+Builder = Callable[[List[str], List[List[sinfer.Prediction]]], List[Dict]]
+
+
+class SegmentMode(str, Enum):
+    LINE = "line"
+    SENTENCE = "sentence"
+
+
+class Segment(NamedTuple):
+    start: int
+    end: int
+    # Text around the segment that the model sees with it
+    context_start: int
+    context_end: int
+
+
+class Update(NamedTuple):
+    segments: List[Segment]
+    # Per segment, predictions with offsets relative to its start
+    predictions: List[List[sinfer.Prediction]]
+    revision: int
+    # Revision the changes apply to; None if they rebuild the document
+    base_revision: int | None
+    # (start, end) segments of the base revision replaced by (start, end) of the new one
+    changes: List[Tuple[Tuple[int, int], Tuple[int, int]]]
+    reinferred: int
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps around
+    x = values.astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def cut_candidates(text: str, max_length: int) -> np.ndarray:
+    """Offsets where long segments may be cut, about one per `max_length // 4` characters.
+
+    Whether an offset is a candidate depends only on the CUT_WINDOW
+    characters before it, so an edit moves only the candidates right after
+    it and the other cuts keep their place relative to the text around them.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    if len(codes) < CUT_WINDOW:
+        return np.zeros(0, dtype=np.int64)
+    sums = np.concatenate(([np.uint64(0)], np.cumsum(_mix(codes), dtype=np.uint64)))
+    window = _mix(sums[CUT_WINDOW:] - sums[:-CUT_WINDOW])
+    return np.flatnonzero(window % np.uint64(max(1, max_length // 4)) == 0) + CUT_WINDOW
+
+
+def _cut(start: int, end: int, candidates: np.ndarray, max_length: int) -> List[Tuple[int, int]]:
+    min_length = max(1, max_length // 8)
+    lo = np.searchsorted(candidates, start + min_length)
+    hi = np.searchsorted(candidates, end - min_length, side="right")
+    pieces, last = [], start
+    for cut in candidates[lo:hi].tolist() + [end]:
+        # Stretches without a candidate are cut by length
+        while cut - last > max_length:
+            pieces.append((last, last + max_length))
+            last += max_length
+        if cut - last >= min_length or cut == end:
+            pieces.append((last, cut))
+            last = cut
+    return [(a, b) for a, b in pieces if a < b]
+
+
+def split_segments(text: str, mode: SegmentMode, max_length: int) -> List[Tuple[int, int]]:
+    """Cut `text` into consecutive (start, end) segments that survive edits elsewhere.
+
+    Segments end at line breaks, or also at sentence-final marks in
+    SENTENCE mode; longer ones are cut further at `cut_candidates`.
+    """
+    pattern = smt.SENTENCE_END if mode == SegmentMode.SENTENCE else LINE_END
+    ends = [m.end() for m in pattern.finditer(text)]
+    bounds = sorted({0, len(text), *(end for end in ends if 0 < end < len(text))})
+    candidates = None
+    segments = []
+    for start, end in zip(bounds, bounds[1:]):
+        if end - start <= max_length:
+            segments.append((start, end))
+            continue
+        if candidates is None:
+            candidates = cut_candidates(text, max_length)
+        segments.extend(_cut(start, end, candidates, max_length))
+    return segments
+
+
+def with_context(text: str, segments: List[Tuple[int, int]], context: int) -> List[Segment]:
+    """Add up to `context` characters on each side of each segment for the model to see."""
+    return [
+        Segment(start, end, max(0, start - context), min(len(text), end + context))
+        for start, end in segments
+    ]
+
+
+def segment_key(text: str, segment: Segment) -> str:
+    """Hash of a segment and its context; equal keys mean equal predictions."""
+    start, end, context_start, context_end = segment
+    header = f"{start - context_start}:{end - start}\0"
+    payload = (header + text[context_start:context_end]).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def merge(segments: List[Segment], predictions: List[List[sinfer.Prediction]]) -> List[sinfer.Prediction]:
+    """Shift per-segment predictions back to offsets in the whole text."""
+    return [
+        (s + segment.start, e + segment.start, label_id)
+        for segment, segment_predictions in zip(segments, predictions)
+        for s, e, label_id in segment_predictions
+    ]
+
+
+class Document:
+    """Segment predictions of the latest revision of a document, by segment key."""
+
+    def __init__(self, model: object, revision: int = 0):
+        # Model (version) the predictions come from
+        self.model = model
+        self.revision = revision
+        # Segment keys of the latest revision; None until there is one to diff against
+        self.keys: List[str] | None = None
+        self.results: Dict[str, List[sinfer.Prediction]] = {}
+        self.lock = asyncio.Lock()
+
+    async def update(
+        self, text: str, segments: List[Segment], predict: Predictor, base_revision: int | None
+    ) -> Update:
+        """Run the model on new and changed segments only, then make `text` the latest revision.
+
+        A segment is re-inferred when it or its context changed. The changes
+        are relative to `base_revision` if that is the latest revision, else
+        they rebuild the whole document.
+        """
+        async with self.lock:
+            keys = [segment_key(text, segment) for segment in segments]
+            missing: Dict[str, Segment] = {}
+            for key, segment in zip(keys, segments):
+                if key not in self.results:
+                    missing.setdefault(key, segment)
+
+            padded = [text[s.context_start : s.context_end] for s in missing.values()]
+            predictions = await predict(padded) if padded else []
+
+            results = {key: self.results[key] for key in keys if key in self.results}
+            for (key, segment), segment_predictions in zip(missing.items(), predictions):
+                offset = segment.start - segment.context_start
+                length = segment.end - segment.start
+                results[key] = [
+                    (s - offset, e - offset, label_id)
+                    for s, e, label_id in segment_predictions
+                    if offset <= s < offset + length
+                ]
+
+            if self.keys is not None and base_revision == self.revision:
+                matcher = SequenceMatcher(None, self.keys, keys, autojunk=False)
+                changes = [
+                    ((i1, i2), (j1, j2))
+                    for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                    if tag != "equal"
+                ]
+            else:
+                base_revision = None
+                changes = [((0, 0), (0, len(keys)))] if keys else []
+
+            self.keys, self.results = keys, results
+            self.revision += 1
+            return Update(
+                segments=segments,
+                predictions=[results[key] for key in keys],
+                revision=self.revision,
+                base_revision=base_revision,
+                changes=changes,
+                reinferred=len(missing),
+            )
+
+
+class DocumentStore:
+    """Documents being edited, by id; the least recently used are dropped past `max_documents`."""
+
+    def __init__(self, max_documents: int):
+        self.max_documents = max_documents
+        self._documents: OrderedDict[str, Document] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def peek(self, document_id: str) -> Document | None:
+        """The document's state, if any, without creating it or marking it used."""
+        return self._documents.get(document_id)
+
+    def get(self, document_id: str, model: object) -> Document:
+        """The document's state, started afresh if it was predicted by another model version."""
+        document = self._documents.get(document_id)
+        if document is None or document.model != model:
+            revision = document.revision if document else 0
+            document = self._documents[document_id] = Document(model, revision=revision)
+        self._documents.move_to_end(document_id)
+        while len(self._documents) > self.max_documents:
+            self._documents.popitem(last=False)
+        return document
+
+    def clear(self) -> None:
+        self._documents.clear()
+
+
+def segment(text: str, mode: SegmentMode, task: str) -> List[Segment]:
+    """Cut a document into segments with context, as configured."""
+    with smetrics.STAGE_SECONDS.time(task, "segment"):
+        return with_context(
+            text,
+            split_segments(text, mode, sconfig.INCREMENTAL_SEGMENT_LENGTH),
+            sconfig.INCREMENTAL_CONTEXT,
+        )
+
+
+def pending(
+    documents: DocumentStore,
+    document_id: str,
+    text: str,
+    segments: List[Segment],
+    model: object,
+) -> List[str]:
+    """Texts that updating the document with `model` would re-infer, as of now.
+
+    Lets a request be admitted by the size of its edit before it holds (and
+    possibly loads) the model version.
+    """
+    document = documents.peek(document_id)
+    results = document.results if document and document.model is model else {}
+    texts: Dict[str, str] = {}
+    for s in segments:
+        key = segment_key(text, s)
+        if key not in results:
+            texts.setdefault(key, text[s.context_start : s.context_end])
+    return list(texts.values())
+
+
+async def reanalyze(
+    documents: DocumentStore,
+    document_id: str,
+    text: str,
+    segments: List[Segment],
+    base_revision: int | None,
+    model: sregistry.ModelVersion,
+    priority: int,
+) -> Update:
+    """Update a document with a model version, through its result cache and batcher."""
+
+    async def _predict(texts: List[str]) -> List[List[sinfer.Prediction]]:
+        compute = partial(model.batcher.submit, priority=priority, bounded=True)
+        return await model.cache.get_or_compute(texts, compute)
+
+    document = documents.get(document_id, model)
+    return await document.update(text, segments, _predict, base_revision)
+
+
+def build_response(
+    document_id: str, text: str, update: Update, delta: bool, build: Builder
+) -> Dict:
+    """The merged result of the whole text, or with `delta` the results of the changed segments.
+
+    Changes replace `delete` segments at `start` of the base revision with
+    the `insert` results; applied from last to first, they turn the base
+    revision's segment results into this one's. `build` must then keep the
+    whitespace around each segment, so that joining the text fields of the
+    segment results in order gives those of the merged result (up to the
+    whitespace stripped from its ends). Offsets in a segment result are
+    relative to the segment's start.
+    """
+    response = {
+        "document_id": document_id,
+        "revision": update.revision,
+        "base_revision": update.base_revision,
+        "segments": len(update.segments),
+        "reinferred": update.reinferred,
+    }
+    if not delta:
+        merged = merge(update.segments, update.predictions)
+        (response["result"],) = build([text], [merged])
+        return response
+
+    inserted = [j for _, (j1, j2) in update.changes for j in range(j1, j2)]
+    results = iter(
+        build(
+            [text[update.segments[j].start : update.segments[j].end] for j in inserted],
+            [update.predictions[j] for j in inserted],
+        )
+    )
+    response["changes"] = [
+        {"start": i1, "delete": i2 - i1, "insert": list(islice(results, j2 - j1))}
+        for (i1, i2), (j1, j2) in update.changes
+    ]
+    return response
+
+
+def main(length: int = 20000, edits: int = 100, max_length: int = 320, context: int = 64):
+    """Count the segments re-inferred after single-character edits to an unbroken random text."""
+    rng = np.random.default_rng(0)
+    text = "".join(map(chr, rng.integers(0x4E00, 0x9FA6, size=length)))
+
+    started = time.perf_counter()
+    segments = with_context(text, split_segments(text, SegmentMode.LINE, max_length), context)
+    keys = {segment_key(text, segment) for segment in segments}
+    elapsed = time.perf_counter() - started
+    logger.info(f"{len(segments)} segments of {length} characters in {elapsed * 1000:.1f} ms")
+
+    changed, chars = [], []
+    for position in rng.integers(0, length, size=edits).tolist():
+        edited = text[:position] + chr(int(rng.integers(0x4E00, 0x9FA6))) + text[position + 1 :]
+        edited_segments = with_context(
+            edited, split_segments(edited, SegmentMode.LINE, max_length), context
+        )
+        new = [s for s in edited_segments if segment_key(edited, s) not in keys]
+        changed.append(len(new))
+        chars.append(sum(s.context_end - s.context_start for s in new))
+    logger.info(
+        f"Per edit: {np.mean(changed):.1f} segments (max {max(changed)}), "
+        f"{np.mean(chars):.0f} characters re-inferred of {length}"
+    )
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # python -m tool.incremental --length 20000
+            typer.run(main)
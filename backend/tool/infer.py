@@ -0,0 +1,490 @@
+import asyncio
+import functools
+import hashlib
+import threading
+import unicodedata
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+import numpy as np
+import tool.config as sconfig
+import tool.metrics as smetrics
+import tool.ort as sort
+import torch
+from tokenizers.pre_tokenizers import BertPreTokenizer
+
+T = TypeVar("T")
+
+# (start, end, label_id) of a token predicted as something other than "O"
+Prediction = Tuple[int, int, int]
+
+
+def create_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Create a bounded thread pool for blocking model inference.
+
+    Threads are enough here: torch releases the GIL inside the forward pass,
+    so concurrent batches run on separate cores while the event loop stays free.
+    """
+    return ThreadPoolExecutor(
+        max_workers=max(1, max_workers), thread_name_prefix=f"infer-{name}"
+    )
+
+
+async def run_in_executor(
+    executor: ThreadPoolExecutor, fn: Callable[..., T], /, *args, **kwargs
+) -> T:
+    """Run a blocking function in the given executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+async def map_chunks(
+    items: List[T],
+    chunk_size: int,
+    fn: Callable[[List[T]], Awaitable[Any]],
+    prefetch: int = 2,
+) -> AsyncIterator[Tuple[List[T], Any]]:
+    """Apply `fn` to consecutive chunks and yield `(chunk, result)` in order.
+
+    Up to `prefetch` chunks are in flight at once, so the next chunk is
+    already being computed while the caller consumes the current one.
+    """
+    pending: deque[Tuple[List[T], asyncio.Future]] = deque()
+    try:
+        for i in range(0, len(items), max(1, chunk_size)):
+            chunk = items[i : i + chunk_size]
+            pending.append((chunk, asyncio.ensure_future(fn(chunk))))
+            if len(pending) >= prefetch:
+                chunk, future = pending.popleft()
+                yield chunk, await future
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, await future
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def model_fingerprint(weights_path: Path) -> str:
+    """Identify a checkpoint by its location, size and modification time."""
+    stat = weights_path.stat()
+    return f"{weights_path.parent}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the sequence length of a text, including [CLS] and [SEP].
+
+    SikuRoBERTa has a character-level vocabulary, so the character count is an
+    upper bound on the number of tokens and avoids tokenizing twice.
+    """
+    return len(text) + 2
+
+
+def split_windows(length: int, window: int, overlap: int) -> List[Tuple[int, int]]:
+    """Split `range(length)` into overlapping `(start, end)` windows."""
+    if window <= 0 or not 0 <= overlap < window:
+        raise ValueError(f"Invalid window={window} / overlap={overlap}")
+    stride = window - overlap
+    spans = []
+    start = 0
+    while start + window < length:
+        spans.append((start, start + window))
+        start += stride
+    # Align the last window to the end so it keeps a full left context
+    spans.append((max(0, length - window), length))
+    return spans
+
+
+def _owned_ranges(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # Each position is owned by the window it is most central in: overlap
+    # zones are cut at their midpoint, so every prediction has full context
+    # on at least half the overlap on both sides.
+    cuts = [(nxt[0] + cur[1]) // 2 for cur, nxt in zip(spans, spans[1:])]
+    starts = [spans[0][0]] + cuts
+    ends = cuts + [spans[-1][1]]
+    return list(zip(starts, ends))
+
+
+def predict_windowed(
+    texts: List[str],
+    fn: Callable[[List[str]], List[List[Prediction]]],
+    window: int,
+    overlap: int,
+) -> List[List[Prediction]]:
+    """Run a token predictor over overlapping windows and stitch the results.
+
+    All windows of all texts are passed to `fn` as one batch. Predictions are
+    shifted back to character offsets of the original text and each one is
+    kept only from the window that owns its start position (see
+    `_owned_ranges`), so results are ordered and free of duplicates.
+    """
+    pieces: List[str] = []
+    index: List[Tuple[int, int, int, int]] = []
+    for i, text in enumerate(texts):
+        spans = split_windows(len(text), window=window, overlap=overlap)
+        for (start, end), (lo, hi) in zip(spans, _owned_ranges(spans)):
+            pieces.append(text[start:end])
+            index.append((i, start, lo, hi))
+
+    piece_predictions = fn(pieces)
+
+    results: List[List[Prediction]] = [[] for _ in texts]
+    for (i, start, lo, hi), predictions in zip(index, piece_predictions, strict=True):
+        results[i].extend(
+            (s + start, e + start, label_id)
+            for s, e, label_id in predictions
+            if lo <= s + start < hi
+        )
+    return results
+
+
+def bucketize(lengths: List[int], max_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """Group indices into length-sorted buckets for padded batching.
+
+    Indices are sorted by length and a bucket is closed when its padded size
+    (longest length times count) would exceed `max_tokens` or it holds
+    `max_batch_size` items. A single item longer than the budget gets its own
+    bucket.
+    """
+    buckets: List[List[int]] = []
+    current: List[int] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        if current and (
+            len(current) >= max_batch_size or (len(current) + 1) * lengths[i] > max_tokens
+        ):
+            buckets.append(current)
+            current = []
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+def predict_bucketed(
+    texts: List[str],
+    fn: Callable[[List[str]], List[Any]],
+    max_tokens: int = sconfig.BUCKET_MAX_TOKENS,
+    max_batch_size: int = sconfig.BUCKET_MAX_SIZE,
+) -> List[Any]:
+    """Run `fn` over length-bucketed batches and return results in input order."""
+    lengths = [estimate_tokens(text) for text in texts]
+    results: List[Any] = [None] * len(texts)
+    for bucket in bucketize(lengths, max_tokens=max_tokens, max_batch_size=max_batch_size):
+        outputs = fn([texts[i] for i in bucket])
+        for i, output in zip(bucket, outputs, strict=True):
+            results[i] = output
+    return results
+
+
+def encode_tokens(
+    texts: List[str], tokenizer, add_special_tokens: bool = True
+) -> List[Dict[str, List]]:
+    """Tokenize texts in one fast-tokenizer batch call.
+
+    Returns the tokens, token ids and character offsets of each text, with
+    special tokens included by default as in the model input (offsets (0, 0)).
+    """
+    with tokenizer_lock(tokenizer):
+        encoded = tokenizer(
+            texts,
+            add_special_tokens=add_special_tokens,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+    return [
+        {"tokens": e.tokens, "token_ids": e.ids, "offsets": e.offsets}
+        for e in encoded.encodings
+    ]
+
+
+# Held around the calls of each tokenizer: a fast tokenizer shared between
+# threads fails ("Already borrowed") if one call changes its truncation
+# settings mid-encode. Different tokenizers do not wait for each other
+_TOKENIZER_LOCKS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_TOKENIZER_LOCKS_LOCK = threading.Lock()
+
+
+def tokenizer_lock(tokenizer) -> threading.Lock:
+    """The lock to hold around calls of `tokenizer`."""
+    with _TOKENIZER_LOCKS_LOCK:
+        return _TOKENIZER_LOCKS.setdefault(tokenizer, threading.Lock())
+
+
+def _is_punctuation(ch: str) -> bool:
+    # As the BERT pre-tokenizer, which makes every such character a word
+    return (ch.isascii() and not ch.isalnum() and ch.isprintable() and ch != " ") or (
+        unicodedata.category(ch).startswith("P")
+    )
+
+
+class Encoder:
+    """A fast tokenizer plus an LRU of the model inputs it produced.
+
+    Models with the same vocabulary share one `Encoder` (see `shared_encoder`),
+    so a text tokenized for one model, e.g. punctuation restoration, is not
+    tokenized again when it reaches the other unchanged, and one with
+    punctuation added is derived from it (see `derive`).
+    """
+
+    def __init__(self, tokenizer, max_entries: int = sconfig.ENCODING_CACHE_ENTRIES):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.derived = 0
+        self._memory: OrderedDict[str, Tuple[np.ndarray, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Token ids of single punctuation characters, None if not one token
+        self._punctuation_ids: Dict[str, int | None] = {}
+        self._continues: np.ndarray | None = None
+
+    def _tokenize(self, texts: List[str]) -> List[Tuple[np.ndarray, ...]]:
+        with tokenizer_lock(self.tokenizer):
+            encoded = self.tokenizer(
+                texts,
+                truncation=True,
+                return_offsets_mapping=True,
+                return_special_tokens_mask=True,
+            )
+        return [
+            (
+                np.array(ids, dtype=np.int64),
+                np.array(type_ids, dtype=np.int64),
+                np.array(offsets, dtype=np.int64).reshape(-1, 2),
+                np.array(special, dtype=bool),
+            )
+            for ids, type_ids, offsets, special in zip(
+                encoded["input_ids"],
+                encoded["token_type_ids"],
+                encoded["offset_mapping"],
+                encoded["special_tokens_mask"],
+            )
+        ]
+
+    def _store(self, rows: Dict[str, Tuple[np.ndarray, ...]]) -> None:
+        with self._lock:
+            for text, row in rows.items():
+                self._memory[text] = row
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def encode(self, texts: List[str]) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """Return padded model inputs, token offsets and a mask of the text tokens.
+
+        Equivalent to one padded tokenizer call, but texts encoded before are
+        taken from the cache and only the rest are tokenized, in one batch.
+        """
+        rows: List[Tuple[np.ndarray, ...] | None] = [None] * len(texts)
+        with self._lock:
+            for i, text in enumerate(texts):
+                row = self._memory.get(text)
+                if row is not None:
+                    self._memory.move_to_end(text)
+                    rows[i] = row
+            missing = list(dict.fromkeys(t for t, row in zip(texts, rows) if row is None))
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            computed = dict(zip(missing, self._tokenize(missing)))
+            rows = [row if row is not None else computed[t] for t, row in zip(texts, rows)]
+            self._store(computed)
+
+        width = max(len(row[0]) for row in rows)
+        input_ids = np.full((len(rows), width), self.tokenizer.pad_token_id, dtype=np.int64)
+        token_type_ids = np.zeros((len(rows), width), dtype=np.int64)
+        attention_mask = np.zeros((len(rows), width), dtype=np.int64)
+        offsets = np.zeros((len(rows), width, 2), dtype=np.int64)
+        keep = np.zeros((len(rows), width), dtype=bool)
+        for i, (ids, type_ids, row_offsets, special) in enumerate(rows):
+            n = len(ids)
+            input_ids[i, :n] = ids
+            token_type_ids[i, :n] = type_ids
+            attention_mask[i, :n] = 1
+            offsets[i, :n] = row_offsets
+            keep[i, :n] = ~special
+        inputs = {
+            "input_ids": input_ids,
+            "token_type_ids": token_type_ids,
+            "attention_mask": attention_mask,
+        }
+        return inputs, offsets, keep
+
+    def _continuation_mask(self) -> np.ndarray | None:
+        # Per token id, whether it continues a word (WordPiece "##" tokens);
+        # None for tokenizers other than BERT's, whose words are not known
+        if self._continues is None:
+            backend = self.tokenizer.backend_tokenizer
+            prefix = getattr(backend.model, "continuing_subword_prefix", None)
+            if not prefix or not isinstance(backend.pre_tokenizer, BertPreTokenizer):
+                self._continues = np.zeros(0, dtype=bool)
+            else:
+                vocab = backend.get_vocab(with_added_tokens=True)
+                self._continues = np.zeros(max(vocab.values()) + 1, dtype=bool)
+                for token, token_id in vocab.items():
+                    self._continues[token_id] = token.startswith(prefix)
+        return self._continues if len(self._continues) else None
+
+    def _punctuation_id(self, ch: str) -> int | None:
+        if ch not in self._punctuation_ids:
+            with tokenizer_lock(self.tokenizer):
+                ids = self.tokenizer(ch, add_special_tokens=False)["input_ids"]
+            self._punctuation_ids[ch] = ids[0] if len(ids) == 1 else None
+        return self._punctuation_ids[ch]
+
+    def _splice(
+        self, text: str, base: str, row: Tuple[np.ndarray, ...]
+    ) -> Tuple[np.ndarray, ...] | None:
+        """The row of `text`, made by inserting characters into `base`, from the row of `base`.
+
+        None unless every inserted character is a space or a punctuation mark
+        that is one token, and each insertion falls between two words of
+        `base`: then the words of `base` are tokenized as before and the
+        marks become tokens of their own in between.
+        """
+        ids, type_ids, offsets, special = row
+        continues = self._continuation_mask()
+        if continues is None or len(ids) >= self.tokenizer.model_max_length:
+            return None
+        if len(text) <= len(base) or len(ids) <= 2:
+            return None
+        if not (special[0] and special[-1]) or special[1:-1].any():
+            return None
+
+        # Align `base` as a subsequence of `text`; the rest was inserted
+        base_to_text = np.empty(len(base) + 1, dtype=np.int64)
+        inserted: List[Tuple[int, int]] = []  # (position in text, position in base)
+        i = 0
+        for j, ch in enumerate(text):
+            if i < len(base) and ch == base[i]:
+                base_to_text[i] = j
+                i += 1
+            elif ch == " " or (_is_punctuation(ch) and self._punctuation_id(ch) is not None):
+                inserted.append((j, i))
+            else:
+                return None
+        if i < len(base):
+            return None
+        base_to_text[len(base)] = len(text)
+
+        # Insertion points must not split a token or a word of `base`
+        starts, ends = offsets[1:-1, 0], offsets[1:-1, 1]
+        positions = np.array([i for _, i in inserted], dtype=np.int64)
+        after = np.searchsorted(starts, positions, side="left")
+        within_token = (after > 0) & (ends[np.maximum(after - 1, 0)] > positions)
+        continued = continues[ids[1:-1]][np.minimum(after, len(starts) - 1)]
+        within_word = (after < len(starts)) & continued
+        if within_token.any() or within_word.any():
+            return None
+
+        tokens = [(j, k) for (j, _), k in zip(inserted, after) if text[j] != " "]
+        if len(ids) + len(tokens) > self.tokenizer.model_max_length:
+            return None
+        at = np.array([1 + k for _, k in tokens], dtype=np.int64)
+        marks = np.array([(j, j + 1) for j, _ in tokens], dtype=np.int64).reshape(-1, 2)
+        new_offsets = offsets.copy()
+        text_tokens = new_offsets[1:-1]
+        text_tokens[:, 0] = base_to_text[text_tokens[:, 0]]
+        text_tokens[:, 1] = base_to_text[np.maximum(text_tokens[:, 1] - 1, 0)] + 1
+        return (
+            np.insert(ids, at, [self._punctuation_id(text[j]) for j, _ in tokens]),
+            np.full(len(ids) + len(tokens), type_ids[0], dtype=np.int64),
+            np.insert(new_offsets, at, marks, axis=0),
+            np.insert(special, at, False),
+        )
+
+    def derive(self, texts: List[str], bases: List[str]) -> int:
+        """Cache the inputs of texts that are their base text with punctuation added.
+
+        Punctuation restoration only inserts marks (and spaces), so the
+        encoding of a punctuated text is taken from the cached one of the text
+        it was restored from, with the marks spliced in, instead of being
+        tokenized again. Texts already cached, whose base is not, or where the
+        marks would change how the base is tokenized are left to `encode`.
+        Returns the number of texts derived.
+        """
+        with self._lock:
+            pending = {
+                text: (base, self._memory[base])
+                for text, base in zip(texts, bases)
+                if text not in self._memory and base in self._memory
+            }
+        derived = {}
+        for text, (base, row) in pending.items():
+            spliced = self._splice(text, base, row)
+            if spliced is not None:
+                derived[text] = spliced
+        self._store(derived)
+        with self._lock:
+            self.derived += len(derived)
+        return len(derived)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "derived": self.derived,
+            "entries": len(self._memory),
+        }
+
+
+# Encoders by tokenizer definition; an encoder is dropped with the last model using it
+_ENCODERS: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_ENCODERS_LOCK = threading.Lock()
+
+
+def shared_encoder(tokenizer) -> Encoder:
+    """Return the `Encoder` of an identical tokenizer loaded before, else a new one.
+
+    Tokenizers are compared by their full serialized definition (vocabulary,
+    normalizer, pre-tokenizer) and maximum length, as the models load.
+    """
+    definition = f"{tokenizer.model_max_length}\0{tokenizer.backend_tokenizer.to_str()}"
+    key = hashlib.sha256(definition.encode("utf-8")).hexdigest()
+    with _ENCODERS_LOCK:
+        encoder = _ENCODERS.get(key)
+        if encoder is None:
+            encoder = _ENCODERS[key] = Encoder(tokenizer)
+        return encoder
+
+
+def forward_tokens(texts: List[str], model_info: Dict) -> List[List[Prediction]]:
+    """Run the model on one padded batch and return its non-"O" token labels.
+
+    Matches `pipeline("ner")` without aggregation: special and padding tokens
+    are dropped, the label is the argmax over the logits and offsets come from
+    the fast tokenizer, but without building a dict per token. Uses the ONNX
+    Runtime session instead of the PyTorch model when one is loaded.
+    """
+    task = model_info.get("task", "")
+
+    with smetrics.STAGE_SECONDS.time(task, "tokenize"):
+        encoded, offsets, keep = model_info["encoder"].encode(texts)
+
+    with smetrics.STAGE_SECONDS.time(task, "forward"):
+        if model_info.get("session") is not None:
+            label_ids = sort.run_session(model_info["session"], encoded).argmax(axis=-1)
+        else:
+            model = model_info["model"]
+            inputs = {k: torch.from_numpy(v).to(model.device) for k, v in encoded.items()}
+            with torch.inference_mode():
+                logits = model(**inputs).logits
+            label_ids = logits.argmax(dim=-1).cpu().numpy()
+    keep &= label_ids != model_info["o_id"]
+
+    results = []
+    for row in range(len(texts)):
+        (idx,) = np.nonzero(keep[row])
+        results.append(
+            list(
+                zip(
+                    offsets[row, idx, 0].tolist(),
+                    offsets[row, idx, 1].tolist(),
+                    label_ids[row, idx].tolist(),
+                )
+            )
+        )
+    return results
@@ -0,0 +1,221 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import IO, Awaitable, Callable, Dict, Iterable, List
+
+from loguru import logger
+
+# Processes one chunk of texts with the job's options, returns one dict per text
+Processor = Callable[[List[str], Dict], Awaitable[List[Dict]]]
+
+UNFINISHED = ("queued", "running")
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobStore:
+    """On-disk store of bulk jobs, one directory per job.
+
+    Each job directory holds `input.jsonl` (one JSON string per text),
+    `output.jsonl` (one JSON result per text, in input order) and
+    `meta.json`. The meta file records how far into both files the job has
+    got and is replaced atomically, so it is the checkpoint to resume from.
+    A process running a job holds an exclusive lock on its `job.lock`, which
+    the OS releases if the process dies.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, job_id: str) -> Path:
+        if not JOB_ID.fullmatch(job_id):
+            raise KeyError(f"Invalid job id: {job_id}")
+        return self.root / job_id
+
+    def input_path(self, job_id: str) -> Path:
+        return self._dir(job_id) / "input.jsonl"
+
+    def output_path(self, job_id: str) -> Path:
+        return self._dir(job_id) / "output.jsonl"
+
+    def create(self, task: str, options: Dict, texts: Iterable[str]) -> Dict:
+        """Write the input texts to disk and register a queued job."""
+        job_id = uuid.uuid4().hex
+        self._dir(job_id).mkdir(parents=True)
+        total = 0
+        try:
+            with self.input_path(job_id).open("w", encoding="utf-8") as f:
+                for text in texts:
+                    f.write(json.dumps(text, ensure_ascii=False) + "\n")
+                    total += 1
+        except Exception:
+            self.delete(job_id)
+            raise
+        self.output_path(job_id).touch()
+
+        meta = {
+            "id": job_id,
+            "task": task,
+            "options": options,
+            "status": "queued",
+            "total": total,
+            "done": 0,
+            "input_offset": 0,
+            "output_offset": 0,
+            "created_at": time.time(),
+            "finished_at": None,
+            "throughput": None,
+            "eta": None,
+            "error": None,
+        }
+        self.save(meta)
+        return meta
+
+    def get(self, job_id: str) -> Dict | None:
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        path = self._dir(job_id) / "meta.json"
+        if not path.is_file():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def save(self, meta: Dict) -> None:
+        path = self._dir(meta["id"]) / "meta.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def lock(self, job_id: str) -> IO | None:
+        """Take the job's lock without waiting; None if another process holds it or the job is gone.
+
+        The lock is held until the returned file is closed.
+        """
+        try:
+            f = (self._dir(job_id) / "job.lock").open("a")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def delete(self, job_id: str) -> None:
+        shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+    def unfinished(self) -> List[Dict]:
+        metas = [self.get(path.name) for path in self.root.iterdir()]
+        metas = [m for m in metas if m and m["status"] in UNFINISHED]
+        return sorted(metas, key=lambda m: m["created_at"])
+
+
+class JobRunner:
+    """Run queued jobs one at a time, checkpointing after every chunk."""
+
+    def __init__(self, store: JobStore, processors: Dict[str, Processor], chunk_size: int):
+        self.store = store
+        self.processors = processors
+        self.chunk_size = max(1, chunk_size)
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        # Resume jobs interrupted by a restart from their last checkpoint. Jobs
+        # that another live process is running hold their lock and are left to it
+        with (self.store.root / ".resume.lock").open("a") as scan_lock:
+            # Only serializes the scans of processes starting together
+            fcntl.flock(scan_lock, fcntl.LOCK_EX)
+            for meta in self.store.unfinished():
+                lock = self.store.lock(meta["id"])
+                if lock is None:
+                    continue
+                lock.close()
+                logger.debug(f"Resuming job {meta['id']} at {meta['done']}/{meta['total']}")
+                self.enqueue(meta["id"])
+        self._task = asyncio.create_task(self._loop(), name="job-runner")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def enqueue(self, job_id: str) -> None:
+        self._queue.put_nowait(job_id)
+
+    async def _loop(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                meta = self.store.get(job_id)
+                if meta:
+                    meta.update(status="failed", error=str(e), finished_at=time.time())
+                    self.store.save(meta)
+
+    def _read_chunk(self, f) -> List[str]:
+        texts = []
+        for _ in range(self.chunk_size):
+            line = f.readline()
+            if not line:
+                break
+            texts.append(json.loads(line))
+        return texts
+
+    async def _run(self, job_id: str) -> None:
+        # Run a job only while holding its lock, so no two processes run it at once
+        lock = self.store.lock(job_id)
+        if lock is None:
+            return
+        try:
+            await self._process(job_id)
+        finally:
+            lock.close()
+
+    async def _process(self, job_id: str) -> None:
+        meta = self.store.get(job_id)
+        if not meta or meta["status"] not in UNFINISHED:
+            return
+        processor = self.processors[meta["task"]]
+        meta["status"] = "running"
+        self.store.save(meta)
+
+        # Drop output written after the last checkpoint
+        output_path = self.store.output_path(job_id)
+        os.truncate(output_path, meta["output_offset"])
+
+        started, done_at_start = time.perf_counter(), meta["done"]
+        with (
+            self.store.input_path(job_id).open("r", encoding="utf-8") as fin,
+            output_path.open("a", encoding="utf-8") as fout,
+        ):
+            fin.seek(meta["input_offset"])
+            while texts := self._read_chunk(fin):
+                results = await processor(texts, meta["options"])
+                fout.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results))
+                fout.flush()
+
+                # Stop quietly if the job was deleted meanwhile
+                if self.store.get(job_id) is None:
+                    return
+
+                meta["done"] += len(texts)
+                meta["input_offset"] = fin.tell()
+                meta["output_offset"] = fout.tell()
+                throughput = (meta["done"] - done_at_start) / (time.perf_counter() - started)
+                meta["throughput"] = throughput
+                meta["eta"] = (meta["total"] - meta["done"]) / throughput if throughput else None
+                self.store.save(meta)
+
+        meta.update(status="done", eta=0.0, finished_at=time.time())
+        self.store.save(meta)
+        logger.debug(f"Job {job_id} done: {meta['done']} texts")
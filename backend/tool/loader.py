@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List
+
+import tool.metrics as smetrics
+from loguru import logger
+
+# Short texts run once through a freshly loaded model to allocate its buffers
+WARMUP_TEXTS = [
+    "太宗高宗之世屡欲立明堂诸儒议其制度不决而止",
+    "二月庚午毁乾元殿于其地作明堂以僧怀义为之使凡役数万人",
+]
+
+# Models loaded before the server started, e.g. by a pre-fork parent process
+PRELOADED: Dict[str, Any] = {}
+
+
+def preload(name: str, model: Any) -> None:
+    """Hand an already loaded model to the `ModelLoader` of the same name."""
+    PRELOADED[name] = model
+
+
+class ModelLoader:
+    """Load a model in a worker thread, at startup or on first use.
+
+    `start()` begins loading in the background so several models load
+    concurrently and the server does not wait for them; with `lazy=True`
+    loading is deferred until the first `get()`. `on_ready` runs on the
+    event loop once the model is loaded, before any `get()` returns. A model
+    registered with `preload()` is used as is instead of being loaded again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[], Any],
+        on_ready: Callable[[Any], None] | None = None,
+        warmup: Callable[[Any], Any] | None = None,
+        lazy: bool = False,
+    ):
+        self.name = name
+        self.load = load
+        self.on_ready = on_ready
+        self.warmup = warmup
+        self.lazy = lazy
+        self.state = "deferred" if lazy else "pending"
+        self.load_seconds: float | None = None
+        self.warmup_seconds: float | None = None
+        self.error: str | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if not self.lazy:
+            self._ensure_task()
+
+    async def stop(self) -> None:
+        # A load already running in its thread cannot be interrupted
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def get(self) -> Any:
+        """Return the loaded model, loading it now if it was deferred."""
+        return await asyncio.shield(self._ensure_task())
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "lazy": self.lazy,
+            "preloaded": self.name in PRELOADED,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+    def _ensure_task(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(self._load(), name=f"load-{self.name}")
+        return self._task
+
+    def _load_and_warmup(self) -> Any:
+        started = time.perf_counter()
+        model = PRELOADED.get(self.name)
+        if model is None:
+            model = self.load()
+        if model is None:
+            raise RuntimeError(f"No model files found for {self.name}")
+        self.load_seconds = time.perf_counter() - started
+        if self.warmup:
+            started = time.perf_counter()
+            self.warmup(model)
+            self.warmup_seconds = time.perf_counter() - started
+        return model
+
+    async def _load(self) -> Any:
+        logger.debug(f"Loading {self.name} model...")
+        self.state = "loading"
+        try:
+            model = await asyncio.to_thread(self._load_and_warmup)
+            if self.on_ready:
+                self.on_ready(model)
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            logger.error(f"Error loading {self.name} model: {str(e)}")
+            raise
+        self.state = "ready"
+        smetrics.MODEL_LOAD_SECONDS.set(self.name, value=self.load_seconds)
+        logger.debug(f"{self.name} model loaded in {self.load_seconds:.2f}s")
+        return model
+
+
+def health(loaders: Dict[str, ModelLoader | None]) -> Dict:
+    """Readiness of a set of models; deferred models do not block readiness."""
+    models = {
+        name: loader.status() if loader else {"state": "stopped"}
+        for name, loader in loaders.items()
+    }
+    ready = all(m["state"] in ("ready", "deferred") for m in models.values())
+    return {"status": "ok" if ready else "unavailable", "models": models}
+
+
+def warmup_fn(predict: Callable[..., Any], texts: List[str] = WARMUP_TEXTS):
+    """Warm-up callable running `predict(texts, model_info=model)` once."""
+    return lambda model: predict(texts, model_info=model)
@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Latency buckets in seconds, from tokenizer calls to whole long-text batches
+SECONDS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+TOKEN_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        header = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return header + self.collect()
+
+
+class Gauge(_Metric):
+    """Gauge set directly or read at scrape time from registered callbacks."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._callbacks: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, *values: str, value: float) -> None:
+        with self._lock:
+            self._values[values] = value
+
+    def set_function(self, *values: str, fn: Callable[[], float] | None) -> None:
+        """Read the value from `fn` at scrape time; None unregisters it."""
+        with self._lock:
+            if fn is None:
+                self._callbacks.pop(values, None)
+            else:
+                self._callbacks[values] = fn
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = dict(self._values)
+            callbacks = list(self._callbacks.items())
+        items.update((k, fn()) for k, fn in callbacks)
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in items.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *values: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class CounterFunction(Gauge):
+    """Counter whose values are read at scrape time, e.g. from existing stats."""
+
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = SECONDS_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *values: str, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(values)
+            if entry is None:
+                entry = self._values[values] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    @contextmanager
+    def time(self, *values: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*values, value=time.perf_counter() - start)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total[0]) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labels, key, extra=f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+# Backend metrics, shared by the routers and labelled by task ("punc", "ner", "mt",
+# "dict" or "normalize")
+STAGE_SECONDS = Histogram(
+    "hanja_stage_seconds",
+    "Time per pipeline stage: queue, tokenize, forward, align, xml, build, serialize, "
+    "segment, translate, lookup, normalize.",
+    labels=("task", "stage"),
+)
+BATCH_SIZE = Histogram(
+    "hanja_batch_size", "Texts per model batch.", labels=("task",), buckets=COUNT_BUCKETS
+)
+BATCH_TOKENS = Histogram(
+    "hanja_batch_tokens",
+    "Estimated tokens per model batch.",
+    labels=("task",),
+    buckets=TOKEN_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("hanja_queue_depth", "Texts waiting in the batcher queue.", labels=("task",))
+CACHE_REQUESTS = CounterFunction(
+    "hanja_cache_requests_total",
+    "Result cache lookups by outcome: hit, disk_hit, miss, coalesced.",
+    labels=("task", "result"),
+)
+CACHE_ENTRIES = Gauge(
+    "hanja_cache_entries", "Entries in the in-memory result cache.", labels=("task",)
+)
+MODEL_LOAD_SECONDS = Gauge(
+    "hanja_model_load_seconds",
+    "Time taken to load each model, by task or task@version.",
+    labels=("task",),
+)
+ADMISSION_REJECTED = Counter(
+    "hanja_admission_rejected_total",
+    "Requests turned away by admission control: texts, tokens, rate, queue.",
+    labels=("lane", "reason"),
+)
+QUEUED_TOKENS = Gauge(
+    "hanja_queued_tokens", "Estimated tokens waiting in the batcher queue.", labels=("task", "lane")
+)
+
+REGISTRY = [
+    STAGE_SECONDS,
+    BATCH_SIZE,
+    BATCH_TOKENS,
+    QUEUE_DEPTH,
+    CACHE_REQUESTS,
+    CACHE_ENTRIES,
+    MODEL_LOAD_SECONDS,
+    ADMISSION_REJECTED,
+    QUEUED_TOKENS,
+]
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def register_cache(task: str, cache) -> None:
+    """Expose the counters of a ResultCache; None unregisters them."""
+    outcomes = {"hits": "hit", "disk_hits": "disk_hit", "misses": "miss", "coalesced": "coalesced"}
+    for stat, result in outcomes.items():
+        fn = (lambda stat=stat: cache.stats()[stat]) if cache else None
+        CACHE_REQUESTS.set_function(task, result, fn=fn)
+    CACHE_ENTRIES.set_function(task, fn=(lambda: cache.stats()["entries"]) if cache else None)
+
+
+def render() -> str:
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import re
+import unicodedata
+from typing import AsyncIterator, Dict, List
+
+import httpx
+import tool.config as sconfig
+
+# Sentence-final marks, with any closing quotes or brackets and the whitespace after them
+SENTENCE_END = re.compile(r"[。？！?!;；．.][」』”’\"')）》〉]*\s*|\n\s*")
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def has_punctuation(text: str) -> bool:
+    return any(unicodedata.category(c)[0] == "P" for c in text)
+
+
+def split_at(text: str, ends: List[int]) -> List[str]:
+    """Cut `text` after each offset in `ends`, keeping every character."""
+    segments, prev = [], 0
+    for end in ends:
+        if prev < end < len(text):
+            segments.append(text[prev:end])
+            prev = end
+    segments.append(text[prev:])
+    return segments
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split at sentence-final punctuation and line breaks; `"".join()` restores `text`."""
+    return [s for s in split_at(text, [m.end() for m in SENTENCE_END.finditer(text)]) if s]
+
+
+def split_long(segment: str, max_length: int) -> List[str]:
+    """Cut a segment the model could not split into pieces of at most `max_length`."""
+    if len(segment) <= max_length:
+        return [segment]
+    return [segment[i : i + max_length] for i in range(0, len(segment), max_length)]
+
+
+def separator(segment: str) -> str:
+    """What follows the translation of `segment`: its line breaks, else a space."""
+    newlines = segment[len(segment.rstrip()) :].count("\n")
+    return "\n" * newlines if newlines else " "
+
+
+def build_messages(text: str, source_lang: str, target_lang: str) -> List[Dict[str, str]]:
+    # Same prompt the model was fine-tuned with
+    prompt = (
+        f"Translate the following text from {source_lang} into {target_lang}.\n"
+        f"{source_lang}: {text}\n{target_lang}: "
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+class MTClient:
+    """Pooled async client for the chat completions API of a vLLM server.
+
+    Connections are kept alive and reused across requests. Up to
+    `max_concurrency` completions are in flight at once, which vLLM's
+    continuous batching serves together. `transport` replaces the network,
+    e.g. with an `httpx.MockTransport` in tests.
+    """
+
+    def __init__(
+        self,
+        base_url: str = sconfig.VLLM_BASE_URL,
+        api_key: str | None = sconfig.VLLM_API_KEY,
+        model: str = sconfig.MT_MODEL,
+        max_concurrency: int = sconfig.MT_MAX_CONCURRENCY,
+        timeout: float = sconfig.MT_TIMEOUT_S,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.model = model
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_concurrency, max_keepalive_connections=max_concurrency
+            ),
+            transport=transport,
+        )
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def _body(self, text: str, source_lang: str, target_lang: str) -> Dict:
+        return {
+            "model": self.model,
+            "messages": build_messages(text, source_lang, target_lang),
+            "temperature": 0,
+            "seed": 42,
+            "frequency_penalty": 0.4,
+        }
+
+    async def translate(self, text: str, source_lang: str, target_lang: str) -> str:
+        async with self._slots:
+            response = await self._client.post(
+                "chat/completions", json=self._body(text, source_lang, target_lang)
+            )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+
+    async def translate_stream(
+        self, text: str, source_lang: str, target_lang: str
+    ) -> AsyncIterator[str]:
+        """Translate `text`, yielding the translation as the model generates it.
+
+        The pieces join up into what `translate` returns: whitespace at either
+        end is dropped, so trailing whitespace is held back until more text
+        follows it.
+        """
+        body = {**self._body(text, source_lang, target_lang), "stream": True}
+        async with self._slots, self._client.stream("POST", "chat/completions", json=body) as response:
+            response.raise_for_status()
+            started, pending = False, ""
+            # Server-sent events, one "data: {chunk}" line each, then "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0]["delta"].get("content") or ""
+                piece = pending + delta
+                head = piece.rstrip()
+                pending = piece[len(head) :]
+                if not started:
+                    head = head.lstrip()
+                if head:
+                    started = True
+                    yield head
+
+    async def translate_batch(
+        self, texts: List[str], source_lang: str, target_lang: str
+    ) -> List[str]:
+        """Translate texts concurrently, in order."""
+        return list(
+            await asyncio.gather(
+                *(self.translate(text, source_lang, target_lang) for text in texts)
+            )
+        )
@@ -1,8 +1,14 @@
 import sys
+from functools import partial
 from importlib import reload
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import tool.config as sconfig
+import tool.corpus as scorpus
+import tool.infer as sinfer
+import tool.ort as sort
 import tool.root as sroot
 import torch
 import typer
@@ -10,12 +16,11 @@ from huggingface_hub import snapshot_download
 from loguru import logger
 from rich import pretty
 from transformers import (
+    AutoConfig,
     AutoModelForTokenClassification,
     AutoTokenizer,
     BertForTokenClassification,
     BertTokenizerFast,
-    TokenClassificationPipeline,
-    pipeline,
 )
 
 # Constants
@@ -24,6 +29,9 @@ MODEL_PATH = sroot.MODEL_DIR / "ner"
 MAX_LENGTH = 512
 NER_PREFIX = "▪"  # prefix for inline XML tags
 
+# (start, end, entity label id) of an entity, end exclusive
+Span = Tuple[int, int, int]
+
 
 def _iob2xml(tokens: list[str], ner_tags: list[str]) -> str:
     """Convert IOB tags to XML format."""
@@ -65,8 +73,13 @@ def download_model(model_tag: str, model_path: str | Path) -> None:
     )
 
 
-def load_model(model_path: str | Path, device: str = "cpu") -> Dict:
-    """Load NER model and tokenizer."""
+def load_model(
+    model_path: str | Path,
+    device: str = "cpu",
+    backend: str = "torch",
+    quantize: bool = False,
+) -> Dict:
+    """Load NER model and tokenizer (PyTorch or ONNX Runtime backend)."""
     model_path = Path(model_path)
 
     # Determine torch dtype based on device
@@ -85,65 +98,170 @@ def load_model(model_path: str | Path, device: str = "cpu") -> Dict:
     hface_path = fnames[0].parent
 
     # Load model and tokenizer
+    model_id = sinfer.model_fingerprint(fnames[0])
     tokenizer: BertTokenizerFast = AutoTokenizer.from_pretrained(
         hface_path, model_max_length=MAX_LENGTH
     )
-    model: BertForTokenClassification = AutoModelForTokenClassification.from_pretrained(
-        hface_path, device_map=device, torch_dtype=torch_dtype
-    )
-    model.eval()
-
-    # Log model device
-    logger.debug(f"Model device: {model.device}")
+    encoder = sinfer.shared_encoder(tokenizer)
+    tokenizer = encoder.tokenizer
+    config = AutoConfig.from_pretrained(hface_path)
+    model: BertForTokenClassification | None = None
+    session = None
+    if backend == "onnx":
+        session = sort.load_session(
+            hface_path, name="ner", model_id=model_id, quantize=quantize
+        )
+    elif backend == "torch":
+        model = AutoModelForTokenClassification.from_pretrained(
+            hface_path, device_map=device, torch_dtype=torch_dtype
+        )
+        model.eval()
+
+        # Log model device
+        logger.debug(f"Model device: {model.device}")
+    else:
+        raise ValueError(f"Unsupported backend: {backend}")
 
-    # Create pipeline
-    pipe: TokenClassificationPipeline = pipeline(
-        task="ner", model=model, tokenizer=tokenizer
+    # Label tables, indexed by label id
+    id2label = np.array(
+        [config.id2label[i] for i in range(config.num_labels)], dtype=object
     )
+    id2inside = np.array(["I" + label[1:] for label in id2label], dtype=object)
+
+    # Entity label table (types without B-/I-) and model label id -> entity id
+    entity_labels = sorted(set(label[2:] for label in id2label if label != "O"))
+    id2entity = [entity_labels.index(label[2:]) if label != "O" else -1 for label in id2label]
+    id2begin = [label.startswith("B-") for label in id2label]
 
     return {
+        "task": "ner",
         "model": model,
+        "session": session,
+        "config": config,
         "tokenizer": tokenizer,
-        "pipe": pipe,
+        "encoder": encoder,
+        "id2label": id2label,
+        "id2inside": id2inside,
+        "entity_labels": entity_labels,
+        "id2entity": id2entity,
+        "id2begin": id2begin,
+        "o_id": config.label2id["O"],
+        "model_id": model_id,
+        "backend": f"{backend}-int8" if session and quantize else backend,
         "model_path": str(model_path),
         "device": device,
         "torch_dtype": torch_dtype,
     }
 
 
-def _convert_to_ner_tags(text: str, pipe_result: list[dict]) -> list[str]:
-    """Convert pipeline results to IOB format tags."""
-    ner_tags = ["O"] * len(text)
-    for p in pipe_result:
-        start, end = p["start"], p["end"]
-        # For 'B-' prefix, only the start position gets this tag
-        ner_tags[start] = p["entity"]
-        # For 'I-' prefix, all positions after the start till the end get this tag
-        for i in range(start + 1, end):
-            ner_tags[i] = "I" + p["entity"][1:]
-    return ner_tags
+def _convert_to_ner_tags(
+    text: str, predictions: list[sinfer.Prediction], model_info: Dict
+) -> list[str]:
+    """Convert token predictions to IOB format tags."""
+    ner_tags = np.full(len(text), "O", dtype=object)
+    if not predictions:
+        return ner_tags.tolist()
+
+    starts, ends, ids = np.array(predictions).T
+    # For 'B-' prefix, only the start position gets this tag
+    ner_tags[starts] = model_info["id2label"][ids]
+    # For 'I-' prefix, all positions after the start till the end get this tag
+    # (only multi-character tokens, e.g. Latin words or numbers)
+    (multi,) = np.nonzero(ends - starts > 1)
+    for start, end, label_id in zip(starts[multi], ends[multi], ids[multi]):
+        ner_tags[start + 1 : end] = model_info["id2inside"][label_id]
+    return ner_tags.tolist()
+
+
+def predict_raw(
+    texts: List[str],
+    model_info: Dict,
+    window: int = sconfig.WINDOW_LENGTH,
+    overlap: int = sconfig.WINDOW_OVERLAP,
+) -> List[List[sinfer.Prediction]]:
+    """Run the model on a batch of texts and return per-token predictions.
+
+    Texts longer than `window` characters are split into windows overlapping
+    by `overlap` characters and stitched back by character offset. Windows
+    are run in length-sorted buckets to keep padding to a minimum.
+    """
+    return sinfer.predict_windowed(
+        texts,
+        fn=partial(
+            sinfer.predict_bucketed,
+            fn=partial(sinfer.forward_tokens, model_info=model_info),
+        ),
+        window=min(window, MAX_LENGTH - 2),
+        overlap=overlap,
+    )
 
 
-def predict_batch_iob(
-    texts: List[str], model_info: Dict
+def convert_raw_to_iob(
+    texts: List[str], predictions: List[List[sinfer.Prediction]], model_info: Dict
 ) -> List[Tuple[str, List[str]]]:
-    """Predict NER tags for a batch of texts and return IOB tags."""
-    pipe = model_info["pipe"]
-
-    # Get predictions from model
-    pipe_results = pipe(texts)
-
-    # Convert predictions to IOB format
+    """Convert per-token predictions to IOB tags."""
     results = []
-    for text, pipe_result in zip(texts, pipe_results, strict=True):
+    for text, text_predictions in zip(texts, predictions, strict=True):
         # Convert to IOB tags
-        ner_tags = _convert_to_ner_tags(text, pipe_result)
+        ner_tags = _convert_to_ner_tags(text, text_predictions, model_info)
         assert len(text) == len(ner_tags), "Length mismatch between text and NER tags"
         results.append((text, ner_tags))
 
     return results
 
 
+def _merge_spans(predictions: List[sinfer.Prediction], model_info: Dict) -> List[Span]:
+    """Merge token predictions into entity spans, as _iob2xml would group them.
+
+    A B- token opens an entity; an I- token directly adjacent to an open
+    entity extends it, whatever its type; any gap (an "O" character) closes it.
+    """
+    id2entity, id2begin = model_info["id2entity"], model_info["id2begin"]
+    spans: List[Span] = []
+    open_span: List[int] | None = None
+    for start, end, label_id in predictions:
+        if id2begin[label_id]:
+            if open_span:
+                spans.append(tuple(open_span))
+            open_span = [start, end, id2entity[label_id]]
+        elif open_span and start <= open_span[1]:
+            open_span[1] = end
+        else:
+            if open_span:
+                spans.append(tuple(open_span))
+            open_span = None
+    if open_span:
+        spans.append(tuple(open_span))
+    return spans
+
+
+def convert_raw_to_spans(
+    predictions: List[List[sinfer.Prediction]], model_info: Dict
+) -> List[List[Span]]:
+    """Convert per-token predictions to entity spans without per-character tags."""
+    return [_merge_spans(text_predictions, model_info) for text_predictions in predictions]
+
+
+def spans_to_xml(text: str, spans: List[Span], entity_labels: List[str]) -> str:
+    """Render entity spans as inline XML, identical to _iob2xml on the IOB tags."""
+    pieces = []
+    prev = 0
+    for start, end, entity_id in spans:
+        tag = NER_PREFIX + entity_labels[entity_id]
+        pieces.append(f"{text[prev:start]}<{tag}>{text[start:end]}</{tag}>")
+        prev = end
+    pieces.append(text[prev:])
+    return "".join(pieces)
+
+
+def predict_batch_iob(
+    texts: List[str], model_info: Dict
+) -> List[Tuple[str, List[str]]]:
+    """Predict NER tags for a batch of texts and return IOB tags."""
+    predictions = predict_raw(texts=texts, model_info=model_info)
+    return convert_raw_to_iob(texts=texts, predictions=predictions, model_info=model_info)
+
+
 def convert_iob_to_xml(text_iob_pairs: List[Tuple[str, List[str]]]) -> List[str]:
     """Convert IOB tags to XML format."""
     predictions = []
@@ -153,12 +271,36 @@ def convert_iob_to_xml(text_iob_pairs: List[Tuple[str, List[str]]]) -> List[str]
     return predictions
 
 
-def main():
+def main(
+    input_path: Optional[Path] = None,
+    output_path: Optional[Path] = None,
+    workers: int = 1,
+    threads: int = 0,
+    chunk_size: int = 256,
+    output_format: str = "jsonl",
+):
     # Download model
     model_tag = MODEL_TAG
     model_path = MODEL_PATH
     download_model(model_tag=model_tag, model_path=model_path)
 
+    # Process a corpus file (TXT or JSONL) instead of the example below
+    if input_path:
+        if not output_path:
+            raise typer.BadParameter("--output-path is required with --input-path")
+        scorpus.run_corpus(
+            task="ner",
+            model_path=model_path,
+            input_path=input_path,
+            output_path=output_path,
+            workers=workers,
+            threads=threads,
+            chunk_size=chunk_size,
+            output_format=output_format,
+            options=None,
+        )
+        return
+
     # Load model
     device = "cpu"
     model_info = load_model(model_path=model_path, device=device)
@@ -190,4 +332,5 @@ if __name__ == "__main__":
     else:
         with logger.catch(onerror=lambda _: sys.exit(1)):
             # python -m tool.ner
+            # python -m tool.ner --input-path corpus.txt --output-path out.jsonl --workers 4
             typer.run(main)
@@ -0,0 +1,219 @@
+import re
+import sys
+import time
+import unicodedata
+from functools import cache
+from importlib import reload
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+import tool.root as sroot
+import typer
+from loguru import logger
+from rich import pretty
+
+# Punctuation folded after NFKC, as normalizeStr in frontend/app/lib/normalize.ts
+PUNC_MAP: Dict[str, str] = {
+    "“": '"',  # LeftDoubleQuotationMark
+    "”": '"',  # RightDoubleQuotationMark
+    "‟": '"',  # DoubleHigh-Reversed-9QuotationMark
+    "‘": "'",  # LeftSingleQuotationMark
+    "’": "'",  # RightSingleQuotationMark
+    "‐": "-",  # Hyphen
+    "–": "-",  # EnDash
+    "—": "-",  # EmDash
+    "―": "-",  # HorizontalBar
+    "−": "-",  # MinusSign
+    "∶": ":",  # Ratio
+    "ᆞ": "·",  # HangulJungseongAraea
+    "∙": "·",  # BulletOperator
+    "⋅": "·",  # DotOperator
+    "・": "·",  # KatakanaMiddleDot
+    "ㆍ": "·",  # HangulLetterAraea
+}
+PUNC_TABLE = str.maketrans(PUNC_MAP)
+# Horizontal whitespace runs; newlines are kept
+SPACES = re.compile(r"[^\S\n]+")
+
+MAX_CODE_POINT = sys.maxunicode + 1
+# Above this every code point is unchanged by NFKC, starts a segment and is
+# neither punctuation, separator nor whitespace (planes 3-16: CJK extensions
+# G and later, tags, variation selectors, private use), so the tables are
+# only computed below it
+SCAN_LIMIT = 0x30000
+# Joins the texts of a batch; NFKC, folding and whitespace leave it alone
+SEPARATOR = "\x00"
+
+
+class Tables(NamedTuple):
+    # NFKC and punctuation folding of a code point, where that is one code point
+    single: np.ndarray
+    # The code point maps to `single` whatever follows it (see `tables`)
+    simple: np.ndarray
+    # Normalization can be split before this code point
+    boundary: np.ndarray
+    # Whitespace other than newline
+    space: np.ndarray
+    # Unicode category P* (punctuation) or Z* (separators)
+    punc: np.ndarray
+
+
+def fold(text: str) -> str:
+    """The reference normalization: NFKC, whitespace runs, punctuation folding, trim."""
+    text = unicodedata.normalize("NFKC", text)
+    text = SPACES.sub(" ", text)
+    return text.translate(PUNC_TABLE).strip()
+
+
+@cache
+def tables() -> Tables:
+    """Per-code-point lookup tables, computed once per process.
+
+    NFKC(a + b) is NFKC(a) + NFKC(b) when b starts with a boundary: a code
+    point whose decomposition starts with a starter (combining class 0) that
+    never composes with what precedes it. Text therefore normalizes segment
+    by segment, each segment being a boundary followed by non-boundaries;
+    almost all segments are a single code point, which the tables map
+    directly.
+    """
+    # Second code points of canonical compositions, and Hangul vowels and trailing consonants
+    seconds = set(range(0x1161, 0x1176)) | set(range(0x11A8, 0x11C3))
+    for c in range(SCAN_LIMIT):
+        decomposition = unicodedata.decomposition(chr(c)).split()
+        if len(decomposition) == 2 and not decomposition[0].startswith("<"):
+            seconds.add(int(decomposition[1], 16))
+
+    single = np.arange(MAX_CODE_POINT, dtype=np.uint32)
+    simple = np.ones(MAX_CODE_POINT, dtype=bool)
+    boundary = np.ones(MAX_CODE_POINT, dtype=bool)
+    space = np.zeros(MAX_CODE_POINT, dtype=bool)
+    punc = np.zeros(MAX_CODE_POINT, dtype=bool)
+    for c in range(SCAN_LIMIT):
+        char = chr(c)
+        decomposed = unicodedata.normalize("NFKD", char)
+        first = ord(decomposed[0])
+        boundary[c] = unicodedata.combining(decomposed[0]) == 0 and first not in seconds
+        normalized = unicodedata.normalize("NFKC", char).translate(PUNC_TABLE)
+        if len(normalized) == 1:
+            single[c] = ord(normalized)
+        else:
+            simple[c] = False
+        space[c] = char.isspace() and char != "\n"
+        punc[c] = unicodedata.category(char)[0] in "PZ"
+    simple &= boundary
+    return Tables(single=single, simple=simple, boundary=boundary, space=space, punc=punc)
+
+
+def _codes(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def _text(codes: np.ndarray) -> str:
+    return codes.astype(np.uint32, copy=False).tobytes().decode("utf-32-le")
+
+
+def _normalize(text: str) -> str:
+    maps = tables()
+    codes = _codes(text)
+    if not len(codes):
+        return ""
+
+    # A code point maps on its own when it and the next one are both boundaries
+    simple = maps.simple[codes]
+    simple[:-1] &= maps.boundary[codes[1:]]
+    out = maps.single[codes]
+    if not simple.all():
+        # Normalize the segments around the rest, one by one
+        starts = np.flatnonzero(maps.boundary[codes])
+        segment = np.searchsorted(starts, np.flatnonzero(~simple), side="right") - 1
+        bounds = np.append(starts, len(codes))
+        pieces, done = [], 0
+        for i in np.unique(segment).tolist():
+            start = int(bounds[i]) if i >= 0 else 0
+            end = int(bounds[i + 1])
+            pieces.append(out[done:start])
+            normalized = unicodedata.normalize("NFKC", text[start:end])
+            pieces.append(_codes(normalized.translate(PUNC_TABLE)))
+            done = end
+        pieces.append(out[done:])
+        out = np.concatenate(pieces)
+
+    # Collapse runs of horizontal whitespace into one space
+    space = maps.space[out]
+    if space.any():
+        keep = ~space
+        keep[1:] |= ~space[:-1]
+        out = np.where(space, np.uint32(0x20), out)[keep]
+    return _text(out)
+
+
+def normalize(text: str) -> str:
+    """Normalize a text like normalizeStr in the frontend (see `fold`), in vectorized passes."""
+    return _normalize(text).strip()
+
+
+def normalize_batch(texts: List[str]) -> List[str]:
+    """Normalize texts in one pass over their concatenation."""
+    joined = SEPARATOR.join(texts)
+    if not texts or joined.count(SEPARATOR) != len(texts) - 1:
+        return [normalize(text) for text in texts]
+    return [text.strip() for text in _normalize(joined).split(SEPARATOR)]
+
+
+def remove_punc(text: str) -> str:
+    """Drop punctuation and separators (Unicode categories P* and Z*)."""
+    codes = _codes(text)
+    return _text(codes[~tables().punc[codes]])
+
+
+def remove_punc_batch(texts: List[str]) -> List[str]:
+    """Remove punctuation from texts in one pass over their concatenation."""
+    joined = SEPARATOR.join(texts)
+    if not texts or joined.count(SEPARATOR) != len(texts) - 1:
+        return [remove_punc(text) for text in texts]
+    return remove_punc(joined).split(SEPARATOR)
+
+
+def _remove_punc_per_char(text: str) -> str:
+    return "".join(c for c in text if unicodedata.category(c)[0] not in "PZ")
+
+
+def main(megabytes: int = 4, repeats: int = 3):
+    """Time normalization of a random punctuated text against the per-character versions."""
+    started = time.perf_counter()
+    tables()
+    logger.info(f"Tables built in {time.perf_counter() - started:.2f}s")
+
+    rng = np.random.default_rng(0)
+    length = megabytes * 1_000_000 // 3
+    codes = rng.integers(0x4E00, 0x9FA6, size=length)
+    marks = np.array([ord(c) for c in "，。、：“”—・　 \n"])
+    where = rng.random(length) < 0.15
+    codes[where] = rng.choice(marks, size=where.sum())
+    text = "".join(map(chr, codes))
+    size = len(text.encode("utf-8")) / 1e6
+
+    for name, fn, reference in [
+        ("normalize", normalize, fold),
+        ("remove_punc", remove_punc, _remove_punc_per_char),
+    ]:
+        results = {}
+        for label, f, runs in ((name, fn, repeats), (f"{name} per character", reference, 1)):
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                results[label] = f(text)
+                timings.append(time.perf_counter() - started)
+            elapsed = min(timings)
+            logger.info(f"{label}: {size:.1f} MB in {elapsed * 1000:.1f} ms ({size / elapsed:.0f} MB/s)")
+        logger.info(f"{name} same as per character: {len(set(results.values())) == 1}")
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # python -m tool.normalize --megabytes 4
+            typer.run(main)
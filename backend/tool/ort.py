@@ -0,0 +1,187 @@
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+from importlib import reload
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import tool.root as sroot
+import torch
+import typer
+from loguru import logger
+from rich import pretty
+from transformers import AutoModelForTokenClassification, BertForTokenClassification
+
+# Exported models are cached next to the PyTorch checkpoints
+ONNX_DIR = sroot.MODEL_DIR / "onnx"
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+def onnx_path(name: str, model_id: str, quantize: bool) -> Path:
+    """Location of the exported model; a new checkpoint gets a new directory."""
+    digest = hashlib.sha256(model_id.encode("utf-8")).hexdigest()[:16]
+    fname = "model.int8.onnx" if quantize else "model.onnx"
+    return ONNX_DIR / name / digest / fname
+
+
+def _tmp_path(path: Path) -> Path:
+    # Written next to `path` and moved into place, so an interrupted export
+    # never leaves a truncated model where `load_session` would pick it up
+    return path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+
+def export_onnx(hface_path: str | Path, path: str | Path) -> None:
+    """Export a token-classification checkpoint to ONNX with dynamic batch and length."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(path)
+    model: BertForTokenClassification = AutoModelForTokenClassification.from_pretrained(
+        hface_path, torch_dtype=torch.float32
+    )
+    model.eval()
+
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"}
+    try:
+        with torch.inference_mode():
+            torch.onnx.export(
+                model,
+                (dummy, dummy, torch.zeros_like(dummy)),
+                str(tmp),
+                input_names=INPUT_NAMES,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                dynamo=False,
+            )
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.debug(f"Exported ONNX model to {path}")
+
+
+def quantize_onnx(src: str | Path, dst: str | Path) -> None:
+    """Apply dynamic int8 quantization to the weights of an exported model."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    dst = Path(dst)
+    tmp = _tmp_path(dst)
+    try:
+        quantize_dynamic(str(src), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, dst)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.debug(f"Quantized ONNX model to {dst}")
+
+
+def load_session(
+    hface_path: str | Path, name: str, model_id: str, quantize: bool = False
+):
+    """Create an ONNX Runtime session, exporting the checkpoint on first use."""
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("onnxruntime is required for the onnx backend") from e
+
+    fp32_path = onnx_path(name, model_id, quantize=False)
+    if not fp32_path.is_file():
+        export_onnx(hface_path, fp32_path)
+    path = fp32_path
+    if quantize:
+        path = onnx_path(name, model_id, quantize=True)
+        if not path.is_file():
+            quantize_onnx(fp32_path, path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = ort.InferenceSession(
+        str(path), sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    logger.debug(f"Loaded ONNX session from {path}")
+    return session
+
+
+def run_session(session, encoded: Dict[str, np.ndarray]) -> np.ndarray:
+    """Run the session on tokenizer output and return the logits."""
+    feeds = {name: encoded[name].astype(np.int64) for name in INPUT_NAMES}
+    (logits,) = session.run(["logits"], feeds)
+    return logits
+
+
+def _rss_mb() -> float:
+    # Resident set size of this process, from /proc (Linux only)
+    pages = int(Path("/proc/self/statm").read_text().split()[1])
+    return pages * 4096 / 2**20
+
+
+def _measure(task: str, backend: str, quantize: bool, texts: List[str], repeat: int):
+    # Runs in a fresh process so load memory is not shared between backends
+    import tool.ner as sner
+    import tool.punc as spunc
+
+    tool = spunc if task == "punc" else sner
+    rss = _rss_mb()
+    model_info = tool.load_model(
+        model_path=tool.MODEL_PATH, device="cpu", backend=backend, quantize=quantize
+    )
+    load_mb = _rss_mb() - rss
+
+    predictions = tool.predict_raw(texts=texts, model_info=model_info)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tool.predict_raw(texts=texts, model_info=model_info)
+        timings.append(time.perf_counter() - start)
+    return predictions, load_mb, float(np.median(timings))
+
+
+def main(
+    task: str = "punc",
+    quantize: bool = True,
+    num_texts: int = 64,
+    text_length: int = 128,
+    repeat: int = 5,
+):
+    """Compare the ONNX Runtime backend against PyTorch: label parity, latency, memory."""
+    rng = np.random.default_rng(42)
+    texts = [
+        "".join(chr(c) for c in rng.integers(0x4E00, 0x9FA5, size=text_length))
+        for _ in range(num_texts)
+    ]
+
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    for backend, quant in [("torch", False), ("onnx", False), ("onnx", True)]:
+        if quant and not quantize:
+            continue
+        label = f"{backend}{'-int8' if quant else ''}"
+        with ctx.Pool(1) as pool:
+            runs[label] = pool.apply(_measure, (task, backend, quant, texts, repeat))
+
+    reference, ref_mb, ref_sec = runs["torch"]
+    ref_tokens = {(i, p[0]): p[2] for i, preds in enumerate(reference) for p in preds}
+    for label, (predictions, load_mb, sec) in runs.items():
+        tokens = {(i, p[0]): p[2] for i, preds in enumerate(predictions) for p in preds}
+        keys = ref_tokens.keys() | tokens.keys()
+        agree = sum(ref_tokens.get(k) == tokens.get(k) for k in keys) / max(1, len(keys))
+        same = sum(a == b for a, b in zip(reference, predictions))
+        print(
+            f"{label:<11} load {load_mb:7.1f} MB | batch {sec * 1000:8.1f} ms"
+            f" ({ref_sec / sec:4.2f}x) | label agreement {agree:.2%}"
+            f" | identical texts {same}/{len(texts)}"
+        )
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # python -m tool.ort --task ner
+            typer.run(main)
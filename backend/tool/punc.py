@@ -1,10 +1,16 @@
 import json
 import sys
-import unicodedata
+from functools import partial
 from importlib import reload
 from pathlib import Path
-from typing import Dict, List, Tuple
-
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import tool.config as sconfig
+import tool.corpus as scorpus
+import tool.infer as sinfer
+import tool.normalize as snormalize
+import tool.ort as sort
 import tool.root as sroot
 import torch
 import typer
@@ -12,11 +18,11 @@ from huggingface_hub import snapshot_download
 from loguru import logger
 from rich import pretty
 from transformers import (
+    AutoConfig,
     AutoModelForTokenClassification,
     AutoTokenizer,
     BertForTokenClassification,
     BertTokenizerFast,
-    pipeline,
 )
 
 MODEL_TAG = "seyoungsong/SikuRoBERTa-PUNC-AJD-KLC"
@@ -35,7 +41,12 @@ def download_model(model_tag: str, model_path: str | Path):
     )
 
 
-def load_model(model_path: str | Path, device: str = "cpu") -> Dict:
+def load_model(
+    model_path: str | Path,
+    device: str = "cpu",
+    backend: str = "torch",
+    quantize: bool = False,
+) -> Dict:
     model_path = Path(model_path)
     torch_dtype = torch.float16 if "cuda" in device else torch.float32
 
@@ -47,14 +58,25 @@ def load_model(model_path: str | Path, device: str = "cpu") -> Dict:
     hface_path = fnames[0].parent
 
     # Load model and tokenizer
+    model_id = sinfer.model_fingerprint(fnames[0])
     tokenizer = AutoTokenizer.from_pretrained(hface_path, model_max_length=MAX_LENGTH)
-    model: BertForTokenClassification = AutoModelForTokenClassification.from_pretrained(
-        hface_path, device_map=device, torch_dtype=torch_dtype
-    )
-    model.eval()
-
-    # Create pipeline
-    pipe = pipeline(task="ner", model=model, tokenizer=tokenizer)
+    # The punctuation and NER models share one tokenizer and its encodings
+    encoder = sinfer.shared_encoder(tokenizer)
+    tokenizer = encoder.tokenizer
+    config = AutoConfig.from_pretrained(hface_path)
+    model: BertForTokenClassification | None = None
+    session = None
+    if backend == "onnx":
+        session = sort.load_session(
+            hface_path, name="punc", model_id=model_id, quantize=quantize
+        )
+    elif backend == "torch":
+        model = AutoModelForTokenClassification.from_pretrained(
+            hface_path, device_map=device, torch_dtype=torch_dtype
+        )
+        model.eval()
+    else:
+        raise ValueError(f"Unsupported backend: {backend}")
 
     # Load label mappings
     label2id_path = hface_path / "label2id.json"
@@ -67,20 +89,47 @@ def load_model(model_path: str | Path, device: str = "cpu") -> Dict:
 
     label2id = json.loads(label2id_path.read_text(encoding="utf-8"))
 
-    return {"model": model, "tokenizer": tokenizer, "pipe": pipe, "label2id": label2id}
+    # Model label table, indexed by label id
+    id2label = np.array(
+        [config.id2label[i] for i in range(config.num_labels)], dtype=object
+    )
+
+    # Label id -> punctuation string, for every (add_space, reduce) setting
+    punc_tables = {
+        (add_space, reduce): _build_punc_table(id2label, label2id, add_space, reduce)
+        for add_space in (True, False)
+        for reduce in (True, False)
+    }
+
+    return {
+        "task": "punc",
+        "model": model,
+        "session": session,
+        "config": config,
+        "tokenizer": tokenizer,
+        "encoder": encoder,
+        "label2id": label2id,
+        "id2label": id2label,
+        "punc_tables": punc_tables,
+        "o_id": config.label2id["O"],
+        "model_id": model_id,
+        "backend": f"{backend}-int8" if session and quantize else backend,
+    }
 
 
 def _align_predictions(
-    text: str, predictions: List[dict]
-) -> Tuple[List[str], List[str]]:
-    words = list(text)
-    labels = ["O" for _ in range(len(words))]
+    text: str, predictions: List[sinfer.Prediction], model_info: Dict
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the character positions followed by punctuation and their label ids."""
+    label_ids = np.full(len(text), model_info["o_id"])
 
-    for pred in predictions:
-        idx = pred["end"] - 1
-        labels[idx] = pred["entity"]
+    # Each token's label goes to its last character
+    if predictions:
+        _, ends, ids = np.array(predictions).T
+        label_ids[ends - 1] = ids
+    (positions,) = np.nonzero(label_ids != model_info["o_id"])
 
-    return words, labels
+    return positions, label_ids[positions]
 
 
 def _reduce_punc(text: str) -> str:
@@ -133,12 +182,32 @@ def _insert_space(s1: str, chars: str) -> str:
     return s2
 
 
-def predict_batch(
-    texts: List[str], model_info: Dict, add_space: bool = True, reduce: bool = False
-) -> List[str]:
-    pipe = model_info["pipe"]
-    label2id: dict = model_info["label2id"]
+def predict_raw(
+    texts: List[str],
+    model_info: Dict,
+    window: int = sconfig.WINDOW_LENGTH,
+    overlap: int = sconfig.WINDOW_OVERLAP,
+) -> List[List[sinfer.Prediction]]:
+    """Run the model on a batch of texts and return per-token predictions.
+
+    Texts longer than `window` characters are split into windows overlapping
+    by `overlap` characters and stitched back by character offset. Windows
+    are run in length-sorted buckets to keep padding to a minimum.
+    """
+    return sinfer.predict_windowed(
+        texts,
+        fn=partial(
+            sinfer.predict_bucketed,
+            fn=partial(sinfer.forward_tokens, model_info=model_info),
+        ),
+        window=min(window, MAX_LENGTH - 2),
+        overlap=overlap,
+    )
 
+
+def _build_punc_table(
+    id2label: np.ndarray, label2id: Dict[str, int], add_space: bool, reduce: bool
+) -> np.ndarray:
     # Create punctuation mapping from label2id
     label2punc = {f"B-{v}": k for k, v in label2id.items()}
     label2punc["O"] = ""
@@ -160,37 +229,124 @@ def predict_batch(
         label2punc = {k: _insert_space(v, special_puncs) for k, v in label2punc.items()}
         label2punc["O"] = ""
 
-    # Get predictions from model
-    predictions = pipe(texts)
-
-    # Process each text
+    return np.array([label2punc.get(label, "") for label in id2label], dtype=object)
+
+
+def _render(
+    text: str, positions: np.ndarray, label_ids: np.ndarray, table: np.ndarray, strip: bool
+) -> str:
+    # Join text slices and punctuation in one pass
+    pieces = []
+    prev = 0
+    for pos, punc in zip(positions.tolist(), table[label_ids].tolist()):
+        pieces.append(text[prev : pos + 1])
+        pieces.append(punc)
+        prev = pos + 1
+    pieces.append(text[prev:])
+    rendered = "".join(pieces)
+    return rendered.strip() if strip else rendered
+
+
+def render_styles(
+    texts: List[str],
+    predictions: List[List[sinfer.Prediction]],
+    model_info: Dict,
+    styles: List[Tuple[bool, bool]],
+    strip: bool = True,
+) -> List[List[str]]:
+    """Render each text once per (add_space, reduce) style from one set of predictions.
+
+    Without `strip`, leading and trailing whitespace such as line breaks is
+    kept, so the renderings of consecutive pieces of a text join up into the
+    rendering of the whole.
+    """
+    tables = [model_info["punc_tables"][style] for style in styles]
     results = []
     for text, text_predictions in zip(texts, predictions):
-        words, labels = _align_predictions(text, text_predictions)
+        positions, label_ids = _align_predictions(text, text_predictions, model_info)
+        results.append([_render(text, positions, label_ids, table, strip) for table in tables])
+    return results
 
-        # Build final text with punctuation
-        result = ""
-        for word, label in zip(words, labels):
-            result += word
-            punc = label2punc.get(label, "")
-            result += punc
 
-        result = result.strip()
-        results.append(result)
+def render_batch(
+    texts: List[str],
+    predictions: List[List[sinfer.Prediction]],
+    model_info: Dict,
+    add_space: bool = True,
+    reduce: bool = False,
+) -> List[str]:
+    rendered = render_styles(
+        texts=texts,
+        predictions=predictions,
+        model_info=model_info,
+        styles=[(add_space, reduce)],
+    )
+    return [result for (result,) in rendered]
 
-    return results
 
+def predict_batch(
+    texts: List[str], model_info: Dict, add_space: bool = True, reduce: bool = False
+) -> List[str]:
+    predictions = predict_raw(texts=texts, model_info=model_info)
+    return render_batch(
+        texts=texts,
+        predictions=predictions,
+        model_info=model_info,
+        add_space=add_space,
+        reduce=reduce,
+    )
 
-def remove_punc(s: str) -> str:
-    return "".join(c for c in s if unicodedata.category(c)[0] not in "PZ")
+
+def sentence_ends(
+    texts: List[str], predictions: List[List[sinfer.Prediction]], model_info: Dict
+) -> List[List[int]]:
+    """Character offsets after which the model ends a sentence ("。" or "?" once reduced)."""
+    table = model_info["punc_tables"][(False, True)]
+    results = []
+    for text, text_predictions in zip(texts, predictions):
+        positions, label_ids = _align_predictions(text, text_predictions, model_info)
+        marks = table[label_ids]
+        ends = [int(pos) + 1 for pos, mark in zip(positions, marks) if mark in ("。", "?")]
+        results.append(ends)
+    return results
 
 
-def main():
+def remove_punc(s: str) -> str:
+    return snormalize.remove_punc(s)
+
+
+def main(
+    input_path: Optional[Path] = None,
+    output_path: Optional[Path] = None,
+    workers: int = 1,
+    threads: int = 0,
+    chunk_size: int = 256,
+    output_format: str = "jsonl",
+    add_space: bool = True,
+    reduce: bool = False,
+):
     # Download model
     model_tag = MODEL_TAG
     model_path = MODEL_PATH
     download_model(model_tag=model_tag, model_path=model_path)
 
+    # Process a corpus file (TXT or JSONL) instead of the example below
+    if input_path:
+        if not output_path:
+            raise typer.BadParameter("--output-path is required with --input-path")
+        scorpus.run_corpus(
+            task="punc",
+            model_path=model_path,
+            input_path=input_path,
+            output_path=output_path,
+            workers=workers,
+            threads=threads,
+            chunk_size=chunk_size,
+            output_format=output_format,
+            options={"add_space": add_space, "reduce": reduce},
+        )
+        return
+
     # Load model
     device = "cpu"
     model_info = load_model(model_path=model_path, device=device)
@@ -228,4 +384,5 @@ if __name__ == "__main__":
     else:
         with logger.catch(onerror=lambda _: sys.exit(1)):
             # python -m tool.punc
+            # python -m tool.punc --input-path corpus.txt --output-path out.jsonl --workers 4
             typer.run(main)
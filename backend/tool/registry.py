@@ -0,0 +1,357 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.cache as scache
+import tool.config as sconfig
+import tool.loader as sloader
+import tool.metrics as smetrics
+import tool.ort as sort
+import tool.root as sroot
+from loguru import logger
+
+# Version served from each task's MODEL_PATH
+BASE_VERSION = "base"
+# Response header naming the model version that served a request
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+# Registries of all tasks; their loaded versions share MODEL_MEMORY_BUDGET_MB
+REGISTRIES: List["ModelRegistry"] = []
+
+
+class UnknownVersion(KeyError):
+    """Raised for a model version that was never registered."""
+
+
+def parse_versions(spec: str | None) -> Dict[str, Path]:
+    """Parse "name=path,name=path" into {name: path}."""
+    versions = {}
+    for item in filter(None, (spec or "").split(",")):
+        name, sep, path = item.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid model version {item!r}, expected name=path")
+        versions[name.strip()] = Path(path.strip())
+    return versions
+
+
+def configured_versions(base_path: str | Path, spec: str | None) -> Dict[str, Path]:
+    """The base version at `base_path` plus the versions listed in `spec`."""
+    return {BASE_VERSION: Path(base_path), **parse_versions(spec)}
+
+
+def version_name(task: str, version: str) -> str:
+    """Loader name of a model version, also its key for `sloader.preload`."""
+    return f"{task}@{version}"
+
+
+def model_path(path: str | Path) -> Path:
+    """Check a model path given over the API: it must lie under MODEL_DIR."""
+    resolved = Path(path).resolve()
+    if not resolved.is_relative_to(sroot.MODEL_DIR.resolve()):
+        raise ValueError(f"Model path must be under {sroot.MODEL_DIR}")
+    return resolved
+
+
+def model_bytes(model_info: Dict) -> int:
+    """Memory taken by a model's weights: its tensors, or its ONNX file."""
+    model = model_info.get("model")
+    if model is not None:
+        tensors = itertools.chain(model.parameters(), model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    quantize = model_info["backend"].endswith("-int8")
+    path = sort.onnx_path(model_info["task"], model_info["model_id"], quantize=quantize)
+    return path.stat().st_size if path.is_file() else 0
+
+
+class ModelVersion:
+    """One version of a task's model, with the batcher and result cache serving it."""
+
+    def __init__(self, task: str, version: str, path: Path):
+        self.task = task
+        self.version = version
+        self.path = path
+        self.loader: sloader.ModelLoader | None = None
+        self.model_info: Dict | None = None
+        self.batcher: sbatcher.MicroBatcher | None = None
+        self.cache: scache.ResultCache | None = None
+        self.size_bytes = 0
+        # Requests holding this version, and when the last one started or ended
+        self.in_flight = 0
+        self.last_used = 0.0
+        # Unloaded once the requests still holding it are done
+        self.retiring = False
+
+    @property
+    def name(self) -> str:
+        return version_name(self.task, self.version)
+
+    @property
+    def loaded(self) -> bool:
+        return self.model_info is not None
+
+    def status(self) -> Dict:
+        return {
+            "path": str(self.path),
+            "state": self.loader.state if self.loader else "unloaded",
+            "in_flight": self.in_flight,
+            "size_mb": round(self.size_bytes / 2**20, 1),
+            "error": self.loader.error if self.loader else None,
+        }
+
+
+class ModelRegistry:
+    """Versions of one task's model, loaded on first use and swapped without downtime.
+
+    Requests `acquire` a version (the default one unless they name another)
+    and `release` it when done; `use` does both around a block. The default
+    version loads at `start()` (on first use if `lazy`), the others on their
+    first request. Loaded versions of all tasks share MODEL_MEMORY_BUDGET_MB:
+    past it, the least recently used versions that no request holds are
+    unloaded, never a default one.
+
+    `set_default` loads and warms up the new version first, then switches to
+    it in one step. The old default keeps serving the requests that already
+    hold it and is unloaded when the last of them is done, so a rollout
+    never serves from a cold model or keeps two copies loaded for long.
+    """
+
+    def __init__(
+        self,
+        task: str,
+        versions: Dict[str, Path],
+        default: str,
+        load: Callable[[Path], Dict | None],
+        predict: Callable[..., List[Any]],
+        executor: ThreadPoolExecutor,
+        workers: int,
+        lazy: bool = False,
+        warmup: Callable[[Any], Any] | None = None,
+    ):
+        if default not in versions:
+            raise ValueError(f"Unknown default {task} model version: {default}")
+        self.task = task
+        self.versions = {name: ModelVersion(task, name, path) for name, path in versions.items()}
+        self.default = default
+        self.load = load
+        self.predict = predict
+        self.executor = executor
+        self.workers = workers
+        self.lazy = lazy
+        self.warmup = warmup
+        self._cleanups: set[asyncio.Task] = set()
+
+    @property
+    def current(self) -> ModelVersion:
+        """The default version."""
+        return self.versions[self.default]
+
+    @property
+    def loader(self) -> sloader.ModelLoader | None:
+        """Loader of the default version, for readiness checks."""
+        return self.current.loader
+
+    def start(self) -> None:
+        REGISTRIES.append(self)
+        smetrics.QUEUE_DEPTH.set_function(self.task, fn=self._queue_depth)
+        for priority, lane in sbatcher.LANES.items():
+            smetrics.QUEUED_TOKENS.set_function(
+                self.task, lane, fn=partial(self._queued_tokens, priority)
+            )
+        self._ensure_loader(self.current, lazy=self.lazy)
+
+    async def stop(self) -> None:
+        if self in REGISTRIES:
+            REGISTRIES.remove(self)
+        smetrics.QUEUE_DEPTH.set_function(self.task, fn=None)
+        for lane in sbatcher.LANES.values():
+            smetrics.QUEUED_TOKENS.set_function(self.task, lane, fn=None)
+        smetrics.register_cache(self.task, None)
+        for model in self.versions.values():
+            self._unload(model, force=True)
+        await asyncio.gather(*self._cleanups, return_exceptions=True)
+
+    def status(self) -> Dict:
+        return {
+            "default": self.default,
+            "versions": {name: model.status() for name, model in self.versions.items()},
+        }
+
+    def register(self, version: str, path: str | Path) -> None:
+        """Add a version, loaded on its first request.
+
+        A registered version can only be pointed at a new path while it is
+        not loaded (or failed to load).
+        """
+        model = self.versions.get(version)
+        if model and (model.in_flight or (model.loader and model.loader.state != "failed")):
+            raise ValueError(f"Model version {version} is in use")
+        self.versions[version] = ModelVersion(self.task, version, Path(path))
+        logger.info(f"Registered {version_name(self.task, version)} at {path}")
+
+    def peek(self, version: str | None = None) -> ModelVersion | None:
+        """A version (the default if None) without loading or holding it; None if unknown."""
+        return self.versions.get(version or self.default)
+
+    async def acquire(self, version: str | None = None) -> ModelVersion:
+        """Wait for a version (the default if None) to load and hold it for a request."""
+        version = version or self.default
+        model = self.versions.get(version)
+        if model is None:
+            raise UnknownVersion(version)
+        while True:
+            loader = self._ensure_loader(model, lazy=True)
+            await loader.get()
+            # Taken without awaiting after the check, so it cannot unload in between
+            if model.loader is loader and model.loaded:
+                model.in_flight += 1
+                model.last_used = time.monotonic()
+                return model
+            # Unloaded while waiting; load it again
+
+    def release(self, model: ModelVersion) -> None:
+        model.in_flight -= 1
+        model.last_used = time.monotonic()
+        if model.in_flight == 0:
+            if model.retiring:
+                self._unload(model)
+            else:
+                _evict()
+
+    @asynccontextmanager
+    async def use(self, version: str | None = None) -> AsyncIterator[ModelVersion]:
+        model = await self.acquire(version)
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    async def set_default(self, version: str) -> None:
+        """Switch the default to `version` once it is loaded; the old one drains, then unloads."""
+        # Load (and warm up) first, so no request waits for the new version
+        model = await self.acquire(version)
+        try:
+            old, self.default = self.current, version
+            model.retiring = False
+            smetrics.register_cache(self.task, model.cache)
+            if old is not model:
+                old.retiring = True
+                if not old.in_flight:
+                    self._unload(old)
+                logger.info(f"Default {self.task} model: {old.version} -> {version}")
+        finally:
+            self.release(model)
+
+    def _ensure_loader(self, model: ModelVersion, lazy: bool) -> sloader.ModelLoader:
+        if model.loader is not None and model.loader.state == "failed":
+            # Retry a failed load on the next request instead of failing until restart
+            model.loader = None
+        if model.loader is None:
+            loader = sloader.ModelLoader(
+                name=model.name,
+                load=partial(self.load, model.path),
+                warmup=self.warmup,
+                lazy=lazy,
+            )
+            loader.on_ready = partial(self._on_ready, model, loader)
+            model.loader = loader
+            loader.start()
+        return model.loader
+
+    def _on_ready(self, model: ModelVersion, loader: sloader.ModelLoader, model_info: Dict) -> None:
+        if model.loader is not loader:
+            # Unloaded while it was loading
+            return
+        model.batcher = sbatcher.MicroBatcher(
+            name=self.task,
+            fn=partial(self.predict, model_info=model_info),
+            executor=self.executor,
+            max_batch_size=sconfig.BATCH_MAX_SIZE,
+            max_wait_ms=sconfig.BATCH_MAX_WAIT_MS,
+            max_tokens=sconfig.BATCH_MAX_TOKENS,
+            max_concurrency=self.workers,
+            queue_limits=sadmission.QUEUE_LIMITS,
+            gauges=False,
+        )
+        model.batcher.start()
+        model.cache = scache.ResultCache(
+            namespace=f"{model_info['model_id']}|{model_info['backend']}|{self.task}|tokens",
+            max_entries=sconfig.CACHE_MAX_ENTRIES,
+            db_path=sconfig.CACHE_DB,
+        )
+        model.size_bytes = model_bytes(model_info)
+        model.model_info = model_info
+        model.last_used = time.monotonic()
+        if model is self.current:
+            smetrics.register_cache(self.task, model.cache)
+        logger.debug(f"{model.name} ready ({model.size_bytes / 2**20:.0f} MB)")
+        # Not this version: the requests waiting for it have yet to acquire it
+        _evict(keep=model)
+
+    def _unload(self, model: ModelVersion, force: bool = False) -> None:
+        """Drop a version now; its batcher and cache are closed in the background."""
+        if model.in_flight and not force:
+            return
+        loader, batcher, cache = model.loader, model.batcher, model.cache
+        model.loader = model.model_info = model.batcher = model.cache = None
+        model.size_bytes = 0
+        # A preloaded model would otherwise stay in memory after the unload
+        sloader.PRELOADED.pop(model.name, None)
+        model.retiring = False
+        if loader or batcher or cache:
+            task = asyncio.create_task(self._cleanup(model.name, loader, batcher, cache))
+            self._cleanups.add(task)
+            task.add_done_callback(self._cleanups.discard)
+
+    async def _cleanup(
+        self,
+        name: str,
+        loader: sloader.ModelLoader | None,
+        batcher: sbatcher.MicroBatcher | None,
+        cache: scache.ResultCache | None,
+    ) -> None:
+        if loader:
+            # A load still running in its thread cannot be interrupted
+            await loader.stop()
+        if cache:
+            await asyncio.to_thread(cache.close)
+        if batcher:
+            await batcher.stop()
+        logger.debug(f"{name} unloaded")
+
+    def _queue_depth(self) -> int:
+        return sum(m.batcher.queue_depth() for m in self.versions.values() if m.batcher)
+
+    def _queued_tokens(self, priority: int) -> int:
+        return sum(m.batcher.queued_tokens(priority) for m in self.versions.values() if m.batcher)
+
+
+def _evict(keep: ModelVersion | None = None) -> None:
+    """Unload idle non-default versions other than `keep`, least recently used first, down to the budget."""
+    budget = sconfig.MODEL_MEMORY_BUDGET_MB * 2**20
+    if not budget:
+        return
+    loaded = [
+        (registry, model)
+        for registry in REGISTRIES
+        for model in registry.versions.values()
+        if model.loaded
+    ]
+    total = sum(model.size_bytes for _, model in loaded)
+    idle = [
+        (registry, model)
+        for registry, model in loaded
+        if model is not registry.current and model is not keep and not model.in_flight
+    ]
+    for registry, model in sorted(idle, key=lambda item: item[1].last_used):
+        if total <= budget:
+            break
+        total -= model.size_bytes
+        logger.debug(f"Evicting {model.name} ({model.size_bytes / 2**20:.0f} MB)")
+        registry._unload(model)
@@ -0,0 +1,152 @@
+import gc
+import importlib
+import os
+import signal
+import socket
+import sys
+from importlib import reload
+from pathlib import Path
+from typing import Dict
+
+import tool.cedict as scedict
+import tool.config as sconfig
+import tool.loader as sloader
+import tool.ner as sner
+import tool.normalize as snormalize
+import tool.punc as spunc
+import tool.registry as sregistry
+import tool.root as sroot
+import torch
+import typer
+from loguru import logger
+from rich import pretty
+
+
+def _import_app():
+    # Import the app the way `fastapi run` does: as a package containing main.py
+    package_dir = Path(__file__).resolve().parents[1]
+    sys.path.insert(0, str(package_dir.parent))
+    return importlib.import_module(f"{package_dir.name}.main").app
+
+
+def _preload_models() -> None:
+    # Only the default model versions; the others load in the worker that needs them
+    for name, tool, spec, default in (
+        ("punc", spunc, sconfig.PUNC_MODEL_VERSIONS, sconfig.PUNC_MODEL_DEFAULT),
+        ("ner", sner, sconfig.NER_MODEL_VERSIONS, sconfig.NER_MODEL_DEFAULT),
+    ):
+        logger.info(f"Preloading {name} model {default}...")
+        model_info = tool.load_model(
+            model_path=sregistry.configured_versions(tool.MODEL_PATH, spec)[default],
+            device="cpu",
+            backend=sconfig.INFER_BACKEND,
+            quantize=sconfig.ONNX_QUANTIZE,
+        )
+        if model_info is None:
+            raise RuntimeError(f"No model files found for {name}")
+        sloader.preload(sregistry.version_name(name, default), model_info)
+    # The dictionary index is built here once rather than by every worker;
+    # its memory-mapped pages are shared like the weights
+    dictionary = scedict.load_dict(scedict.DICT_PATH)
+    if dictionary is not None:
+        sloader.preload("dict", dictionary)
+    # Likewise the normalization lookup tables
+    snormalize.tables()
+
+
+def _run_worker(app, sock: socket.socket, threads: int, log_level: str) -> None:
+    import uvicorn
+
+    # Split the cores between workers instead of each using all of them
+    torch.set_num_threads(threads)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket, threads: int, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, threads=threads, log_level=log_level)
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main(
+    host: str = "0.0.0.0",
+    port: int = 7807,
+    workers: int = 0,
+    threads: int = 0,
+    log_level: str = "info",
+):
+    """Serve the API from forked workers sharing one copy of the model weights.
+
+    The parent loads both models once and forks `workers` uvicorn processes
+    (default: one per core) onto a shared listening socket. The weights are
+    never written after loading, so the workers map the same physical pages
+    copy-on-write. Each worker gets `threads` torch threads (default: cores
+    divided by workers). Workers that die are replaced.
+    """
+    cores = os.cpu_count() or 1
+    workers = workers or cores
+    threads = threads or max(1, cores // workers)
+
+    # No forward pass may run in the parent: OpenMP thread pools do not survive fork
+    torch.set_num_threads(1)
+    app = _import_app()
+    _preload_models()
+    # Keep the collector from touching (and so copying) objects shared with workers
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    logger.info(f"Serving on {host}:{port} with {workers} workers x {threads} threads")
+    children: Dict[int, int] = {}
+    for index in range(workers):
+        children[_spawn(app, sock, threads=threads, log_level=log_level)] = index
+
+    stopping = False
+
+    def _stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+        children[_spawn(app, sock, threads=threads, log_level=log_level)] = index
+    sock.close()
+
+
+if __name__ == "__main__":
+    if hasattr(sys, "ps1"):
+        pretty.install()
+        reload(sroot)
+    else:
+        with logger.catch(onerror=lambda _: sys.exit(1)):
+            # FASTAPI_KEY=... python -m tool.serve --workers 8
+            typer.run(main)
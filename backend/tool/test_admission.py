@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+import tool.admission as sadmission
+import tool.batcher as sbatcher
+import tool.config as sconfig
+from fastapi import HTTPException
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(sadmission.time, "monotonic", clock)
+    return clock
+
+
+def _request(client: sadmission.Client | None = None):
+    return SimpleNamespace(state=SimpleNamespace(client=client))
+
+
+def test_token_bucket_refills_up_to_burst(clock):
+    bucket = sadmission.TokenBucket(rate=10, burst=100)
+    assert bucket.take(80) == 0
+    # 20 left: 30 more tokens take 1 s at 10 tokens/s
+    assert bucket.take(30) == pytest.approx(1.0)
+    clock.now += 1
+    assert bucket.take(30) == 0
+    clock.now += 1000
+    assert bucket.take(100) == 0
+    assert bucket.take(1) > 0
+
+
+def test_token_bucket_charges_large_costs_as_burst(clock):
+    bucket = sadmission.TokenBucket(rate=10, burst=100)
+    assert bucket.take(500) == 0
+    assert bucket.take(10) == pytest.approx(1.0)
+
+
+def test_rate_limiter_keeps_one_bucket_per_key(clock):
+    limiter = sadmission.RateLimiter(rate=10, burst=50)
+    assert limiter.take("a", 50) == 0
+    assert limiter.take("a", 10) > 0
+    assert limiter.take("b", 50) == 0
+    assert sadmission.RateLimiter(rate=0, burst=0).take("a", 10**9) == 0
+
+
+def test_admit_returns_the_client_priority(monkeypatch, clock):
+    monkeypatch.setattr(sadmission, "RATE_LIMITER", sadmission.RateLimiter(0, 0))
+    bulk = sadmission.Client(key_id="k", priority=sbatcher.PRIORITY_BULK)
+    assert sadmission.admit(_request(bulk), ["天地玄黃"]) == sbatcher.PRIORITY_BULK
+    assert sadmission.admit(_request(), ["天地玄黃"]) == sbatcher.PRIORITY_INTERACTIVE
+
+
+def test_admit_rejects_large_requests(monkeypatch, clock):
+    monkeypatch.setattr(sconfig, "MAX_REQUEST_TEXTS", 2)
+    monkeypatch.setattr(sconfig, "MAX_REQUEST_TOKENS", 20)
+    with pytest.raises(HTTPException) as e:
+        sadmission.admit(_request(), ["a", "b", "c"])
+    assert e.value.status_code == 413
+    with pytest.raises(HTTPException) as e:
+        sadmission.admit(_request(), ["a" * 30])
+    assert e.value.status_code == 413
+
+
+def test_admit_rate_limits_per_key(monkeypatch, clock):
+    monkeypatch.setattr(sadmission, "RATE_LIMITER", sadmission.RateLimiter(10, 20))
+    client = sadmission.Client(key_id="k")
+    sadmission.admit(_request(client), ["a" * 18])
+    with pytest.raises(HTTPException) as e:
+        sadmission.admit(_request(client), ["a" * 18])
+    assert e.value.status_code == 429
+    assert int(e.value.headers["Retry-After"]) >= 1
+    # Other keys have their own bucket
+    sadmission.admit(_request(sadmission.Client(key_id="other")), ["a" * 18])
+
+
+def test_require_admin():
+    sadmission.require_admin(_request(sadmission.Client(key_id="k", admin=True)))
+    for client in (None, sadmission.Client(key_id="k")):
+        with pytest.raises(HTTPException) as e:
+            sadmission.require_admin(_request(client))
+        assert e.value.status_code == 403
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+import tool.batcher as sbatcher
+
+
+class Model:
+    """Stand-in model that records its batches and can be held while busy."""
+
+    def __init__(self):
+        self.batches: List[List[str]] = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, texts: List[str]) -> List[str]:
+        self.release.wait(5)
+        self.batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def _batcher(model: Model, **kwargs) -> sbatcher.MicroBatcher:
+    options = dict(max_batch_size=8, max_wait_ms=5, max_tokens=1000, gauges=False)
+    return sbatcher.MicroBatcher(
+        name="test", fn=model, executor=ThreadPoolExecutor(1), **{**options, **kwargs}
+    )
+
+
+async def _while_busy(batcher: sbatcher.MicroBatcher, model: Model, coros):
+    # Keep the model busy with one text so the others queue up behind it
+    model.release.clear()
+    busy = asyncio.ensure_future(batcher.submit(["busy"]))
+    await asyncio.sleep(0.05)
+    tasks = []
+    for coro in coros:
+        tasks.append(asyncio.ensure_future(coro))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+    model.release.set()
+    return await busy, await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def test_concurrent_submits_share_a_batch():
+    async def run():
+        model = Model()
+        batcher = _batcher(model)
+        batcher.start()
+        try:
+            results = await asyncio.gather(*(batcher.submit([t]) for t in "abcd"))
+        finally:
+            await batcher.stop()
+        return model, results
+
+    model, results = asyncio.run(run())
+    assert results == [["A"], ["B"], ["C"], ["D"]]
+    assert model.batches == [["a", "b", "c", "d"]]
+
+
+def test_interactive_texts_go_first():
+    async def run():
+        model = Model()
+        batcher = _batcher(model, max_batch_size=2)
+        batcher.start()
+        try:
+            await _while_busy(
+                batcher,
+                model,
+                [
+                    batcher.submit(["bulk1", "bulk2"], priority=sbatcher.PRIORITY_BULK),
+                    batcher.submit(["live1", "live2"], priority=sbatcher.PRIORITY_INTERACTIVE),
+                ],
+            )
+        finally:
+            await batcher.stop()
+        return model
+
+    model = asyncio.run(run())
+    assert model.batches == [["busy"], ["live1", "live2"], ["bulk1", "bulk2"]]
+
+
+def test_bounded_submit_raises_queue_full():
+    limits = {sbatcher.PRIORITY_INTERACTIVE: 100, sbatcher.PRIORITY_BULK: 20}
+
+    async def run():
+        model = Model()
+        batcher = _batcher(model, queue_limits=limits, cost=len)
+        batcher.start()
+        try:
+            _, results = await _while_busy(
+                batcher,
+                model,
+                [
+                    batcher.submit(["x" * 15], priority=sbatcher.PRIORITY_BULK, bounded=True),
+                    # Over the bulk lane's room, but not the interactive one's
+                    batcher.submit(["y" * 15], priority=sbatcher.PRIORITY_BULK, bounded=True),
+                    batcher.submit(["z" * 15], bounded=True),
+                    # Unbounded submits always queue
+                    batcher.submit(["w" * 50], priority=sbatcher.PRIORITY_BULK),
+                ],
+            )
+        finally:
+            await batcher.stop()
+        return results
+
+    first, rejected, interactive, unbounded = asyncio.run(run())
+    assert first == ["X" * 15]
+    assert isinstance(rejected, sbatcher.QueueFull)
+    assert rejected.lane == "bulk" and rejected.retry_after >= 1
+    assert interactive == ["Z" * 15]
+    assert unbounded == ["W" * 50]
+
+
+def test_failed_batch_fails_its_callers():
+    def broken(texts: List[str]) -> List[str]:
+        raise RuntimeError("out of memory")
+
+    async def run():
+        batcher = sbatcher.MicroBatcher(
+            name="test",
+            fn=broken,
+            executor=ThreadPoolExecutor(1),
+            max_batch_size=8,
+            max_wait_ms=1,
+            max_tokens=1000,
+            gauges=False,
+        )
+        batcher.start()
+        try:
+            await batcher.submit(["a"])
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        asyncio.run(run())
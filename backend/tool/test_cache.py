@@ -0,0 +1,88 @@
+import asyncio
+from typing import List
+
+import tool.cache as scache
+
+
+class Model:
+    def __init__(self):
+        self.calls: List[List[str]] = []
+
+    async def __call__(self, texts: List[str]) -> List[str]:
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.01)
+        return [text.upper() for text in texts]
+
+
+def test_concurrent_requests_are_coalesced():
+    async def run():
+        cache = scache.ResultCache(namespace="test", max_entries=100)
+        model = Model()
+        results = await asyncio.gather(
+            cache.get_or_compute(["a", "b"], model),
+            cache.get_or_compute(["b", "c", "a"], model),
+            cache.get_or_compute(["c", "c"], model),
+        )
+        return cache, model, results
+
+    cache, model, results = asyncio.run(run())
+    assert results == [["A", "B"], ["B", "C", "A"], ["C", "C"]]
+    # Each text computed once, by the first request that needed it
+    assert sorted(t for call in model.calls for t in call) == ["a", "b", "c"]
+    assert cache.stats()["misses"] == 3
+
+
+def test_hits_and_lru_eviction():
+    async def run():
+        cache = scache.ResultCache(namespace="test", max_entries=2)
+        model = Model()
+        await cache.get_or_compute(["a", "b"], model)
+        await cache.get_or_compute(["a"], model)
+        await cache.get_or_compute(["c"], model)
+        # "b" was least recently used
+        await cache.get_or_compute(["a", "b"], model)
+        return cache, model
+
+    cache, model = asyncio.run(run())
+    assert model.calls == [["a", "b"], ["c"], ["b"]]
+    assert cache.stats()["hits"] == 2
+
+
+def test_failed_compute_is_not_cached():
+    async def run():
+        cache = scache.ResultCache(namespace="test", max_entries=10)
+
+        async def broken(texts: List[str]) -> List[str]:
+            raise RuntimeError("model down")
+
+        failed = await asyncio.gather(
+            cache.get_or_compute(["a"], broken),
+            cache.get_or_compute(["a"], broken),
+            return_exceptions=True,
+        )
+        return failed, await cache.get_or_compute(["a"], Model())
+
+    failed, retried = asyncio.run(run())
+    assert all(isinstance(e, RuntimeError) for e in failed)
+    assert retried == ["A"]
+
+
+def test_results_persist_in_sqlite(tmp_path):
+    db_path = tmp_path / "cache.sqlite"
+
+    async def run(namespace: str, texts: List[str]):
+        cache = scache.ResultCache(namespace=namespace, max_entries=10, db_path=db_path)
+        model = Model()
+        try:
+            return await cache.get_or_compute(texts, model), model, cache.stats()
+        finally:
+            await asyncio.to_thread(cache.close)
+
+    asyncio.run(run("test", ["a", "b"]))
+    results, model, stats = asyncio.run(run("test", ["a", "b", "c"]))
+    assert results == ["A", "B", "C"]
+    assert model.calls == [["c"]]
+    assert stats["disk_hits"] == 2
+    # Another namespace, e.g. another model, does not see them
+    _, model, _ = asyncio.run(run("other", ["a"]))
+    assert model.calls == [["a"]]
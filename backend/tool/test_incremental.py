@@ -0,0 +1,82 @@
+import asyncio
+from typing import Dict, List
+
+import numpy as np
+import tool.incremental as sincremental
+import tool.punc as spunc
+
+# Punctuation model stand-in: "。" after every "也"
+MODEL_INFO = {"o_id": 0, "punc_tables": {(True, False): np.array(["", "。"], dtype=object)}}
+
+
+async def _predict(texts: List[str]) -> List[List[tuple]]:
+    return [[(i, i + 1, 1) for i, ch in enumerate(text) if ch == "也"] for text in texts]
+
+
+def _build(strip: bool):
+    def build(texts: List[str], predictions: List[List[tuple]]) -> List[Dict]:
+        rendered = spunc.render_styles(texts, predictions, MODEL_INFO, [(True, False)], strip=strip)
+        return [{"punctuated": result} for (result,) in rendered]
+
+    return build
+
+
+def _update(document: sincremental.Document, text: str, base_revision: int | None):
+    segments = sincremental.with_context(
+        text, sincremental.split_segments(text, sincremental.SegmentMode.LINE, 16), 4
+    )
+    return asyncio.run(document.update(text, segments, _predict, base_revision))
+
+
+def _apply(segments: List[Dict], changes: List[Dict]) -> None:
+    for change in reversed(changes):
+        segments[change["start"] : change["start"] + change["delete"]] = change["insert"]
+
+
+def test_split_segments_cover_text():
+    text = "學而時習之\n不亦說乎\n" + "有朋自遠方來" * 20
+    segments = sincremental.split_segments(text, sincremental.SegmentMode.LINE, 16)
+    assert segments[0] == (0, 6)
+    assert all(a_end == b_start for (_, a_end), (b_start, _) in zip(segments, segments[1:]))
+    assert segments[-1][1] == len(text)
+    assert all(end - start <= 16 for start, end in segments)
+
+
+def test_merge_matches_whole_text():
+    text = "大學之道也\n在明明德也\n在親民也\n"
+    update = _update(sincremental.Document(model=None), text, None)
+    merged = sincremental.merge(update.segments, update.predictions)
+    assert merged == asyncio.run(_predict([text]))[0]
+
+
+def test_unchanged_segments_are_reused():
+    document = sincremental.Document(model=None)
+    lines = [f"第{i}行也\n" for i in range(10)]
+    first = _update(document, "".join(lines), None)
+    lines[5] = "改了也\n"
+    second = _update(document, "".join(lines), first.revision)
+    assert first.reinferred == 10
+    # The edited line and the neighbours whose context it is part of
+    assert second.reinferred <= 3
+    assert second.base_revision == first.revision
+
+
+def test_applied_delta_equals_merged_result():
+    document = sincremental.Document(model=None)
+    texts = [
+        "\n天命之謂性也\n率性之謂道也\n\n修道之謂教也\n",
+        "\n天命之謂性也\n率性之謂道也\n\n修道之謂教也\n道也者\n",
+        "天命之謂性也\n率性之謂道也改\n\n修道之謂教也\n道也者\n",
+    ]
+    segments, revision = [], None
+    for text in texts:
+        update = _update(document, text, revision)
+        delta = sincremental.build_response("d", text, update, delta=True, build=_build(False))
+        merged = sincremental.build_response("d", text, update, delta=False, build=_build(True))
+        assert delta["base_revision"] == revision
+        _apply(segments, delta["changes"])
+
+        joined = "".join(segment["punctuated"] for segment in segments)
+        assert "\n" in joined
+        assert joined.strip() == merged["result"]["punctuated"]
+        revision = update.revision
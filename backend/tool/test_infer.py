@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+import tool.infer as sinfer
+from transformers import BertTokenizerFast
+
+
+def _echo(text: str, suffix: str = "") -> Tuple[str, str]:
+    return text + suffix, threading.current_thread().name
+
+
+def _label_every_char(texts: List[str]) -> List[List[sinfer.Prediction]]:
+    # Stand-in token predictor: one token per character, labelled by its code point
+    return [[(i, i + 1, ord(c)) for i, c in enumerate(text)] for text in texts]
+
+
+def test_run_in_executor_runs_in_the_pool():
+    executor = sinfer.create_executor("test", max_workers=2)
+
+    async def run():
+        calls = (sinfer.run_in_executor(executor, _echo, str(i), suffix="!") for i in range(4))
+        return await asyncio.gather(*calls)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert [text for text, _ in results] == ["0!", "1!", "2!", "3!"]
+    assert all(name.startswith("infer-test") for _, name in results)
+
+
+def test_run_in_executor_keeps_the_loop_free():
+    executor = sinfer.create_executor("test", max_workers=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(sinfer.run_in_executor(executor, release.wait, 5))
+        # Other tasks run while the call blocks its thread
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        release.set()
+        return await blocked
+
+    try:
+        assert asyncio.run(run()) is True
+    finally:
+        executor.shutdown()
+
+
+def test_create_executor_has_at_least_one_worker():
+    executor = sinfer.create_executor("test", max_workers=0)
+    try:
+        assert executor.submit(sum, [1, 2]).result() == 3
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.parametrize("length", [0, 1, 9, 10, 11, 25, 100])
+def test_split_windows_cover_range(length):
+    spans = sinfer.split_windows(length, window=10, overlap=4)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == length
+    assert all(end - start <= 10 for start, end in spans)
+    # Consecutive windows overlap by at least `overlap`
+    assert all(a_end - b_start >= 4 for (_, a_end), (b_start, _) in zip(spans, spans[1:]))
+
+
+def test_split_windows_rejects_bad_overlap():
+    with pytest.raises(ValueError):
+        sinfer.split_windows(10, window=4, overlap=4)
+
+
+def test_owned_ranges_partition_range():
+    spans = sinfer.split_windows(57, window=10, overlap=4)
+    owned = sinfer._owned_ranges(spans)
+    assert owned[0][0] == 0 and owned[-1][1] == 57
+    assert all(a_end == b_start for (_, a_end), (b_start, _) in zip(owned, owned[1:]))
+    # Each window owns only positions inside it
+    assert all(start <= lo <= hi <= end for (start, end), (lo, hi) in zip(spans, owned))
+
+
+def test_predict_windowed_matches_whole_text():
+    texts = ["", "短", "天地玄黃宇宙洪荒" * 7, "日月盈昃辰宿列張" * 3]
+    windowed = sinfer.predict_windowed(texts, _label_every_char, window=10, overlap=4)
+    assert windowed == _label_every_char(texts)
+
+
+def test_predict_bucketed_keeps_order():
+    texts = ["a" * n for n in (30, 1, 12, 5, 30, 2)]
+    seen = []
+
+    def fn(batch: List[str]) -> List[int]:
+        seen.append(len(batch))
+        return [len(text) for text in batch]
+
+    assert sinfer.predict_bucketed(texts, fn, max_tokens=40, max_batch_size=3) == [
+        len(text) for text in texts
+    ]
+    assert len(seen) > 1 and max(seen) <= 3
+
+
+def test_bucketize_respects_token_budget():
+    lengths = [5, 50, 7, 6, 48, 200]
+    buckets = sinfer.bucketize(lengths, max_tokens=100, max_batch_size=8)
+    assert sorted(i for bucket in buckets for i in bucket) == list(range(len(lengths)))
+    for bucket in buckets:
+        longest = max(lengths[i] for i in bucket)
+        assert len(bucket) == 1 or longest * len(bucket) <= 100
+
+
+def test_map_chunks_yields_in_order():
+    async def fn(texts: List[str]) -> List[str]:
+        # Later chunks finish first
+        await asyncio.sleep(0.01 / len(texts[0]))
+        return [text.upper() for text in texts]
+
+    async def run():
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        return [r async for chunk, results in sinfer.map_chunks(texts, 2, fn) for r in results]
+
+    assert asyncio.run(run()) == ["A", "BB", "CCC", "DDDD", "EEEEE"]
+
+
+@pytest.fixture
+def encoder(tmp_path) -> sinfer.Encoder:
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "，", "。", "?", "un", "##able", "12"]
+    vocab += list("天地玄黃宇宙洪荒")
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab) + "\n", encoding="utf-8")
+    tokenizer = BertTokenizerFast(str(tmp_path / "vocab.txt"), model_max_length=32)
+    return sinfer.Encoder(tokenizer)
+
+
+@pytest.mark.parametrize(
+    "base, text",
+    [
+        ("天地玄黃宇宙洪荒", "天地玄黃，宇宙洪荒。"),
+        ("天地 unable 12玄黃", "天地 unable? 12，玄黃。"),
+        ("天地unable玄黃", "。天地 unable ，玄黃"),
+    ],
+)
+def test_derived_encodings_match_the_tokenizer(encoder, base, text):
+    encoder.encode([base])
+    assert encoder.derive([text], [base]) == 1
+    (expected,) = encoder._tokenize([text])
+    for derived, row in zip(encoder._memory[text], expected, strict=True):
+        np.testing.assert_array_equal(derived, row)
+
+
+def test_marks_inside_a_word_are_not_derived(encoder):
+    encoder.encode(["天地 unable"])
+    # A mark splitting "unable", and an inserted character that is not a mark
+    assert encoder.derive(["天地 un，able", "天地 unable天"], ["天地 unable"] * 2) == 0
+    # Without a cached base there is nothing to derive from
+    assert encoder.derive(["玄黃。"], ["玄黃"]) == 0
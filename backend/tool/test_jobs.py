@@ -0,0 +1,105 @@
+import asyncio
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import tool.jobs as sjobs
+
+
+async def _upper(texts: List[str], options: Dict) -> List[Dict]:
+    return [{"text": text.upper()} for text in texts]
+
+
+def _outputs(store: sjobs.JobStore, job_id: str) -> List[str]:
+    lines = store.output_path(job_id).read_text(encoding="utf-8").splitlines()
+    return [json.loads(line)["text"] for line in lines]
+
+
+async def _run(store: sjobs.JobStore, seconds: float = 0.2) -> None:
+    runner = sjobs.JobRunner(store, {"test": _upper}, chunk_size=2)
+    runner.start()
+    await asyncio.sleep(seconds)
+    await runner.stop()
+
+
+def test_job_runs_to_completion(tmp_path):
+    store = sjobs.JobStore(tmp_path)
+    meta = store.create("test", {}, ["a", "b", "c"])
+    runner = sjobs.JobRunner(store, {"test": _upper}, chunk_size=2)
+
+    async def run():
+        runner.start()
+        runner.enqueue(meta["id"])
+        await asyncio.sleep(0.2)
+        await runner.stop()
+
+    asyncio.run(run())
+    meta = store.get(meta["id"])
+    assert meta["status"] == "done" and meta["done"] == 3
+    assert _outputs(store, meta["id"]) == ["A", "B", "C"]
+
+
+def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    store = sjobs.JobStore(tmp_path)
+    meta = store.create("test", {}, ["a", "b", "c", "d", "e"])
+    # Checkpoint after the first chunk, then output written past it before a crash
+    with store.input_path(meta["id"]).open("rb") as f:
+        f.readline(), f.readline()
+        input_offset = f.tell()
+    store.output_path(meta["id"]).write_text('{"text": "A"}\n{"text": "B"}\n{"text": "C"}\n')
+    meta.update(status="running", done=2, input_offset=input_offset, output_offset=28)
+    store.save(meta)
+
+    asyncio.run(_run(store))
+    assert store.get(meta["id"])["status"] == "done"
+    assert _outputs(store, meta["id"]) == ["A", "B", "C", "D", "E"]
+
+
+def test_resume_skips_jobs_locked_by_a_live_process(tmp_path):
+    store = sjobs.JobStore(tmp_path)
+    held = store.create("test", {}, ["a"])
+    free = store.create("test", {}, ["b"])
+    for meta in (held, free):
+        meta["status"] = "running"
+        store.save(meta)
+
+    # Another worker holds the lock of the job it is running
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys, tool.jobs as j; lock = j.JobStore(sys.argv[1]).lock(sys.argv[2]);"
+            "print(lock is not None, flush=True); sys.stdin.read()",
+            str(tmp_path),
+            held["id"],
+        ],
+        cwd=Path(__file__).parents[1],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "True"
+        asyncio.run(_run(store))
+        assert store.get(held["id"])["status"] == "running"
+        assert store.get(free["id"])["status"] == "done"
+    finally:
+        holder.communicate("")
+
+    # Its lock is released once the worker is gone, so the job is resumed
+    asyncio.run(_run(store))
+    assert store.get(held["id"])["status"] == "done"
+    assert _outputs(store, held["id"]) == ["A"]
+
+
+def test_lock_is_exclusive_and_missing_jobs_have_none(tmp_path):
+    store = sjobs.JobStore(tmp_path)
+    meta = store.create("test", {}, ["a"])
+    lock = store.lock(meta["id"])
+    assert lock is not None
+    assert store.lock(meta["id"]) is None
+    lock.close()
+    store.delete(meta["id"])
+    assert store.lock(meta["id"]) is None
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from typing import List
+
+import httpx
+import pytest
+import tool.mt as smt
+
+
+def vllm(pieces: List[str], status_code: int = 200) -> httpx.MockTransport:
+    """Stand-in for vLLM's OpenAI-compatible server, answering with `pieces`."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v1/chat/completions"
+        if status_code != 200:
+            return httpx.Response(status_code, json={"error": "unavailable"})
+        body = json.loads(request.content)
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": "".join(pieces)}
+            return httpx.Response(200, json={"choices": [{"message": message}]})
+        events = [
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            *({"choices": [{"delta": {"content": piece}}]} for piece in pieces),
+        ]
+        lines = [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+        return httpx.Response(200, content="".join(lines).encode("utf-8"))
+
+    return httpx.MockTransport(handler)
+
+
+def _client(transport: httpx.MockTransport) -> smt.MTClient:
+    return smt.MTClient(base_url="http://vllm/v1", api_key=None, transport=transport)
+
+
+async def _collect(client: smt.MTClient, text: str) -> List[str]:
+    try:
+        return [piece async for piece in client.translate_stream(text, "Hanja", "Korean")]
+    finally:
+        await client.close()
+
+
+def test_split_sentences_keeps_every_character():
+    text = "學而時習之，不亦說乎？有朋自遠方來。\n\n不亦樂乎"
+    sentences = smt.split_sentences(text)
+    assert "".join(sentences) == text
+    assert sentences == ["學而時習之，不亦說乎？", "有朋自遠方來。\n\n", "不亦樂乎"]
+    assert smt.separator(sentences[1]) == "\n\n"
+    assert smt.separator(sentences[0]) == " "
+
+
+def test_translate_strips_whitespace():
+    client = _client(vllm([" 배우고 ", "익히니\n"]))
+    assert asyncio.run(client.translate("學而時習之", "Hanja", "Korean")) == "배우고 익히니"
+    asyncio.run(client.close())
+
+
+def test_translate_stream_joins_up_to_translate():
+    pieces = ["\n ", "배우고", " ", "", "때때로 ", "익히니", " \n"]
+    streamed = asyncio.run(_collect(_client(vllm(pieces)), "學而時習之"))
+    assert len(streamed) > 1
+    assert "".join(streamed) == "".join(pieces).strip()
+
+
+def test_translate_stream_raises_on_server_error():
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_collect(_client(vllm([], status_code=503)), "學而時習之"))
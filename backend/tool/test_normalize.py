@@ -0,0 +1,40 @@
+import random
+
+import pytest
+import tool.normalize as snormalize
+
+# Characters that exercise NFKC composition, compatibility forms and folding
+ALPHABET = (
+    "天地玄黃宇宙洪荒，。！？、：；「」『』（）"
+    "ＡＢＣａｂｃ１２３　 \t\n"
+    "éä각가각ᄀ"
+    "“”‘’–—−・ㆍ∙"
+    "①㈜㎏ﬁ⁵"
+    "\U00020000\U00030000"
+)
+
+
+def _random_texts(seed: int, count: int):
+    rng = random.Random(seed)
+    return ["".join(rng.choices(ALPHABET, k=rng.randint(0, 40))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_normalize_matches_reference(seed):
+    for text in _random_texts(seed, 200):
+        assert snormalize.normalize(text) == snormalize.fold(text), repr(text)
+
+
+def test_normalize_batch_matches_normalize():
+    texts = _random_texts(10, 100) + ["", "  ", "\n"]
+    assert snormalize.normalize_batch(texts) == [snormalize.normalize(t) for t in texts]
+    # Texts containing the separator fall back to one call per text
+    texts.append("a\x00b")
+    assert snormalize.normalize_batch(texts) == [snormalize.normalize(t) for t in texts]
+
+
+def test_remove_punc_matches_per_char():
+    texts = _random_texts(20, 100)
+    expected = [snormalize._remove_punc_per_char(t) for t in texts]
+    assert [snormalize.remove_punc(t) for t in texts] == expected
+    assert snormalize.remove_punc_batch(texts) == expected
@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+import tool.config as sconfig
+import tool.loader as sloader
+import tool.registry as sregistry
+import torch
+
+VERSIONS = {"base": Path("base"), "v2": Path("v2"), "v3": Path("v3")}
+# Versions whose next load fails, e.g. while their files are still being copied
+FAILING = set()
+
+
+def _load(path: Path) -> Dict:
+    if path.name in FAILING:
+        FAILING.discard(path.name)
+        raise RuntimeError("no weights")
+    # About 1 MB of weights
+    model = torch.nn.Linear(511, 512)
+    return {"model": model, "model_id": path.name, "backend": "torch", "version": path.name}
+
+
+def _predict(texts: List[str], model_info: Dict) -> List[str]:
+    return [f"{model_info['version']}:{text}" for text in texts]
+
+
+def _registry(**kwargs) -> sregistry.ModelRegistry:
+    options = dict(
+        task="test",
+        versions=VERSIONS,
+        default="base",
+        load=_load,
+        predict=_predict,
+        executor=ThreadPoolExecutor(1),
+        workers=1,
+        lazy=True,
+    )
+    return sregistry.ModelRegistry(**{**options, **kwargs})
+
+
+async def _predict_with(registry: sregistry.ModelRegistry, version: str | None = None) -> str:
+    async with registry.use(version) as model:
+        (result,) = await model.batcher.submit(["text"])
+        return result
+
+
+def _loaded(registry: sregistry.ModelRegistry) -> List[str]:
+    return sorted(name for name, model in registry.versions.items() if model.loaded)
+
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setattr(sconfig, "MODEL_MEMORY_BUDGET_MB", 0)
+    monkeypatch.setattr(sconfig, "CACHE_DB", None)
+
+
+def test_versions_load_on_first_use():
+    async def run():
+        registry = _registry()
+        registry.start()
+        try:
+            assert _loaded(registry) == []
+            results = [await _predict_with(registry), await _predict_with(registry, "v2")]
+            with pytest.raises(sregistry.UnknownVersion):
+                await registry.acquire("nope")
+            return results, _loaded(registry)
+        finally:
+            await registry.stop()
+
+    results, loaded = asyncio.run(run())
+    assert results == ["base:text", "v2:text"]
+    assert loaded == ["base", "v2"]
+
+
+def test_hot_swap_drains_the_old_default():
+    async def run():
+        registry = _registry()
+        registry.start()
+        try:
+            old = await registry.acquire()
+            sloader.preload(old.name, old.model_info)
+            await registry.set_default("v2")
+            # Still held by a request, so still loaded
+            assert registry.default == "v2" and old.loaded and old.retiring
+            assert await _predict_with(registry) == "v2:text"
+            assert (await old.batcher.submit(["text"])) == ["base:text"]
+            registry.release(old)
+            return old, _loaded(registry)
+        finally:
+            await registry.stop()
+
+    old, loaded = asyncio.run(run())
+    assert not old.loaded and loaded == ["v2"]
+    # Unloading drops the preloaded copy too, so its memory is freed
+    assert old.name not in sloader.PRELOADED
+
+
+def test_idle_versions_are_evicted_over_budget(monkeypatch):
+    monkeypatch.setattr(sconfig, "MODEL_MEMORY_BUDGET_MB", 2)
+
+    async def run():
+        registry = _registry()
+        registry.start()
+        try:
+            for version in ("base", "v2", "v3"):
+                await _predict_with(registry, version)
+            after_v3 = _loaded(registry)
+            await _predict_with(registry, "v2")
+            return after_v3, _loaded(registry)
+        finally:
+            await registry.stop()
+
+    after_v3, after_v2 = asyncio.run(run())
+    # The default version is never evicted; the least recently used other one is
+    assert after_v3 == ["base", "v3"]
+    assert after_v2 == ["base", "v2"]
+
+
+def test_failed_load_is_retried():
+    async def run():
+        registry = _registry()
+        registry.start()
+        try:
+            FAILING.add("v2")
+            with pytest.raises(RuntimeError):
+                await registry.acquire("v2")
+            assert registry.versions["v2"].status()["state"] == "failed"
+            return await _predict_with(registry, "v2")
+        finally:
+            await registry.stop()
+
+    assert asyncio.run(run()) == "v2:text"
@@ -1,14 +1,27 @@
 # dev
-pip install "fastapi[standard]"
+pip install -r requirements.txt msgpack
 openssl rand -hex 16
 FASTAPI_KEY=FASTAPI_KEY python -m fastapi dev src/demo_api/main.py --host 0.0.0.0 --port 7807
 
 # api
 (tmux kill-session -t demo_api || true) &&
     tmux new-session -d -s demo_api &&
-    tmux send-keys -t demo_api "FASTAPI_KEY=FASTAPI_KEY conda run --no-capture-output -n mmm python -m fastapi run src/demo_api/main.py --port 7807" C-m
+    tmux send-keys -t demo_api "FASTAPI_KEY=FASTAPI_KEY VLLM_API_KEY=VLLM_KEY conda run --no-capture-output -n mmm python -m fastapi run src/demo_api/main.py --port 7807" C-m
+
+# api (pre-fork workers sharing one copy of the model weights)
+(tmux kill-session -t demo_api || true) &&
+    tmux new-session -d -s demo_api &&
+    tmux send-keys -t demo_api "FASTAPI_KEY=FASTAPI_KEY FASTAPI_ADMIN_KEY=ADMIN_KEY VLLM_API_KEY=VLLM_KEY PYTHONPATH=src/demo_api conda run --no-capture-output -n mmm python -m tool.serve --port 7807" C-m
 
 # vllm
 (tmux kill-session -t demo_vllm || true) &&
     tmux new-session -d -s demo_vllm &&
     tmux send-keys -t demo_vllm "CUDA_VISIBLE_DEVICES=7 conda run --no-capture-output -n vllm vllm serve seyoungsong/Qwen2-7B-HanjaMT-AJD-KLC-AWQ --api-key VLLM_KEY --device cuda --dtype float16 --gpu-memory-utilization 0.8 --host 0.0.0.0 --kv-cache-dtype auto --load-format auto --max-model-len 2048 --port 7806 --seed 42 --quantization awq" C-m
+
+# dictionary (downloads CC-CEDICT and builds its index)
+PYTHONPATH=src/demo_api python -m tool.cedict
+
+# model versions: register one, then make it the default without downtime (admin key only)
+# (per process; with tool.serve, set PUNC_MODEL_VERSIONS and PUNC_MODEL_DEFAULT instead)
+curl -X PUT localhost:7807/punc/models/v2 -H "X-API-Key: ADMIN_KEY" -H "Content-Type: application/json" -d '{"path": "src/demo_api/model/punc-v2"}'
+curl -X POST localhost:7807/punc/models/default -H "X-API-Key: ADMIN_KEY" -H "Content-Type: application/json" -d '{"version": "v2"}'
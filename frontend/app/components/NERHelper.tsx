@@ -20,6 +20,10 @@ export interface NERResult {
   original: string
   xml: string
   iob: string
+  // Present when requested with return_tokens
+  tokens?: string[]
+  token_ids?: number[]
+  offsets?: [number, number][]
 }
 
 export interface TextStats {
@@ -1,21 +1,34 @@
 // app/routes/api.hanzi.ts
 import type { ActionFunctionArgs } from "@remix-run/node"
-import hanzi from "hanzi"
-
-// Initialize hanzi once when the server starts
-if (!hanzi.ifComponentExists("一")) {
-  hanzi.start()
-}
 
 interface DefinitionsMap {
   [key: string]: string[] | undefined
 }
 
+interface DictEntry {
+  traditional: string
+  simplified: string
+  pinyin: string
+  definitions: string[]
+}
+
+interface LookupResult {
+  entries: Record<string, DictEntry[]>
+}
+
 export const action = async ({ request }: ActionFunctionArgs) => {
   if (request.method !== "POST") {
     return Response.json({ error: "Method not allowed" }, { status: 405 })
   }
 
+  const FASTAPI_URL = process.env.FASTAPI_URL
+  const API_KEY = process.env.FASTAPI_KEY
+
+  if (!API_KEY) {
+    console.error("API key not configured")
+    return Response.json({ error: "Server configuration error" }, { status: 500 })
+  }
+
   try {
     const { text } = await request.json()
 
@@ -23,14 +36,29 @@ export const action = async ({ request }: ActionFunctionArgs) => {
       return Response.json({ error: "Text is required" }, { status: 400 })
     }
 
+    // The backend looks the characters up in its memory-mapped dictionary
+    const response = await fetch(`${FASTAPI_URL}/dict/lookup`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-API-Key": API_KEY,
+      },
+      body: JSON.stringify({ texts: [text], words: false }),
+      signal: request.signal,
+    })
+
+    if (!response.ok) {
+      throw new Error(`Failed to look up characters: ${response.statusText}`)
+    }
+
+    const { results } = (await response.json()) as { results: LookupResult[] }
+    const { entries } = results[0]
+
     const characters = text.split("")
     const definitionsMap: DefinitionsMap = characters.reduce(
       (acc: DefinitionsMap, char: string) => {
         if (!/\s/.test(char)) {
-          const definitions = hanzi
-            .definitionLookup(char)
-            ?.map((def: { definition: string }) => def.definition)
-          acc[char] = definitions
+          acc[char] = entries[char]?.map((entry) => entry.definitions.join("/"))
         }
         return acc
       },
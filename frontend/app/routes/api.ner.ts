@@ -6,6 +6,9 @@ interface NERResult {
   original: string
   xml: string
   iob: string
+  tokens?: string[]
+  token_ids?: number[]
+  offsets?: [number, number][]
 }
 
 interface NERResponse {
@@ -14,6 +17,17 @@ interface NERResponse {
 
 interface NERRequest {
   texts: string[]
+  return_tokens?: boolean
+}
+
+interface NERIncrementalRequest {
+  document_id: string
+  text: string
+  return_tokens?: boolean
+}
+
+interface NERIncrementalResponse {
+  result: NERResult
 }
 
 export const action: ActionFunction = async ({ request }) => {
@@ -37,25 +51,46 @@ export const action: ActionFunction = async ({ request }) => {
 
   try {
     const body = await request.json()
-    const { text } = body
+    const { text, returnTokens, documentId } = body
 
-    // Make request to Python backend
-    const response = await fetch(`${FASTAPI_URL}/ner/predict`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        "X-API-Key": API_KEY,
-      },
-      body: JSON.stringify({
-        texts: [text], // API expects an array of texts
-      } as NERRequest),
-    })
+    // Make request to Python backend; with a document id it re-runs the
+    // model only on the lines changed since the document's last request
+    const response = documentId
+      ? await fetch(`${FASTAPI_URL}/ner/predict/incremental`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-API-Key": API_KEY,
+          },
+          body: JSON.stringify({
+            document_id: documentId,
+            text,
+            return_tokens: Boolean(returnTokens),
+          } as NERIncrementalRequest),
+        })
+      : await fetch(`${FASTAPI_URL}/ner/predict`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-API-Key": API_KEY,
+          },
+          body: JSON.stringify({
+            texts: [text], // API expects an array of texts
+            return_tokens: Boolean(returnTokens),
+          } as NERRequest),
+        })
 
     if (!response.ok) {
       throw new Error(`Failed to process text: ${response.statusText}`)
     }
 
-    const apiResponse: NERResponse = await response.json()
+    const apiResponse: NERResponse = documentId
+      ? {
+          results: [
+            ((await response.json()) as NERIncrementalResponse).result,
+          ],
+        }
+      : await response.json()
 
     // Handle the case where no results were returned
     if (!apiResponse.results?.[0]) {
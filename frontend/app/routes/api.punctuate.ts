@@ -12,6 +12,10 @@ interface PuncResponse {
   results: PuncResult[]
 }
 
+interface PuncIncrementalResponse {
+  result: PuncResult
+}
+
 export const action: ActionFunction = async ({ request }) => {
   if (request.method !== "POST") {
     return new Response("Method not allowed", { status: 405 })
@@ -33,7 +37,7 @@ export const action: ActionFunction = async ({ request }) => {
 
   try {
     const body = await request.json()
-    const { text, style } = body
+    const { text, style, documentId } = body
 
     // Convert style names to match API expectations
     const styleMap: { [key: string]: string } = {
@@ -42,24 +46,44 @@ export const action: ActionFunction = async ({ request }) => {
       comprehensive: "Comprehensive",
     }
 
-    // Make request to Python backend
-    const response = await fetch(`${FASTAPI_URL}/punc/predict`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        "X-API-Key": API_KEY,
-      },
-      body: JSON.stringify({
-        texts: [text], // API expects an array of texts
-        style: styleMap[style] || "Comprehensive",
-      }),
-    })
+    // Make request to Python backend; with a document id it re-runs the
+    // model only on the lines changed since the document's last request
+    const response = documentId
+      ? await fetch(`${FASTAPI_URL}/punc/predict/incremental`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-API-Key": API_KEY,
+          },
+          body: JSON.stringify({
+            document_id: documentId,
+            text,
+            style: styleMap[style] || "Comprehensive",
+          }),
+        })
+      : await fetch(`${FASTAPI_URL}/punc/predict`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-API-Key": API_KEY,
+          },
+          body: JSON.stringify({
+            texts: [text], // API expects an array of texts
+            style: styleMap[style] || "Comprehensive",
+          }),
+        })
 
     if (!response.ok) {
       throw new Error(`Failed to process text: ${response.statusText}`)
     }
 
-    const apiResponse: PuncResponse = await response.json()
+    const apiResponse: PuncResponse = documentId
+      ? {
+          results: [
+            ((await response.json()) as PuncIncrementalResponse).result,
+          ],
+        }
+      : await response.json()
 
     // Handle the case where no results were returned
     if (!apiResponse.results?.[0]) {
@@ -6,6 +6,11 @@ interface TokenizeResponse {
   text: string
   tokens: string[]
   token_ids: number[]
+  offsets: [number, number][]
+}
+
+interface TokenizeBatchResponse {
+  results: TokenizeResponse[]
 }
 
 export async function action({ request }: ActionFunctionArgs) {
@@ -26,7 +31,7 @@ export async function action({ request }: ActionFunctionArgs) {
 
   try {
     const body = await request.json()
-    const { text, taskType } = body
+    const { text, texts, taskType } = body
 
     if (!taskType || !["NER", "PR"].includes(taskType)) {
       return Response.json(
@@ -35,6 +40,31 @@ export async function action({ request }: ActionFunctionArgs) {
       )
     }
 
+    // Several texts are tokenized in one batch request
+    if (Array.isArray(texts)) {
+      const batchEndpoint =
+        taskType === "NER" ? "ner/tokenize/batch" : "punc/tokenize/batch"
+      const response = await fetch(`${FASTAPI_URL}/${batchEndpoint}`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-API-Key": API_KEY,
+        },
+        body: JSON.stringify({
+          texts: texts.map(t => (typeof t === "string" ? t : "")),
+          add_special_tokens: true,
+        }),
+      })
+
+      if (!response.ok) {
+        throw new Error(`Failed to tokenize texts: ${response.statusText}`)
+      }
+
+      const apiResponse: TokenizeBatchResponse = await response.json()
+
+      return Response.json({ taskType, results: apiResponse.results })
+    }
+
     // Return 0 for non-string text
     if (!text || typeof text !== "string" || text.trim().length === 0) {
       return Response.json({
@@ -40,6 +40,11 @@ const NamedEntityRecognition = () => {
   const [userAnnotations, setUserAnnotations] = useState<StyledEntity[]>([])
   const [isProcessing, setIsProcessing] = useState(false)
   const [isLoading, setIsLoading] = useState(false)
+  // Identifies this document to the backend, which then re-runs the model
+  // only on the parts of the text changed since the last request
+  const [documentId] = useState(
+    () => Math.random().toString(36).slice(2) + Date.now().toString(36),
+  )
   const [stats, setStats] = useState<Stats>({
     source: DEFAULT_STATS,
     model: DEFAULT_STATS,
@@ -116,7 +121,10 @@ const NamedEntityRecognition = () => {
     setSearchParams({}, { replace: true })
   }, [])
 
-  const updateTextStats = async (text: string, section: keyof Stats) => {
+  const updateTextStats = async (
+    text: string,
+    sections: (keyof Stats)[],
+  ) => {
     try {
       const response = await fetch("/api/tokenize", {
         method: "POST",
@@ -127,15 +135,17 @@ const NamedEntityRecognition = () => {
       if (!response.ok) throw new Error("Failed to count tokens")
 
       const data: TokenizeResponse = await response.json()
+      const textStats = {
+        chars: text.length,
+        tokenCount: data.token_ids.length,
+        tokens: data.tokens,
+        token_ids: data.token_ids,
+      }
 
+      // Sections showing the same text share one tokenization
       setStats(prev => ({
         ...prev,
-        [section]: {
-          chars: text.length,
-          tokenCount: data.token_ids.length,
-          tokens: data.tokens,
-          token_ids: data.token_ids,
-        },
+        ...Object.fromEntries(sections.map(section => [section, textStats])),
       }))
     } catch (error) {
       console.error("Token counting error:", error)
@@ -161,25 +171,14 @@ const NamedEntityRecognition = () => {
 
     setIsProcessing(true)
     try {
-      // First get the tokens
-      const tokenResponse = await fetch("/api/tokenize", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text: textToUse, taskType: "NER" }),
-      })
-
-      if (!tokenResponse.ok) throw new Error("Failed to tokenize text")
-
-      const tokenData: TokenizeResponse = await tokenResponse.json()
-
-      // Then process NER
+      // Process NER; the tokens come back with the result
       const response = await fetch("/api/ner", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           text: textToUse,
-          tokens: tokenData.tokens,
-          token_ids: tokenData.token_ids,
+          returnTokens: true,
+          documentId,
         }),
       })
 
@@ -188,6 +187,10 @@ const NamedEntityRecognition = () => {
       const data = await response.json()
       const result: NERResult = data.result
       const iobTags = result.iob.split(",")
+      const tokenData = {
+        tokens: result.tokens ?? [],
+        token_ids: result.token_ids ?? [],
+      }
 
       const newAnnotations = parseIOBToAnnotations(textToUse, iobTags)
       const styledAnnotations = newAnnotations.map(applyEntityStyles)
@@ -225,13 +228,15 @@ const NamedEntityRecognition = () => {
 
   // Update stats when text changes
   useEffect(() => {
-    if (sourceText.trim()) updateTextStats(sourceText, "source")
+    if (sourceText.trim()) updateTextStats(sourceText, ["source"])
   }, [sourceText])
 
   // Update stats when annotations change
   useEffect(() => {
-    if (modelAnnotations.length) updateTextStats(sourceText, "model")
-    if (userAnnotations.length) updateTextStats(sourceText, "user")
+    const sections: (keyof Stats)[] = []
+    if (modelAnnotations.length) sections.push("model")
+    if (userAnnotations.length) sections.push("user")
+    if (sections.length) updateTextStats(sourceText, sections)
   }, [modelAnnotations, userAnnotations])
 
   const sendToPage = (page: "translation" | "punc") => {
@@ -45,11 +45,13 @@ const DEFAULT_STATS: TextStats = {
   token_ids: [],
 }
 
-interface TokenizeResponse {
+interface TokenizeBatchResponse {
   taskType: string
-  text: string
-  tokens: string[]
-  token_ids: number[]
+  results: {
+    text: string
+    tokens: string[]
+    token_ids: number[]
+  }[]
 }
 
 const isPunctuationOrSpace = (char: string) =>
@@ -71,6 +73,11 @@ const PunctuationRestoration = () => {
   const [isProcessing, setIsProcessing] = useState(false)
   const [isLoading, setIsLoading] = useState(false)
   const [shouldNormalize, setShouldNormalize] = useState(true)
+  // Identifies this document to the backend, which then re-runs the model
+  // only on the parts of the text changed since the last request
+  const [documentId] = useState(
+    () => Math.random().toString(36).slice(2) + Date.now().toString(36),
+  )
   const [stats, setStats] = useState<Stats>({
     source: DEFAULT_STATS,
     model: DEFAULT_STATS,
@@ -197,26 +204,37 @@ const PunctuationRestoration = () => {
     navigate(url)
   }
 
-  const updateTextStats = async (text: string, section: keyof Stats) => {
+  const updateTextStats = async (
+    sectionTexts: [keyof Stats, string][],
+  ) => {
     try {
+      // All sections in one batched tokenize request
       const response = await fetch("/api/tokenize", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text, taskType: "PR" }),
+        body: JSON.stringify({
+          texts: sectionTexts.map(([, text]) => text),
+          taskType: "PR",
+        }),
       })
 
       if (!response.ok) throw new Error("Failed to count tokens")
 
-      const data: TokenizeResponse = await response.json()
+      const data: TokenizeBatchResponse = await response.json()
 
       setStats(prev => ({
         ...prev,
-        [section]: {
-          chars: text.length,
-          tokenCount: data.token_ids.length,
-          tokens: data.tokens,
-          token_ids: data.token_ids,
-        },
+        ...Object.fromEntries(
+          sectionTexts.map(([section, text], i) => [
+            section,
+            {
+              chars: text.length,
+              tokenCount: data.results[i].token_ids.length,
+              tokens: data.results[i].tokens,
+              token_ids: data.results[i].token_ids,
+            },
+          ]),
+        ),
       }))
     } catch (error) {
       console.error("Token counting error:", error)
@@ -229,9 +247,13 @@ const PunctuationRestoration = () => {
   }
 
   useEffect(() => {
-    if (sourceText.trim()) updateTextStats(sourceText, "source")
-    if (modelOutput.trim()) updateTextStats(modelOutput, "model")
-    if (userEditOutput.trim()) updateTextStats(userEditOutput, "user")
+    const sectionTexts: [keyof Stats, string][] = [
+      ["source", sourceText],
+      ["model", modelOutput],
+      ["user", userEditOutput],
+    ]
+    const nonEmpty = sectionTexts.filter(([, text]) => text.trim())
+    if (nonEmpty.length) updateTextStats(nonEmpty)
   }, [sourceText, modelOutput, userEditOutput])
 
   const removePunctuation = () => {
@@ -280,7 +302,7 @@ const PunctuationRestoration = () => {
       const response = await fetch("/api/punctuate", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ text: normalizedText, style }),
+        body: JSON.stringify({ text: normalizedText, style, documentId }),
       })
 
       if (!response.ok) throw new Error("Failed to process text")